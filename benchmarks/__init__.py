@@ -0,0 +1 @@
+"""Offline benchmark suite: synthetic tweet shards, timed runs, JSON results."""
@@ -0,0 +1,84 @@
+"""Compare benchmark results between runs, or report scaling within one run.
+
+    python -m benchmarks.compare OLD.json NEW.json [--threshold 1.15]
+    python -m benchmarks.compare NEW.json --scaling
+
+With two files, prints new/old wall-time and peak-memory ratios per
+case/size/param and exits with status 1 when any wall time grew by more than
+the threshold (so it can gate a CI job). --scaling fits wall time ~ rows^k per
+case on a log-log scale: k near 1 is linear, clearly above 1 means the stage
+will not survive the full month.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+KEY = ["case", "param", "rows"]
+
+
+def load_results(path: Path) -> tuple[dict, pd.DataFrame]:
+    with Path(path).open("r", encoding="utf-8") as f:
+        report = json.load(f)
+    results = pd.DataFrame(report["results"])
+    results["param"] = results["param"].fillna("").astype(str)
+    return report["meta"], results
+
+
+def compare(old: pd.DataFrame, new: pd.DataFrame, threshold: float = 1.15) -> pd.DataFrame:
+    """Cases present in both runs with wall/memory ratios (new / old) and a regression flag."""
+    merged = old.merge(new, on=KEY, suffixes=("_old", "_new"))
+    merged["wall_ratio"] = merged["wall_s_new"] / merged["wall_s_old"]
+    merged["mem_ratio"] = merged["peak_mb_new"] / merged["peak_mb_old"]
+    merged["regression"] = merged["wall_ratio"] > threshold
+    return merged[KEY + ["wall_s_old", "wall_s_new", "wall_ratio", "mem_ratio", "regression"]]
+
+
+def scaling(results: pd.DataFrame) -> pd.DataFrame:
+    """Log-log slope of wall time against rows per case/param (needs at least two sizes)."""
+    rows = []
+    for (case, param), group in results.groupby(["case", "param"], sort=False):
+        group = group[group["wall_s"] > 0]
+        if group["rows"].nunique() < 2:
+            continue
+        slope = np.polyfit(np.log(group["rows"]), np.log(group["wall_s"]), 1)[0]
+        largest = group.loc[group["rows"].idxmax()]
+        rows.append((case, param, slope, int(largest["rows"]), largest["rows_per_s"]))
+    return pd.DataFrame(rows, columns=["case", "param", "exponent", "max_rows", "rows_per_s_at_max"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare benchmark result files.")
+    parser.add_argument("files", type=Path, nargs="+", help="OLD.json NEW.json, or one file with --scaling")
+    parser.add_argument("--threshold", type=float, default=1.15, help="Wall-time ratio counted as a regression")
+    parser.add_argument("--scaling", action="store_true", help="Report log-log scaling exponents of the last file")
+    args = parser.parse_args()
+
+    with pd.option_context("display.width", 160, "display.max_rows", None, "display.float_format", "{:.3f}".format):
+        if args.scaling:
+            meta, results = load_results(args.files[-1])
+            print(f"Scaling for {meta.get('commit')} ({meta.get('timestamp')}):")
+            print(scaling(results).to_string(index=False))
+            if len(args.files) == 1:
+                return
+        if len(args.files) != 2:
+            parser.error("pass exactly two result files to compare")
+
+        old_meta, old = load_results(args.files[0])
+        new_meta, new = load_results(args.files[1])
+        print(f"{old_meta.get('commit')} -> {new_meta.get('commit')}")
+        table = compare(old, new, args.threshold)
+        print(table.to_string(index=False))
+        regressions = table[table["regression"]]
+        if len(regressions):
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.2f}x")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
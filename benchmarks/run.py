@@ -0,0 +1,345 @@
+"""Time and memory benchmarks of the pipeline stages on synthetic corpora.
+
+Everything runs offline: corpora come from benchmarks.synthetic (cached under
+benchmarks/data/), the sentence encoder and the synonym LLM are replaced by
+deterministic stubs. Each case is timed best-of-N on every corpus size (and
+keyword-list length where it applies); peak Python allocations are measured
+in a separate traced run so tracemalloc does not skew the timings. Memory of
+worker processes (filter_csv_directory, eda_summarize) is not included.
+
+    python -m benchmarks.run                          # 10k, 100k, 1M rows
+    python -m benchmarks.run --sizes 10000 5000000 --cases filter_ expand_
+    python -m benchmarks.compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+
+Results are written as JSON (git commit, environment and one record per
+case/size/param) so runs from different commits can be compared.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import SUBJECTS, VOCAB_SIZE, vocabulary, write_corpus
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+KEYWORD_COUNTS = (1, 10, 100)
+DATA_DIR = Path(__file__).parent / "data"
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+@dataclass
+class Result:
+    case: str
+    rows: int
+    param: str
+    wall_s: float
+    cpu_s: float
+    rows_per_s: float
+    peak_mb: float | None
+    rows_out: int | None
+    repeats: int
+
+
+@dataclass
+class Corpus:
+    rows: int
+    shard_dir: Path
+    df: pd.DataFrame
+
+
+def keyword_list(n: int) -> list[str]:
+    """n keywords: the planted subjects first, then mid-frequency vocabulary words."""
+    vocab = vocabulary(VOCAB_SIZE)
+    return (list(SUBJECTS) + list(vocab[500:500 + n]))[:n]
+
+
+class StubEncoder:
+    """Deterministic SentenceTransformer stand-in (CRC32-hashed bag of words, 384 dims)."""
+
+    dim = 384
+
+    def encode(self, texts, batch_size=64, normalize_embeddings=True, convert_to_numpy=True, **kwargs):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in text.split():
+                out[i, zlib.crc32(token.encode("utf-8")) % self.dim] += 1.0
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+
+class StubSynonymBackend:
+    """Synonym backend that answers instantly with made-up variants."""
+
+    model = "stub"
+    prompt = ""
+
+    def fetch(self, word: str) -> list[str]:
+        return [f"{word}s", f"{word}ing", f"{word}-related"]
+
+
+# ---------------------------------------------------------------------------
+# Cases: each takes (corpus, param) and returns the number of output rows
+# (or None); params are the keyword-list lengths for keyword cases.
+# ---------------------------------------------------------------------------
+
+def _fresh(corpus: Corpus) -> pd.DataFrame:
+    """Shallow copy, so per-DataFrame caches (normalized text) start cold in every timed run."""
+    return corpus.df.copy(deep=False)
+
+
+def _normalize_text(corpus: Corpus, _):
+    from stage1_subject_filtering.preprocess import normalize_text
+
+    return len(corpus.df["text"].map(normalize_text))
+
+
+def _normalize_series(corpus: Corpus, _):
+    from stage1_subject_filtering.preprocess import normalize_series
+
+    return len(normalize_series(corpus.df["text"]))
+
+
+def _keyword_only(corpus: Corpus, _):
+    from stage1_subject_filtering.subject_keyword_filtering import filter_subject_keyword_only
+
+    return len(filter_subject_keyword_only(_fresh(corpus), "immigration"))
+
+
+def _keywords_list(corpus: Corpus, n_keywords):
+    from stage1_subject_filtering.subject_keyword_list_filtering import filter_subject_keywords_list
+
+    return len(filter_subject_keywords_list(_fresh(corpus), keyword_list(n_keywords)))
+
+
+def _keywords_list_boundary(corpus: Corpus, n_keywords):
+    from stage1_subject_filtering.subject_keyword_list_filtering import filter_subject_keywords_list
+
+    return len(filter_subject_keywords_list(_fresh(corpus), keyword_list(n_keywords), word_boundary=True))
+
+
+def _shard_filtering(corpus: Corpus, n_keywords):
+    from stage1_subject_filtering.shard_filtering import filter_csv_directory
+
+    with tempfile.TemporaryDirectory() as tmp:
+        summary = filter_csv_directory(corpus.shard_dir, Path(tmp) / "out.csv", keyword_list(n_keywords))
+    return int(summary["rows_out"].sum())
+
+
+def _expand(ranking: str):
+    def case(corpus: Corpus, _):
+        from stage1_subject_filtering.cooccurence_keyword_filtering import expand_subject_keywords_frequency
+
+        return len(expand_subject_keywords_frequency(_fresh(corpus), "immigration", ranking=ranking))
+
+    return case
+
+
+def _llm_expansion(corpus: Corpus, n_keywords):
+    from stage1_subject_filtering import llm_expansion
+
+    llm_expansion.set_backend(StubSynonymBackend())
+    return len(llm_expansion.get_synonyms_many(keyword_list(n_keywords), use_cache=False))
+
+
+def _jsd(corpus: Corpus, _):
+    """Topic distribution divergence between sources, per day (bertopic_jsd's last stage)."""
+    from divergence import count_tensor, pairwise_divergence
+
+    rng = np.random.default_rng(0)
+    n = corpus.rows
+    ranks = np.arange(1, 201)
+    topics = rng.choice(np.arange(-1, 199), size=n, p=(1 / ranks) / (1 / ranks).sum())
+    doc_topics = pd.DataFrame({
+        "day": rng.integers(1, 32, n),
+        "source": rng.choice(["Twitter", "NYT", "Guardian", "LA Times"], n, p=[0.85, 0.05, 0.05, 0.05]),
+        "topic": topics,
+    })
+    counts, *_ = count_tensor(doc_topics)
+    return int(np.isfinite(pairwise_divergence(counts)).sum())
+
+
+def _eda_summarize(corpus: Corpus, _):
+    from eda_2011_12 import summarize
+
+    summarize(corpus.shard_dir, cache_dir=None)
+    return None
+
+
+def _dedup(corpus: Corpus, _):
+    from dedup import collapse_duplicates
+
+    return collapse_duplicates(corpus.df["text"].tolist()).n_groups
+
+
+def _embedding_store(corpus: Corpus, _):
+    """Cold encode through EmbeddingStore with the stub encoder, then a fully cached re-encode."""
+    from embedding_cache import EmbeddingStore
+
+    texts = corpus.df["text"].tolist()
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EmbeddingStore(root=Path(tmp), encoder=StubEncoder())
+        store.encode(texts)
+        return len(store.encode(texts))
+
+
+CASES: dict[str, tuple[Callable, tuple]] = {
+    "normalize_text": (_normalize_text, (None,)),
+    "normalize_series": (_normalize_series, (None,)),
+    "filter_subject_keyword_only": (_keyword_only, (None,)),
+    "filter_subject_keywords_list": (_keywords_list, KEYWORD_COUNTS),
+    "filter_subject_keywords_list_word_boundary": (_keywords_list_boundary, KEYWORD_COUNTS),
+    "filter_csv_directory": (_shard_filtering, KEYWORD_COUNTS),
+    "expand_count": (_expand("count"), (None,)),
+    "expand_llr": (_expand("llr"), (None,)),
+    "llm_expansion_stub": (_llm_expansion, KEYWORD_COUNTS),
+    "jsd": (_jsd, (None,)),
+    "eda_summarize": (_eda_summarize, (None,)),
+    "dedup": (_dedup, (None,)),
+    "embedding_store_stub": (_embedding_store, (None,)),
+}
+# Quadratic or encoder-bound cases are skipped above this size unless asked for by name.
+MAX_ROWS = {"dedup": 1_000_000, "embedding_store_stub": 1_000_000}
+
+
+def load_corpus(rows: int, seed: int = 0) -> Corpus:
+    """Synthetic corpus of rows tweets as daily CSV shards plus the in-memory frame."""
+    shard_dir = DATA_DIR / f"rows_{rows}_seed_{seed}"
+    paths = write_corpus(shard_dir, rows, seed=seed)
+    df = pd.concat((pd.read_csv(p, keep_default_na=False) for p in paths), ignore_index=True)
+    df["text"] = df["Text"]
+    return Corpus(rows=rows, shard_dir=shard_dir, df=df)
+
+
+def measure(func: Callable[[], int | None], repeats: int = 3, memory: bool = True):
+    """(best wall s, cpu s of that run, peak traced MB or None, rows out)."""
+    best = None
+    rows_out = None
+    for _ in range(repeats):
+        gc.collect()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        rows_out = func()
+        timing = (time.perf_counter() - wall, time.process_time() - cpu)
+        if best is None or timing[0] < best[0]:
+            best = timing
+    peak_mb = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return best[0], best[1], peak_mb, rows_out
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        )
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() + ("-dirty" if dirty else "")
+
+
+def run(sizes, case_names, repeats: int = 3, memory: bool = True, seed: int = 0, forced=()) -> dict:
+    """Run case_names on every size; MAX_ROWS caps are lifted for the cases in forced."""
+    commit = git_commit()
+    meta = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "repeats": repeats,
+        "seed": seed,
+    }
+    results = []
+    for rows in sizes:
+        start = time.perf_counter()
+        corpus = load_corpus(rows, seed)
+        keyword_list(max(KEYWORD_COUNTS))  # build the vocabulary outside the timed runs
+        print(f"\n{rows:,} rows ({time.perf_counter() - start:.1f}s to load)")
+        for name in case_names:
+            func, params = CASES[name]
+            if rows > MAX_ROWS.get(name, rows) and name not in forced:
+                continue
+            for param in params:
+                wall, cpu, peak, rows_out = measure(lambda: func(corpus, param), repeats, memory)
+                result = Result(
+                    case=name,
+                    rows=rows,
+                    param="" if param is None else str(param),
+                    wall_s=round(wall, 6),
+                    cpu_s=round(cpu, 6),
+                    rows_per_s=round(rows / wall, 1) if wall > 0 else float("inf"),
+                    peak_mb=None if peak is None else round(peak, 2),
+                    rows_out=rows_out,
+                    repeats=repeats,
+                )
+                results.append(asdict(result))
+                label = f"{name}[{param}]" if param is not None else name
+                mem = f"{peak:9.1f} MB" if peak is not None else ""
+                print(f"  {label:<50} {wall:9.3f}s {rows / wall:>12,.0f} rows/s {mem}")
+        del corpus
+    return {"meta": meta, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic tweet corpora.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Corpus sizes in rows")
+    parser.add_argument(
+        "--cases", nargs="+", default=None,
+        help=f"Case names or prefixes (default: all). Available: {', '.join(CASES)}",
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced run for peak allocations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="Results JSON (default: benchmarks/results/<commit>.json)")
+    args = parser.parse_args()
+
+    forced = set()
+    if args.cases:
+        names = [n for n in CASES if any(n == c or n.startswith(c) for c in args.cases)]
+        unknown = [c for c in args.cases if not any(n == c or n.startswith(c) for n in CASES)]
+        if unknown:
+            parser.error(f"unknown cases: {', '.join(unknown)}")
+        forced = {c for c in args.cases if c in CASES}
+    else:
+        names = list(CASES)
+
+    report = run(sorted(args.sizes), names, args.repeats, not args.no_memory, args.seed, forced)
+    output = args.output or RESULTS_DIR / f"{report['meta']['commit'] or 'nocommit'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"\nWrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Deterministic synthetic tweet shards in the 2011-12-csv layout.
+
+Texts draw words from a Zipf-distributed vocabulary (so frequent words look
+like real stopwords), with log-normal lengths capped at 140 characters,
+hashtags, @mentions, "RT @user:" retweets of earlier tweets and a skewed
+country mix including Twitter spellings ("Brasil", "United States"). The
+same seed always gives the same shard.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+COUNTRIES = [
+    ("", 0.55),
+    ("United States", 0.15),
+    ("Brasil", 0.07),
+    ("Indonesia", 0.05),
+    ("United Kingdom", 0.04),
+    ("Japan", 0.03),
+    ("Malaysia", 0.02),
+    ("The Netherlands", 0.02),
+    ("Mexico", 0.02),
+    ("Spain", 0.02),
+    ("Turkey", 0.015),
+    ("Canada", 0.015),
+    ("France", 0.01),
+]
+
+# Subject words planted at known rates so filters have something to find.
+SUBJECTS = {
+    "immigration": 0.004,
+    "climate change": 0.002,
+    "obama": 0.01,
+    "ice": 0.003,
+}
+
+VOCAB_SIZE = 50_000
+RETWEET_RATE = 0.25
+HASHTAG_RATE = 0.15
+MENTION_RATE = 0.2
+ROWS_PER_DAY = 250_000
+
+
+# Head of the Zipf ranking, so stopword filtering has real work to do.
+COMMON_WORDS = (
+    "the i to a you and is in it my of for me on that so this be just with lol "
+    "at have your not are all was get like do but now go love what up day can "
+    "no we im when good know if out one it's got u out today about new people"
+).split()
+
+
+@lru_cache(maxsize=4)
+def vocabulary(size: int, seed: int = 12345) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    lengths = np.clip(rng.poisson(5, size), 2, 12)
+    words = dict.fromkeys(COMMON_WORDS)
+    words.update(dict.fromkeys("".join(rng.choice(letters, n)) for n in lengths))
+    return np.array(list(words))
+
+
+def generate_texts(n_rows: int, seed: int = 0) -> list[str]:
+    rng = np.random.default_rng(seed)
+    vocab = vocabulary(VOCAB_SIZE)
+    ranks = np.arange(1, len(vocab) + 1)
+    weights = 1.0 / ranks ** 1.1
+    weights /= weights.sum()
+
+    n_words = np.clip(rng.lognormal(2.3, 0.5, n_rows).astype(int), 1, 30)
+    words = vocab[rng.choice(len(vocab), size=int(n_words.sum()), p=weights)]
+    offsets = np.concatenate([[0], np.cumsum(n_words)])
+
+    subject_draws = {s: rng.random(n_rows) < rate for s, rate in SUBJECTS.items()}
+    hashtag = rng.random(n_rows) < HASHTAG_RATE
+    mention = rng.random(n_rows) < MENTION_RATE
+    retweet = rng.random(n_rows) < RETWEET_RATE
+    users = rng.integers(0, 5_000, n_rows)
+
+    texts: list[str] = []
+    for i in range(n_rows):
+        if retweet[i] and texts:
+            source = texts[int(rng.integers(max(0, len(texts) - 10_000), len(texts)))]
+            texts.append(f"RT @user{users[i]}: {source}"[:140])
+            continue
+        tokens = list(words[offsets[i]:offsets[i + 1]])
+        for subject, hit in subject_draws.items():
+            if hit[i]:
+                tokens.insert(int(rng.integers(0, len(tokens) + 1)), subject)
+        if mention[i]:
+            tokens.insert(0, f"@user{users[i]}")
+        if hashtag[i]:
+            tokens.append("#" + tokens[int(rng.integers(0, len(tokens)))].lstrip("@#").replace(" ", ""))
+        text = " ".join(tokens)
+        texts.append(text[:140].rsplit(" ", 1)[0] if len(text) > 140 else text)
+    return texts
+
+
+def generate_shard(n_rows: int, seed: int = 0, id_start: int = 0) -> pd.DataFrame:
+    """One day of tweets with the Text, Origin, id, country columns."""
+    rng = np.random.default_rng(seed + 1)
+    names, probs = zip(*COUNTRIES)
+    probs = np.asarray(probs) / np.sum(probs)
+    return pd.DataFrame({
+        "Text": generate_texts(n_rows, seed),
+        "Origin": "Twitter",
+        "id": np.arange(id_start, id_start + n_rows, dtype=np.int64),
+        "country": np.asarray(names, dtype=object)[rng.choice(len(names), n_rows, p=probs)],
+    })
+
+
+def write_corpus(out_dir: Path, n_rows: int, n_days: int | None = None, seed: int = 0) -> list[Path]:
+    """
+    Split n_rows over n_days daily CSV shards (2011-12-01.csv, ...).
+
+    n_days defaults to one shard per ROWS_PER_DAY rows. Shards already on
+    disk are reused, so a corpus is generated once per (rows, seed).
+    """
+    n_days = n_days or max(1, -(-n_rows // ROWS_PER_DAY))
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    per_day = -(-n_rows // n_days)
+    paths = []
+    for day in range(n_days):
+        rows = min(per_day, n_rows - day * per_day)
+        path = out_dir / f"2011-12-{day + 1:02d}.csv"
+        if not path.exists():
+            tmp = path.with_suffix(".csv.tmp")
+            generate_shard(rows, seed=seed + day, id_start=day * per_day).to_csv(tmp, index=False)
+            os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write deterministic synthetic tweet CSV shards.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=None, help=f"Number of shards (default: one per {ROWS_PER_DAY:,} rows)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", type=Path, default=Path("benchmarks/data"))
+    args = parser.parse_args()
+    for path in write_corpus(args.output_dir / f"rows_{args.rows}_seed_{args.seed}", args.rows, args.days, args.seed):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
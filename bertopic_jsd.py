@@ -1,19 +1,43 @@
+"""Guided BERTopic over subject-filtered tweets and NYT articles, compared by JSD.
+
+Run as a script for the constants below, or import the stages (used by
+streamlit_dashboard.py): filter_corpus -> prepare_corpus -> embed_corpus ->
+fit_topics -> source_divergence.
+
+Each stage reports into instrumentation; `--metrics run.json` writes the
+per-stage timings, memory and row counts (see instrumentation.py).
+"""
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
 import numpy as np
 import pandas as pd
 
 from bertopic import BERTopic
-from sentence_transformers import SentenceTransformer
 from umap import UMAP
 from hdbscan import HDBSCAN
 from sklearn.feature_extraction.text import CountVectorizer
 
+from dedup import DedupResult, collapse_duplicates
+from divergence import bootstrap_pairwise, jsd
+from embedding_cache import EmbeddingStore
+from encoding import BACKENDS, ParallelEncoder, make_store
+from geocode import country_code, country_codes
+from instrumentation import PROFILERS, configure, get_recorder, instrument_methods, stage
 from stage1_subject_filtering.llm_expansion import get_synonyms
+from stage1_subject_filtering.shard_filtering import filter_csv_directory
 from stage1_subject_filtering.subject_keyword_list_filtering import (
     filter_subject_keywords_list,
 )
 
 
-TWITTER_CSV = "2011-12-csv/2011-12-07.csv"
+TWITTER_DIR = "2011-12-csv"
+TWITTER_PATTERN = "2011-12-07.csv"  # "*.csv" filters the whole month
+TWITTER_FILTERED_CSV = "twitter_filtered_2011-12.csv"
 NEWS_CSV = "nyt_2011_12.csv"
 TEXT_COL = "Text"
 
@@ -21,19 +45,30 @@ SUBJECT = "Immigration"
 TOPICS = ["Medicine", "Politics", "Mafia"]
 
 
+ProgressFn = Callable[[str, float], None]
+
+
+def _no_progress(stage: str, fraction: float):
+    pass
+
+
 def load_df(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
+    with stage("load") as record:
+        df = pd.read_csv(path)
+        record.update(rows_out=len(df), path=str(path))
     if TEXT_COL not in df.columns:
         raise KeyError(f"'{TEXT_COL}' not found in {path}. Columns: {list(df.columns)}")
     return df
 
 
 def expand_subject_keywords(subject: str) -> list[str]:
-    try:
-        synonyms = get_synonyms(subject)
-    except Exception as exc:
-        print(f"Synonym expansion failed, using subject only: {exc}")
-        synonyms = []
+    with stage("llm_expansion") as record:
+        try:
+            synonyms = get_synonyms(subject)
+        except Exception as exc:
+            print(f"Synonym expansion failed, using subject only: {exc}")
+            synonyms = []
+            record.update(failed=True)
     keywords = [subject] + list(synonyms)
     cleaned = []
     for kw in keywords:
@@ -47,15 +82,6 @@ def to_texts(df: pd.DataFrame) -> list[str]:
     return [t for t in texts if t.strip()]
 
 
-def jsd(p: np.ndarray, q: np.ndarray) -> float:
-    p = p / p.sum()
-    q = q / q.sum()
-    m = 0.5 * (p + q)
-    kl_pm = np.where(p > 0, p * np.log2(p / m), 0.0)
-    kl_qm = np.where(q > 0, q * np.log2(q / m), 0.0)
-    return float(0.5 * (kl_pm.sum() + kl_qm.sum()))
-
-
 def build_model(seed_topic_list: list[list[str]]) -> BERTopic:
     umap_model = UMAP(
         n_neighbors=15,
@@ -78,6 +104,11 @@ def build_model(seed_topic_list: list[list[str]]) -> BERTopic:
         min_df=2,
     )
 
+    if get_recorder().enabled:
+        # Time UMAP and HDBSCAN separately inside BERTopic's fit.
+        instrument_methods(umap_model, "umap")
+        instrument_methods(hdbscan_model, "hdbscan")
+
     return BERTopic(
         umap_model=umap_model,
         hdbscan_model=hdbscan_model,
@@ -88,63 +119,229 @@ def build_model(seed_topic_list: list[list[str]]) -> BERTopic:
     )
 
 
-twitter_df = load_df(TWITTER_CSV)
-news_df = load_df(NEWS_CSV)
-
-subject_keywords = expand_subject_keywords(SUBJECT)
-print("Subject keywords:", subject_keywords)
-
-twitter_filtered = filter_subject_keywords_list(twitter_df, subject_keywords, text_col=TEXT_COL)
-news_filtered = filter_subject_keywords_list(news_df, subject_keywords, text_col=TEXT_COL)
-
-twitter_texts = to_texts(twitter_filtered)
-news_texts = to_texts(news_filtered)
-
-texts = twitter_texts + news_texts
-sources = (["twitter"] * len(twitter_texts)) + (["nyt"] * len(news_texts))
-
-if not texts:
-    raise ValueError("No texts left after subject filtering.")
-
-print("Loaded docs after subject filter:", len(texts))
-
-seed_topic_list = [[t.lower()] for t in TOPICS]
-model = build_model(seed_topic_list)
-
-encoder = SentenceTransformer("all-MiniLM-L6-v2")
-embeddings = encoder.encode(
-    texts,
-    show_progress_bar=True,
-    batch_size=64,
-    normalize_embeddings=True,
-)
-
-topics, _probs = model.fit_transform(texts, embeddings)
-
-doc_topics = pd.DataFrame({"text": texts, "source": sources, "topic": topics})
-doc_topics.to_csv("doc_topics_twitter_nyt_2011-12-07_guided.csv", index=False)
-
-topic_info = model.get_topic_info()
-topic_info.to_csv("topic_info_twitter_nyt_2011-12-07_guided.csv", index=False)
-
-filtered = doc_topics[doc_topics["topic"] != -1]
-topic_ids = sorted(filtered["topic"].unique())
-
-twitter_counts = (
-    filtered[filtered["source"] == "twitter"]["topic"]
-    .value_counts()
-    .reindex(topic_ids, fill_value=0)
-    .to_numpy(dtype=float)
-)
-nyt_counts = (
-    filtered[filtered["source"] == "nyt"]["topic"]
-    .value_counts()
-    .reindex(topic_ids, fill_value=0)
-    .to_numpy(dtype=float)
-)
-
-if twitter_counts.sum() == 0 or nyt_counts.sum() == 0:
-    raise ValueError("One of the sources has zero non-outlier topics.")
+def restrict(df: pd.DataFrame, country: str | None = None, language: str | None = None) -> pd.DataFrame:
+    """
+    Keep rows of one country / language; a requested filter whose column is
+    missing raises KeyError.
+
+    Countries are compared by ISO code, so "Brasil", "Brazil" and "BR" all match.
+    """
+    for value, column in ((country, "country"), (language, "language")):
+        if value and column not in df.columns:
+            raise KeyError(f"Cannot filter by {column}: no '{column}' column. Columns: {list(df.columns)}")
+    mask = pd.Series(True, index=df.index)
+    if country:
+        names = df["country"].fillna("").astype(str).str.strip()
+        code = country_code(country)
+        if code:
+            mask &= country_codes(names) == code
+        else:
+            mask &= names.str.casefold() == country.strip().casefold()
+    if language:
+        mask &= df["language"].fillna("").astype(str).str.strip().str.casefold() == language.strip().casefold()
+    return df.loc[mask]
+
+
+def filter_corpus(
+    subject_keywords: list[str],
+    twitter_dir: str = TWITTER_DIR,
+    pattern: str = TWITTER_PATTERN,
+    filtered_csv: str = TWITTER_FILTERED_CSV,
+    news_csv: str = NEWS_CSV,
+    country: str | None = None,
+    language: str | None = None,
+) -> tuple[list[str], list[str]]:
+    """Subject-filtered tweet and news texts; country/language only restrict tweets."""
+    with stage("filter") as record:
+        filter_csv_directory(
+            twitter_dir,
+            filtered_csv,
+            subject_keywords,
+            text_col=TEXT_COL,
+            pattern=pattern,
+        )
+        twitter_filtered = load_df(filtered_csv)
+        with stage("restrict", rows_in=len(twitter_filtered)) as restricted:
+            twitter_filtered = restrict(twitter_filtered, country, language)
+            restricted.update(rows_out=len(twitter_filtered))
+        news_filtered = filter_subject_keywords_list(load_df(news_csv), subject_keywords, text_col=TEXT_COL)
+        texts = to_texts(twitter_filtered), to_texts(news_filtered)
+        record.update(rows_out=len(texts[0]) + len(texts[1]), twitter=len(texts[0]), news=len(texts[1]))
+    return texts
+
+
+@dataclass
+class Corpus:
+    """Filtered texts of both sources plus their duplicate groups."""
+
+    twitter_texts: list[str]
+    news_texts: list[str]
+    twitter_dedup: DedupResult
+    news_dedup: DedupResult
+
+    @property
+    def texts(self) -> list[str]:
+        return self.twitter_texts + self.news_texts
+
+    @property
+    def sources(self) -> list[str]:
+        return (["twitter"] * len(self.twitter_texts)) + (["nyt"] * len(self.news_texts))
+
+    @property
+    def rep_texts(self) -> list[str]:
+        return [self.twitter_texts[i] for i in self.twitter_dedup.representatives] + [
+            self.news_texts[i] for i in self.news_dedup.representatives
+        ]
+
+    def expand(self, rep_values: np.ndarray) -> np.ndarray:
+        """Per-representative values (twitter groups first) back to every text."""
+        rep_values = np.asarray(rep_values)
+        n_twitter = self.twitter_dedup.n_groups
+        return np.concatenate([
+            self.twitter_dedup.expand(rep_values[:n_twitter]),
+            self.news_dedup.expand(rep_values[n_twitter:]),
+        ])
+
+
+def prepare_corpus(twitter_texts: list[str], news_texts: list[str]) -> Corpus:
+    """Collapse retweets/near-duplicates per source; topics are fit on one representative per group."""
+    if not twitter_texts and not news_texts:
+        raise ValueError("No texts left after subject filtering.")
+    with stage("dedup", rows_in=len(twitter_texts) + len(news_texts)) as record:
+        corpus = Corpus(
+            twitter_texts,
+            news_texts,
+            collapse_duplicates(twitter_texts),
+            collapse_duplicates(news_texts),
+        )
+        record.update(rows_out=corpus.twitter_dedup.n_groups + corpus.news_dedup.n_groups)
+    return corpus
+
+
+def embed_corpus(
+    corpus: Corpus,
+    store: EmbeddingStore | None = None,
+    batch_size: int = 64,
+    chunk_size: int = 4096,
+    progress: ProgressFn = _no_progress,
+) -> np.ndarray:
+    """Embeddings of the representatives, in chunks so progress can be reported."""
+    store = store or EmbeddingStore("all-MiniLM-L6-v2", normalize=True)
+    rep_texts = corpus.rep_texts
+    parts = []
+    with stage("encode", rows_in=len(rep_texts)) as record:
+        cached = len(store)
+        for start in range(0, len(rep_texts), chunk_size):
+            progress("embedding", start / len(rep_texts))
+            parts.append(store.encode(rep_texts[start:start + chunk_size], batch_size=batch_size))
+        progress("embedding", 1.0)
+        record.update(rows_out=sum(len(p) for p in parts), newly_encoded=len(store) - cached)
+    return np.concatenate(parts) if parts else np.empty((0, 0), dtype=np.float32)
+
+
+def fit_topics(
+    corpus: Corpus,
+    embeddings: np.ndarray,
+    topics: list[str],
+    progress: ProgressFn = _no_progress,
+) -> tuple[pd.DataFrame, pd.DataFrame, BERTopic]:
+    """Guided fit on the representatives; returns (doc_topics, topic_info, model)."""
+    progress("fitting", 0.0)
+    seed_topic_list = [[t.lower()] for t in topics] or None
+    model = build_model(seed_topic_list)
+    with stage("fit_topics", rows_in=len(embeddings)) as record:
+        rep_topics, _probs = model.fit_transform(corpus.rep_texts, embeddings)
+        labels = np.asarray(rep_topics)
+        record.update(
+            rows_out=len(labels),
+            topics=len(np.unique(labels[labels != -1])),
+            outlier_rate=float(np.mean(labels == -1)) if len(labels) else None,
+        )
+    progress("fitting", 1.0)
+
+    doc_topics = pd.DataFrame({"text": corpus.texts, "source": corpus.sources, "topic": corpus.expand(rep_topics)})
+    topic_info = model.get_topic_info()
+    topic_info["Count"] = topic_info["Topic"].map(doc_topics["topic"].value_counts()).fillna(0).astype(int)
+    return doc_topics, topic_info, model
+
+
+def source_divergence(doc_topics: pd.DataFrame, n_boot: int = 1000) -> dict:
+    """JSD between the twitter and nyt topic distributions (outliers dropped), with a bootstrap CI."""
+    with stage("jsd", rows_in=len(doc_topics)):
+        return _source_divergence(doc_topics, n_boot)
+
+
+def _source_divergence(doc_topics: pd.DataFrame, n_boot: int) -> dict:
+    filtered = doc_topics[doc_topics["topic"] != -1]
+    topic_ids = sorted(filtered["topic"].unique())
+
+    counts = np.stack([
+        filtered[filtered["source"] == source]["topic"]
+        .value_counts()
+        .reindex(topic_ids, fill_value=0)
+        .to_numpy(dtype=float)
+        for source in ("twitter", "nyt")
+    ])
+
+    divergence = jsd(counts[0], counts[1])
+    if np.isnan(divergence):
+        return {"jsd": divergence, "low": np.nan, "high": np.nan, "counts": counts}
+    interval = bootstrap_pairwise(counts, n_boot=n_boot)
+    return {"jsd": divergence, "low": interval["low"][0, 1], "high": interval["high"][0, 1], "counts": counts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Guided BERTopic over subject-filtered tweets and NYT, compared by JSD.")
+    parser.add_argument("--metrics", type=Path, default=None, help="Write a per-stage JSON run report here")
+    parser.add_argument("--trace-memory", action="store_true", help="Also record tracemalloc peaks (slower)")
+    parser.add_argument("--profile", choices=PROFILERS, default=None, help="Profile each top-level stage")
+    parser.add_argument("--profile-dir", type=Path, default=Path("profiles"))
+    parser.add_argument(
+        "--encoder", choices=BACKENDS, default=None,
+        help="Encode with encoding.ParallelEncoder (length-bucketed, multi-process) using this backend",
+    )
+    parser.add_argument("--encode-workers", type=int, default=None, help="Encoding processes (default: physical cores)")
+    args = parser.parse_args()
+    if args.metrics or args.profile:
+        configure(trace_memory=args.trace_memory, profile=args.profile, profile_dir=args.profile_dir)
 
-divergence = jsd(twitter_counts, nyt_counts)
-print(f"Jensen-Shannon divergence (guided topics): {divergence:.6f}")
+    encoder = ParallelEncoder(backend=args.encoder, workers=args.encode_workers) if args.encoder else None
+    try:
+        run(make_store(encoder) if encoder else None)
+    finally:
+        if encoder:
+            encoder.close()
+        recorder = get_recorder()
+        if recorder.enabled:
+            print("\n" + recorder.summary())
+            if args.metrics:
+                print(f"Wrote {recorder.save(args.metrics)}")
+
+
+def run(store: EmbeddingStore | None = None):
+    subject_keywords = expand_subject_keywords(SUBJECT)
+    print("Subject keywords:", subject_keywords)
+
+    twitter_texts, news_texts = filter_corpus(subject_keywords)
+    print("Loaded docs after subject filter:", len(twitter_texts) + len(news_texts))
+
+    corpus = prepare_corpus(twitter_texts, news_texts)
+    print("Representatives after dedup:", len(corpus.rep_texts))
+
+    embeddings = embed_corpus(corpus, store)
+    doc_topics, topic_info, _model = fit_topics(corpus, embeddings, TOPICS)
+    doc_topics.to_csv("doc_topics_twitter_nyt_2011-12-07_guided.csv", index=False)
+    topic_info.to_csv("topic_info_twitter_nyt_2011-12-07_guided.csv", index=False)
+
+    result = source_divergence(doc_topics)
+    if np.isnan(result["jsd"]):
+        print("One of the sources has zero non-outlier topics; divergence is undefined (NaN).")
+    else:
+        print(
+            f"Jensen-Shannon divergence (guided topics): {result['jsd']:.6f} "
+            f"(95% bootstrap CI {result['low']:.6f}-{result['high']:.6f})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,41 @@
-from pathlib import Path
-import json
+"""Convert the NDJSON tweet dump to CSV shards with a detected `language` column.
+
+Texts are detected in batches on a process pool. Results are cached by a
+hash of the normalized text (SQLite, shared across shards and runs), so
+retweets and repeated spam are detected once. Each shard is checkpointed
+every batch, so an interrupted run resumes mid-file instead of from zero.
+`--lang-source user` takes the cheap `user.lang` field instead, and
+`--lang-source user+detect` falls back to detection when it is missing.
+Shards are read directly from .json.gz/.json.zst (ndjson_io); checkpoint
+offsets count decompressed bytes.
+"""
+from __future__ import annotations
+
+import argparse
 import csv
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from multiprocessing import Pool
+from pathlib import Path
+
 from langdetect import detect, DetectorFactory
 from langdetect.lang_detect_exception import LangDetectException
 
+from ndjson_io import list_shards, open_ndjson, parse_record, shard_stem, skip_to
+
 DetectorFactory.seed = 0
 
+HEADER = ["Text", "Origin", "id", "country", "language"]
+LANG_SOURCES = ("detect", "user", "user+detect")
+
+DETECT_CHUNK = 500  # texts per pool task
+
+_RT_PREFIX = re.compile(r"^(rt @\w+:?\s*)+")
+
+
 def detect_language(text: str) -> str:
     text = (text or "").strip()
     if not text:
@@ -15,42 +45,199 @@ def detect_language(text: str) -> str:
     except LangDetectException:
         return ""
 
-input_dir = Path("2011-12-uncompressed")
-output_dir = Path("2011-12-csv-langdetect")
 
-print("CWD:", Path.cwd())
-print("Input exists:", input_dir.exists())
-output_dir.mkdir(parents=True, exist_ok=True)
-print("Output dir:", output_dir.resolve())
+def detect_many(texts: list[str]) -> list[str]:
+    return [detect_language(t) for t in texts]
+
+
+def text_key(text: str) -> str:
+    """Cache key: hash of the lowercased, whitespace-collapsed text without RT prefixes."""
+    norm = " ".join((text or "").lower().split())
+    norm = _RT_PREFIX.sub("", norm)
+    return hashlib.blake2b(norm.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class LangCache:
+    """Persistent text-hash -> language cache backed by SQLite."""
+
+    def __init__(self, path: Path):
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute("CREATE TABLE IF NOT EXISTS lang (key TEXT PRIMARY KEY, lang TEXT)")
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        found: dict[str, str] = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            rows = self.conn.execute(
+                f"SELECT key, lang FROM lang WHERE key IN ({placeholders})", part
+            )
+            found.update(rows)
+        return found
+
+    def put_many(self, items: dict[str, str]):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO lang VALUES (?, ?)", items.items())
+
+    def close(self):
+        self.conn.close()
+
+
+def resolve_languages(rows: list[tuple], pool, cache: LangCache, lang_source: str) -> list[str]:
+    """Fill in a language per row, detecting only texts not already cached."""
+    langs = [""] * len(rows)
+    to_detect: dict[int, str] = {}
+    for i, (text, _msg_id, _country, user_lang) in enumerate(rows):
+        if lang_source != "detect" and user_lang:
+            langs[i] = user_lang
+        elif lang_source != "user":
+            to_detect[i] = text_key(text)
+    if not to_detect:
+        return langs
 
-for i, json_path in enumerate(sorted(input_dir.glob("*.json")), 1):
-    csv_path = output_dir / (json_path.stem + ".csv")
-    if csv_path.exists():
-        continue
+    known = cache.get_many(set(to_detect.values()))
+    pending: dict[str, str] = {}
+    for i, key in to_detect.items():
+        if key not in known and key not in pending:
+            pending[key] = rows[i][0]
 
-    with csv_path.open("w", newline="", encoding="utf-8") as f_out:
+    if pending:
+        keys = list(pending)
+        texts = [pending[k] for k in keys]
+        batches = [texts[s:s + DETECT_CHUNK] for s in range(0, len(texts), DETECT_CHUNK)]
+        detected = [lang for batch in pool.map(detect_many, batches) for lang in batch]
+        new = dict(zip(keys, detected))
+        cache.put_many(new)
+        known.update(new)
+
+    for i, key in to_detect.items():
+        langs[i] = known[key]
+    return langs
+
+
+def _load_checkpoint(ckpt_path: Path) -> dict:
+    with ckpt_path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_checkpoint(ckpt_path: Path, in_offset: int, out_size: int):
+    tmp = ckpt_path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump({"in_offset": in_offset, "out_size": out_size}, f)
+    tmp.replace(ckpt_path)
+
+
+def process_shard(
+    json_path: Path,
+    csv_path: Path,
+    pool,
+    cache: LangCache,
+    lang_source: str = "detect",
+    batch_size: int = 20_000,
+) -> int:
+    """
+    Convert one NDJSON shard, checkpointing after every batch.
+
+    The checkpoint records the input byte offset and the CSV size at that
+    point; on resume the CSV is truncated back to it, so rows written after
+    the last checkpoint are never duplicated. Returns rows written this run.
+    """
+    ckpt_path = csv_path.with_name(csv_path.name + ".ckpt")
+    if ckpt_path.exists() and csv_path.exists():
+        state = _load_checkpoint(ckpt_path)
+        os.truncate(csv_path, state["out_size"])
+    else:
+        # The checkpoint exists before the CSV appears, so a CSV without a
+        # checkpoint always means a finished shard.
+        tmp_path = csv_path.with_name(csv_path.name + ".part")
+        with tmp_path.open("w", newline="", encoding="utf-8") as f_out:
+            csv.writer(f_out).writerow(HEADER)
+        state = {"in_offset": 0, "out_size": tmp_path.stat().st_size}
+        _save_checkpoint(ckpt_path, **state)
+        tmp_path.replace(csv_path)
+
+    written = 0
+    offset = state["in_offset"]
+    with open_ndjson(json_path) as f_in, csv_path.open("a", newline="", encoding="utf-8") as f_out:
         writer = csv.writer(f_out)
-        writer.writerow(["Text", "Origin", "id", "country", "language"])
-
-        with json_path.open("r", encoding="utf-8") as f_in:
-            for line in f_in:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    record = json.loads(line)
-                except json.JSONDecodeError:
-                    continue
-
-                text = record.get("text", "")
-                msg_id = record.get("id") or record.get("id_str") or ""
-                place = record.get("place") or {}
-                country = place.get("country", "") if isinstance(place, dict) else ""
-                lang = detect_language(text)
-
-                writer.writerow([text, "Twitter", msg_id, country, lang])
-
-    if i % 5 == 0:
-        print(f"Processed {i} files...")
-
-print("Done.")
+        skip_to(f_in, offset)
+
+        def flush(rows):
+            langs = resolve_languages(rows, pool, cache, lang_source)
+            writer.writerows(
+                [text, "Twitter", msg_id, country, lang]
+                for (text, msg_id, country, _), lang in zip(rows, langs)
+            )
+            f_out.flush()
+            os.fsync(f_out.fileno())
+            _save_checkpoint(ckpt_path, offset, os.fstat(f_out.fileno()).st_size)
+
+        rows = []
+        for line in f_in:
+            offset += len(line)
+            row = parse_record(line)
+            if row is not None:
+                rows.append(row)
+            if len(rows) >= batch_size:
+                flush(rows)
+                written += len(rows)
+                rows = []
+        flush(rows)
+        written += len(rows)
+
+    ckpt_path.unlink()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Language-tag NDJSON tweet shards into CSV.")
+    parser.add_argument(
+        "--input-dir",
+        type=Path,
+        default=Path("2011-12"),
+        help="NDJSON shards, plain or compressed (.json, .json.gz, .json.zst)",
+    )
+    parser.add_argument("--output-dir", type=Path, default=Path("2011-12-csv-langdetect"))
+    parser.add_argument("--workers", type=int, default=None, help="Detection processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=20_000, help="Rows per batch/checkpoint")
+    parser.add_argument(
+        "--lang-source",
+        choices=LANG_SOURCES,
+        default="detect",
+        help="detect: langdetect on text; user: user.lang only; user+detect: user.lang, else detect",
+    )
+    parser.add_argument("--cache", type=Path, default=None, help="Cache DB (default: <output-dir>/lang_cache.sqlite)")
+    args = parser.parse_args()
+
+    input_dir = args.input_dir
+    output_dir = args.output_dir
+
+    print("CWD:", Path.cwd())
+    print("Input exists:", input_dir.exists())
+    output_dir.mkdir(parents=True, exist_ok=True)
+    print("Output dir:", output_dir.resolve())
+
+    cache = LangCache(args.cache or output_dir / "lang_cache.sqlite")
+    with Pool(processes=args.workers or os.cpu_count()) as pool:
+        for i, json_path in enumerate(list_shards(input_dir), 1):
+            csv_path = output_dir / (shard_stem(json_path) + ".csv")
+            ckpt_path = csv_path.with_name(csv_path.name + ".ckpt")
+            if csv_path.exists() and not ckpt_path.exists():
+                continue
+
+            rows = process_shard(
+                json_path, csv_path, pool, cache,
+                lang_source=args.lang_source, batch_size=args.batch_size,
+            )
+            print(f"{shard_stem(json_path)}: {rows:,} rows")
+
+            if i % 5 == 0:
+                print(f"Processed {i} files...")
+    cache.close()
+
+    print("Done.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Collapse retweets, copy-paste spam and near-identical tweets before topic modelling.
+
+Texts are first grouped exactly on a canonical form (lowercased, `RT @user:`
+prefixes, URLs and mentions dropped, whitespace collapsed); texts with an
+empty canonical form (URL- or mention-only tweets) are grouped on their raw
+text instead, so they do not all collapse into one group. The unique
+canonical texts are then grouped by MinHash signatures over character
+shingles with LSH banding. Topic models are fitted on one representative per
+group; `DedupResult.expand` maps per-representative results back to every
+original row, and `weights` keeps the group sizes for count-based metrics.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+_RT_PREFIX = re.compile(r"^(rt\s+@\w+:?\s*)+")
+_URL = re.compile(r"https?://\S+")
+_MENTION = re.compile(r"@\w+")
+
+_BYTE_WEIGHTS = np.array([pow(257, i, 1 << 64) for i in range(64)], dtype=np.uint64)
+
+
+def canonical_text(text: str) -> str:
+    s = (text or "").lower()
+    s = _RT_PREFIX.sub("", s)
+    s = _URL.sub(" ", s)
+    s = _MENTION.sub(" ", s)
+    return " ".join(s.split())
+
+
+@dataclass
+class DedupResult:
+    representatives: np.ndarray  # row index of each group's representative
+    group_ids: np.ndarray        # group index per original row
+    weights: np.ndarray          # number of original rows per group
+
+    @property
+    def n_groups(self) -> int:
+        return len(self.representatives)
+
+    def expand(self, values: Sequence) -> np.ndarray:
+        """Map one value per representative back to every original row."""
+        return np.asarray(values)[self.group_ids]
+
+
+def _shingle_hashes(texts: Sequence[str], k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    64-bit hash of every UTF-8 byte k-shingle, flattened, plus per-text offsets.
+
+    Texts shorter than k contribute a single (zero-padded) shingle.
+    """
+    encoded = [t.encode("utf-8") for t in texts]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    buf = np.frombuffer(b"".join(encoded) + bytes(k), dtype=np.uint8)
+
+    n_shingles = np.maximum(lengths - k + 1, 1)
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(n_shingles, out=offsets[1:])
+    byte_starts = np.zeros(len(texts), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=byte_starts[1:])
+    local = np.arange(offsets[-1]) - np.repeat(offsets[:-1], n_shingles)
+    positions = (np.repeat(byte_starts, n_shingles) + local)[:, None] + np.arange(k)
+
+    window = buf[positions].astype(np.uint64)
+    ends = np.repeat(byte_starts + lengths, n_shingles)
+    window[positions >= ends[:, None]] = 0
+
+    hashes = (window * _BYTE_WEIGHTS[:k]).sum(axis=1, dtype=np.uint64)
+    hashes ^= hashes >> np.uint64(29)
+    hashes *= np.uint64(0xBF58476D1CE4E5B9)
+    hashes ^= hashes >> np.uint64(32)
+    return hashes, offsets
+
+
+def minhash_signatures(
+    texts: Sequence[str],
+    num_perm: int = 64,
+    shingle: int = 5,
+    seed: int = 42,
+    block: int = 5_000,
+) -> np.ndarray:
+    """(len(texts), num_perm) MinHash signatures, computed in vectorized blocks of texts."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+
+    sigs = np.empty((len(texts), num_perm), dtype=np.uint32)
+    for start in range(0, len(texts), block):
+        hashes, offsets = _shingle_hashes(texts[start:start + block], shingle)
+        # Multiply-shift hashing: one random permutation per row, no modulo.
+        permuted = ((a[:, None] * hashes + b[:, None]) >> np.uint64(32)).astype(np.uint32)
+        sigs[start:start + len(offsets) - 1] = np.minimum.reduceat(permuted, offsets[:-1], axis=1).T
+    return sigs
+
+
+def collapse_duplicates(
+    texts: Sequence[str],
+    near_duplicates: bool = True,
+    threshold: float = 0.8,
+    num_perm: int = 64,
+    bands: int = 16,
+    shingle: int = 5,
+    seed: int = 42,
+) -> DedupResult:
+    """
+    Group exact and near-duplicate texts.
+
+    Near-duplicates are candidate pairs sharing at least one LSH band whose
+    estimated Jaccard similarity (fraction of equal MinHash values) is at
+    least threshold. The representative of a group is its first row. Texts
+    whose canonical form is empty only group with identical raw texts.
+    """
+    if num_perm % bands:
+        raise ValueError("num_perm must be divisible by bands")
+
+    canon = pd.Series([canonical_text(t) for t in texts], dtype=object)
+    empty = (canon == "").to_numpy()
+    exact_ids, uniques = pd.factorize(canon.where(~empty), sort=False)
+    n_unique = len(uniques)
+    roots = np.arange(n_unique)
+
+    if near_duplicates and n_unique > 1:
+        sigs = minhash_signatures(list(uniques), num_perm=num_perm, shingle=shingle, seed=seed)
+        rows_per_band = num_perm // bands
+        heads, members = [], []
+        for band in range(bands):
+            band_sig = np.ascontiguousarray(sigs[:, band * rows_per_band:(band + 1) * rows_per_band])
+            _, bucket = np.unique(band_sig.view(f"V{band_sig.itemsize * rows_per_band}").ravel(), return_inverse=True)
+            order = np.argsort(bucket, kind="stable")
+            sorted_bucket = bucket[order]
+            is_head = np.r_[True, sorted_bucket[1:] != sorted_bucket[:-1]]
+            # Compare every bucket member with its bucket's first member only.
+            head_of = order[np.flatnonzero(is_head)[np.cumsum(is_head) - 1]]
+            heads.append(head_of[~is_head])
+            members.append(order[~is_head])
+        heads = np.concatenate(heads)
+        members = np.concatenate(members)
+        similar = np.empty(len(heads), dtype=bool)
+        for start in range(0, len(heads), 1_000_000):
+            part = slice(start, start + 1_000_000)
+            similar[part] = (sigs[heads[part]] == sigs[members[part]]).mean(axis=1) >= threshold
+
+        graph = coo_matrix(
+            (np.ones(similar.sum(), dtype=np.int8), (heads[similar], members[similar])),
+            shape=(n_unique, n_unique),
+        )
+        _, roots = connected_components(graph, directed=False)
+
+    if empty.any():
+        # Empty canonical forms are keyed on the raw text and skip MinHash.
+        raw_ids, raw_uniques = pd.factorize(pd.Series([texts[i] or "" for i in np.flatnonzero(empty)], dtype=object))
+        exact_ids[empty] = n_unique + raw_ids
+        roots = np.r_[roots, roots.max(initial=-1) + 1 + np.arange(len(raw_uniques))]
+
+    group_ids, _ = pd.factorize(roots[exact_ids], sort=False)
+    weights = np.bincount(group_ids)
+    representatives = np.full(len(weights), -1, dtype=np.int64)
+    # Reverse assignment leaves the first row of each group in place.
+    representatives[group_ids[::-1]] = np.arange(len(group_ids))[::-1]
+    return DedupResult(representatives=representatives, group_ids=group_ids, weights=weights)
@@ -0,0 +1,152 @@
+"""Vectorized divergences between topic count distributions.
+
+Count arrays are stacked along leading axes, e.g. a (days, sources, topics)
+tensor built by `count_tensor`. `pairwise_divergence` compares every pair
+along the second-to-last axis in one broadcast pass, and `bootstrap_pairwise`
+draws multinomial resamples as arrays to get percentile confidence intervals.
+Rows with zero counts (no non-outlier topics) yield NaN instead of raising.
+"""
+from __future__ import annotations
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+METRICS = ("jsd", "kl", "hellinger")
+
+
+def to_probabilities(counts: np.ndarray, smoothing: float = 0.0) -> np.ndarray:
+    """Normalize along the last axis; all-zero rows become NaN."""
+    counts = np.asarray(counts, dtype=np.float64) + smoothing
+    totals = counts.sum(axis=-1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(totals > 0, counts / totals, np.nan)
+
+
+def _kl(p: np.ndarray, q: np.ndarray, base: float) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        terms = np.where(p > 0, p * np.log(p / q), 0.0)
+    # np.where keeps NaN rows from p; carry NaN rows from q through as well.
+    terms = np.where(np.isnan(q), np.nan, terms)
+    return terms.sum(axis=-1) / np.log(base)
+
+
+def divergence_from_probabilities(
+    p: np.ndarray,
+    q: np.ndarray,
+    metric: str = "jsd",
+    base: float = 2.0,
+) -> np.ndarray:
+    """Divergence along the last axis of two broadcastable probability arrays."""
+    if np.shape(p)[-1] == 0:  # no topics at all
+        return np.full(np.broadcast_shapes(np.shape(p), np.shape(q))[:-1], np.nan)
+    if metric == "jsd":
+        m = 0.5 * (p + q)
+        return 0.5 * (_kl(p, m, base) + _kl(q, m, base))
+    if metric == "kl":
+        return _kl(p, q, base)
+    if metric == "hellinger":
+        return np.sqrt(0.5 * ((np.sqrt(p) - np.sqrt(q)) ** 2).sum(axis=-1))
+    raise ValueError(f"metric must be one of {METRICS}")
+
+
+def jsd(p: np.ndarray, q: np.ndarray, base: float = 2.0) -> float:
+    """Jensen-Shannon divergence of two count vectors (NaN if either is all zero)."""
+    probs = to_probabilities(np.stack([p, q]))
+    return float(divergence_from_probabilities(probs[0], probs[1], "jsd", base))
+
+
+def pairwise_divergence(
+    counts: np.ndarray,
+    metric: str = "jsd",
+    base: float = 2.0,
+    smoothing: float = 0.0,
+) -> np.ndarray:
+    """
+    All pairwise divergences along the second-to-last axis.
+
+    counts has shape (..., n, k); the result has shape (..., n, n) with
+    result[..., i, j] = D(row i || row j).
+    """
+    probs = to_probabilities(counts, smoothing=smoothing)
+    return divergence_from_probabilities(
+        probs[..., :, None, :], probs[..., None, :, :], metric=metric, base=base
+    )
+
+
+def bootstrap_pairwise(
+    counts: np.ndarray,
+    n_boot: int = 1000,
+    metric: str = "jsd",
+    ci: float = 0.95,
+    base: float = 2.0,
+    smoothing: float = 0.0,
+    seed: int = 42,
+    batch_size: int = 250,
+) -> dict[str, np.ndarray]:
+    """
+    Point estimate and percentile bootstrap interval for pairwise_divergence.
+
+    Every row of counts is resampled as Multinomial(row total, row
+    proportions), batch_size resamples at a time. Returns 'estimate', 'low',
+    'high' (each shaped (..., n, n)) and 'samples' (n_boot, ..., n, n).
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    lead_shape, k = counts.shape[:-1], counts.shape[-1]
+    flat = counts.reshape(int(np.prod(lead_shape)), k)
+    totals = flat.sum(axis=1).astype(np.int64)
+    pvals = to_probabilities(flat)
+    pvals[totals == 0] = 1.0 / max(k, 1)  # drawn with n=0, so stays all-zero (NaN)
+
+    rng = np.random.default_rng(seed)
+    samples = []
+    for start in range(0, n_boot, batch_size):
+        size = min(batch_size, n_boot - start)
+        if k:
+            draws = rng.multinomial(totals, pvals, size=(size, len(flat)))
+        else:
+            draws = np.zeros((size, len(flat), 0))
+        draws = draws.reshape((size,) + lead_shape + (k,))
+        samples.append(pairwise_divergence(draws, metric=metric, base=base, smoothing=smoothing))
+    samples = np.concatenate(samples, axis=0)
+
+    alpha = (1.0 - ci) / 2.0
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN pairs (zero-count rows)
+        low, high = np.nanquantile(samples, [alpha, 1.0 - alpha], axis=0)
+    return {
+        "estimate": pairwise_divergence(counts, metric=metric, base=base, smoothing=smoothing),
+        "low": low,
+        "high": high,
+        "samples": samples,
+    }
+
+
+def count_tensor(
+    doc_topics: pd.DataFrame,
+    day_col: str = "day",
+    source_col: str = "source",
+    topic_col: str = "topic",
+    weight_col: str | None = None,
+    drop_outliers: bool = True,
+) -> tuple[np.ndarray, list, list, list]:
+    """
+    Stack per-document topics into a (days, sources, topics) count tensor.
+
+    Returns (counts, days, sources, topics). Missing combinations are zero.
+    """
+    df = doc_topics
+    if drop_outliers:
+        df = df[df[topic_col] != -1]
+    days = sorted(df[day_col].unique())
+    sources = sorted(df[source_col].unique())
+    topics = sorted(df[topic_col].unique())
+
+    if weight_col is None:
+        grouped = df.groupby([day_col, source_col, topic_col]).size()
+    else:
+        grouped = df.groupby([day_col, source_col, topic_col])[weight_col].sum()
+    full = pd.MultiIndex.from_product([days, sources, topics])
+    counts = grouped.reindex(full, fill_value=0).to_numpy(dtype=np.float64)
+    return counts.reshape(len(days), len(sources), len(topics)), days, sources, topics
@@ -1,33 +1,165 @@
 """Quick EDA for the 2011-12 tweet dump.
 
 Reads all CSVs under 2011-12-csv, reports tweet counts per day and per country.
-Designed to stream in chunks so it fits in memory.
+Designed to stream in chunks so it fits in memory. Countries are counted by
+ISO code (geocode.py), so "Brasil" and "Brazil" are one country; names that
+cannot be resolved are kept as written.
+
+Per-shard results are cached (under .eda_cache/) with each shard's size and
+mtime, optionally a content hash, so a re-run only reads new or changed
+shards; those are processed in parallel.
 """
 from __future__ import annotations
 
 import argparse
+import hashlib
+import json
+import os
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import pandas as pd
 
-
-def summarize(base_path: Path, chunksize: int = 200_000, top_n: int = 15):
-    """Aggregate daily and country counts from the CSV shard directory."""
+from geocode import country_codes
+
+DEFAULT_CACHE_DIR = Path(".eda_cache")
+CACHE_VERSION = 2
+
+
+def file_hash(path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(path: Path, use_hash: bool = False) -> dict:
+    stat = path.stat()
+    fp = {"size": stat.st_size, "mtime": stat.st_mtime}
+    if use_hash:
+        fp["hash"] = file_hash(path)
+    return fp
+
+
+def _is_fresh(entry: dict | None, path: Path, use_hash: bool) -> bool:
+    """True when a cached shard entry still describes path."""
+    if not entry:
+        return False
+    stat = path.stat()
+    if entry["size"] != stat.st_size:
+        return False
+    if entry["mtime"] == stat.st_mtime:
+        return True
+    # Touched but possibly unchanged: only a content hash can tell.
+    if use_hash and entry.get("hash"):
+        if entry["hash"] == file_hash(path):
+            entry["mtime"] = stat.st_mtime
+            return True
+    return False
+
+
+def summarize_shard(path: Path, chunksize: int = 200_000, use_hash: bool = False) -> dict:
+    """Row count and country counts for one CSV shard, plus its fingerprint."""
+    total = 0
+    countries: Counter[str] = Counter()
+    for chunk in pd.read_csv(path, usecols=["country"], chunksize=chunksize):
+        total += len(chunk)
+        countries.update(_canonical_countries(chunk["country"]).value_counts().to_dict())
+    return {**fingerprint(path, use_hash), "rows": total, "countries": dict(countries)}
+
+
+def load_cache(cache_path: Path) -> dict:
+    if not cache_path.exists():
+        return {}
+    with cache_path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("shards", {}) if data.get("version") == CACHE_VERSION else {}
+
+
+def save_cache(cache_path: Path, shards: dict):
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache_path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump({"version": CACHE_VERSION, "shards": shards}, f)
+    os.replace(tmp, cache_path)
+
+
+def summarize(
+    base_path: Path,
+    chunksize: int = 200_000,
+    top_n: int = 15,
+    cache_dir: Path | None = DEFAULT_CACHE_DIR,
+    workers: int | None = None,
+    use_hash: bool = False,
+):
+    """
+    Aggregate daily and country counts from the CSV shard directory.
+
+    Cached per-shard partials are reused when the shard is unchanged; set
+    cache_dir=None to always rescan. use_hash also fingerprints the shard
+    content, so a touched but unchanged file is not rescanned.
+    """
     files = sorted(base_path.glob("*.csv"))
     if not files:
         raise FileNotFoundError(f"No CSV files found in {base_path}")
 
+    cache_path = Path(cache_dir) / f"{Path(base_path).resolve().name}.json" if cache_dir else None
+    cached = load_cache(cache_path) if cache_path else {}
+    shards = {}
+    for f in files:
+        entry = dict(cached.get(f.name) or {})
+        if _is_fresh(entry, f, use_hash):
+            shards[f.name] = entry
+
+    stale = [f for f in files if f.name not in shards]
+    if stale:
+        worker = partial(summarize_shard, chunksize=chunksize, use_hash=use_hash)
+        with ProcessPoolExecutor(max_workers=min(len(stale), workers or os.cpu_count() or 1)) as pool:
+            for file, entry in zip(stale, pool.map(worker, stale)):
+                shards[file.name] = entry
+        print(f"Scanned {len(stale)} of {len(files)} shards ({len(files) - len(stale)} cached)")
+    if cache_path and shards != cached:
+        save_cache(cache_path, shards)
+
     per_day = []
     country_counter: Counter[str] = Counter()
-
     for file in files:
-        total = 0
-        for chunk in pd.read_csv(file, usecols=["country"], chunksize=chunksize):
-            total += len(chunk)
-            country_counter.update(chunk["country"].dropna().str.strip())
-        per_day.append((file.stem, total))
+        entry = shards[file.name]
+        per_day.append((file.stem, entry["rows"]))
+        country_counter.update(entry["countries"])
+
+    return _build_frames(per_day, country_counter, top_n)
+
+
+def summarize_store(store_dir: Path, top_n: int = 15):
+    """Same aggregates as summarize(), read from the Parquet store (day/country columns only)."""
+    from tweet_store import iter_tweet_batches, list_days
+
+    days = list_days(store_dir)
+    if not days:
+        raise FileNotFoundError(f"No day partitions found in {store_dir}")
+
+    day_counter: Counter[str] = Counter({day: 0 for day in days})
+    country_counter: Counter[str] = Counter()
+    for batch in iter_tweet_batches(store_dir, columns=["day", "country"]):
+        day_counter.update(batch["day"].value_counts().to_dict())
+        country_counter.update(_canonical_countries(batch["country"]).value_counts().to_dict())
+
+    return _build_frames(list(day_counter.items()), country_counter, top_n)
+
 
+def _canonical_countries(countries: pd.Series) -> pd.Series:
+    """ISO codes for non-empty country names, the stripped name where unresolved."""
+    names = countries.dropna().astype(str).str.strip()
+    names = names[names != ""]
+    codes = country_codes(names)
+    return codes.where(codes != "", names)
+
+
+def _build_frames(per_day, country_counter: Counter, top_n: int):
     per_day_df = pd.DataFrame(per_day, columns=["day", "tweet_count"])
     per_day_df["day"] = pd.to_datetime(per_day_df["day"], format="%Y-%m-%d")
     per_day_df = per_day_df.sort_values("day").reset_index(drop=True)
@@ -67,6 +199,12 @@ def main():
         default=Path("2011-12-csv"),
         help="Directory containing daily CSV shards (default: 2011-12-csv)",
     )
+    parser.add_argument(
+        "--store-dir",
+        type=Path,
+        default=None,
+        help="Read from a day-partitioned Parquet store (tweet_store.py) instead of CSVs",
+    )
     parser.add_argument(
         "--chunksize",
         type=int,
@@ -79,11 +217,32 @@ def main():
         default=15,
         help="How many top countries to display (default: 15)",
     )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help="Where per-shard summaries are cached (default: .eda_cache)",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Rescan every shard")
+    parser.add_argument(
+        "--hash",
+        action="store_true",
+        help="Also fingerprint shard contents, so touched but unchanged shards stay cached",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Processes for changed shards")
     args = parser.parse_args()
 
-    per_day_df, top_countries, all_countries = summarize(
-        base_path=args.data_dir, chunksize=args.chunksize, top_n=args.top_n
-    )
+    if args.store_dir is not None:
+        per_day_df, top_countries, all_countries = summarize_store(args.store_dir, top_n=args.top_n)
+    else:
+        per_day_df, top_countries, all_countries = summarize(
+            base_path=args.data_dir,
+            chunksize=args.chunksize,
+            top_n=args.top_n,
+            cache_dir=None if args.no_cache else args.cache_dir,
+            workers=args.workers,
+            use_hash=args.hash,
+        )
     print_summary(per_day_df, top_countries, all_countries)
 
 
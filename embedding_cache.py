@@ -0,0 +1,195 @@
+"""Content-addressed on-disk cache for SentenceTransformer embeddings.
+
+Embeddings are stored per (model name, normalize flag, dtype) namespace as an
+append-only memory-mapped array plus a parallel file of 64-bit text hashes.
+`EmbeddingStore.encode` only sends texts it has never seen to the model; the
+rest come straight from the memory-mapped store, so re-running a topic
+experiment with another subject or other HDBSCAN settings does not pay for
+embeddings again.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+DEFAULT_ROOT = Path(".embedding_cache")
+
+
+def text_keys(texts: Sequence[str]) -> np.ndarray:
+    """64-bit blake2b hash per text (exact text, no normalization)."""
+    return np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little")
+            for t in texts
+        ),
+        dtype=np.uint64,
+        count=len(texts),
+    )
+
+
+class EmbeddingStore:
+    """
+    Embedding cache for one (model, normalize, dtype) combination.
+
+    Rows are appended as new texts are encoded and never rewritten. Vectors
+    are written before their keys, so a crash mid-append leaves at most some
+    orphaned vectors (or a partial key); they are ignored on load and cut off
+    before the next append. Not safe for several concurrent writers.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        normalize: bool = True,
+        dtype: str = "float32",
+        root: Path = DEFAULT_ROOT,
+        encoder=None,
+    ):
+        if dtype not in ("float32", "float16"):
+            raise ValueError("dtype must be 'float32' or 'float16'")
+        self.model_name = model_name
+        self.normalize = normalize
+        self.dtype = np.dtype(dtype)
+        self.encoder = encoder
+
+        namespace = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        namespace += f"-{'norm' if normalize else 'raw'}-{dtype}"
+        self.dir = Path(root) / namespace
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.keys_path = self.dir / "keys.u64"
+        self.vectors_path = self.dir / "vectors.bin"
+        self.meta_path = self.dir / "meta.json"
+
+        self.dim = None
+        if self.meta_path.exists():
+            with self.meta_path.open("r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        self._load_index()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _load_index(self):
+        keys = np.fromfile(self.keys_path, dtype=np.uint64) if self.keys_path.exists() else np.empty(0, np.uint64)
+        if self.dim is not None and self.vectors_path.exists():
+            n_vectors = self.vectors_path.stat().st_size // (self.dim * self.dtype.itemsize)
+            keys = keys[:n_vectors]
+        self._keys = keys
+        self._order = np.argsort(keys, kind="stable")
+        self._sorted = keys[self._order]
+        self._vectors = None
+
+    def _truncate_to_index(self):
+        """Cut both files back to the rows in the index, dropping what a crashed append left."""
+        n = len(self._keys)
+        for path, size in (
+            (self.keys_path, n * self._keys.itemsize),
+            (self.vectors_path, n * self.dim * self.dtype.itemsize),
+        ):
+            if path.exists() and path.stat().st_size > size:
+                with path.open("r+b") as f:
+                    f.truncate(size)
+
+    def vectors(self) -> np.ndarray:
+        """Read-only memory map over all stored vectors."""
+        if self._vectors is None:
+            if not len(self._keys):
+                return np.empty((0, self.dim or 0), dtype=self.dtype)
+            self._vectors = np.memmap(
+                self.vectors_path, dtype=self.dtype, mode="r", shape=(len(self._keys), self.dim)
+            )
+        return self._vectors
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """Row index per key, or -1 when the key is not stored."""
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if not len(self._sorted):
+            return rows
+        pos = np.minimum(np.searchsorted(self._sorted, keys), len(self._sorted) - 1)
+        found = self._sorted[pos] == keys
+        rows[found] = self._order[pos[found]]
+        return rows
+
+    def append(self, keys: np.ndarray, embeddings: np.ndarray):
+        embeddings = np.ascontiguousarray(embeddings, dtype=self.dtype)
+        if self.dim is None:
+            self.dim = int(embeddings.shape[1])
+            with self.meta_path.open("w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "normalize": self.normalize, "dim": self.dim}, f)
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dim embeddings, got {embeddings.shape[1]}")
+
+        self._vectors = None
+        self._truncate_to_index()
+        with self.vectors_path.open("ab") as f:
+            embeddings.tofile(f)
+        with self.keys_path.open("ab") as f:
+            np.asarray(keys, dtype=np.uint64).tofile(f)
+        self._load_index()
+
+    def get(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Embeddings for stored rows as float32.
+
+        A contiguous ascending run of rows from a float32 store (e.g. a re-run
+        over the same texts) is returned as a zero-copy view of the memmap.
+        """
+        vectors = self.vectors()
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) and rows[0] >= 0 and np.array_equal(rows, np.arange(rows[0], rows[0] + len(rows))):
+            out = vectors[rows[0]:rows[0] + len(rows)]
+        else:
+            out = vectors[rows]
+        return out if out.dtype == np.float32 else out.astype(np.float32)
+
+    def _get_encoder(self):
+        if self.encoder is None:
+            from sentence_transformers import SentenceTransformer
+
+            self.encoder = SentenceTransformer(self.model_name)
+        return self.encoder
+
+    def add(
+        self,
+        texts: Sequence[str],
+        batch_size: int = 64,
+        show_progress_bar: bool = False,
+    ) -> np.ndarray:
+        """Encode and append the texts not yet stored; returns the row of every text."""
+        texts = list(texts)
+        keys = text_keys(texts)
+        rows = self.lookup(keys)
+        missing = np.flatnonzero(rows < 0)
+
+        if len(missing):
+            # Append in order of first appearance so a re-run over the same
+            # texts maps to one contiguous run of rows.
+            _, first = np.unique(keys[missing], return_index=True)
+            first = np.sort(first)
+            new_keys = keys[missing[first]]
+            new_texts = [texts[missing[i]] for i in first]
+            print(f"Embedding cache: {len(texts) - len(missing):,} hits, encoding {len(new_texts):,} new texts")
+            embeddings = self._get_encoder().encode(
+                new_texts,
+                show_progress_bar=show_progress_bar,
+                batch_size=batch_size,
+                normalize_embeddings=self.normalize,
+                convert_to_numpy=True,
+            )
+            self.append(new_keys, embeddings)
+            rows = self.lookup(keys)
+        return rows
+
+    def encode(
+        self,
+        texts: Sequence[str],
+        batch_size: int = 64,
+        show_progress_bar: bool = False,
+    ) -> np.ndarray:
+        """Encode texts, computing only those not already in the store."""
+        return self.get(self.add(texts, batch_size=batch_size, show_progress_bar=show_progress_bar))
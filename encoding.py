@@ -0,0 +1,368 @@
+"""High-throughput CPU sentence encoding.
+
+ParallelEncoder is a drop-in `encoder=` for EmbeddingStore. Instead of fixed
+batches of 64 unsorted texts in one process it
+
+- sorts texts by (approximate) token length and cuts batches by a token
+  budget, so short tweets are not padded to the longest text of a batch;
+- spreads the batches over a process pool sized to the physical cores, each
+  worker holding its own model with one intra-op thread;
+- optionally runs the ONNX export of the model, fp32 ("onnx") or dynamically
+  quantized to int8 ("onnx-int8"; sentence-transformers >= 3.2 with optimum
+  and onnxruntime).
+
+int8 embeddings are close to but not identical with fp32 ones, so each ONNX
+backend and model file is cached under its own store namespace
+(ParallelEncoder.cache_name). Check them on a sample before switching a
+month over:
+
+    python encoding.py check --data-dir 2011-12-csv --sample 20000
+
+compares fp32 and int8 embeddings of the same tweets (cosine per text and
+overlap of the 10 nearest neighbours). Encoding a month streams shard chunks
+through the store, which appends each chunk to disk, so RAM stays bounded by
+the chunk size:
+
+    python encoding.py encode --data-dir 2011-12-csv --backend onnx-int8
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import numpy as np
+import pandas as pd
+
+from embedding_cache import EmbeddingStore
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# Quantized export shipped in the sentence-transformers/all-MiniLM-L6-v2 repo;
+# use model_qint8_avx512_vnni.onnx (or a local export) where the CPU has VNNI.
+INT8_FILE = "onnx/model_quint8_avx2.onnx"
+# What sentence-transformers loads for backend="onnx" without a file_name.
+ONNX_FILE = "onnx/model.onnx"
+
+
+def physical_cores() -> int:
+    """Physical CPU cores (hyper-threads share one core's matmul units)."""
+    try:
+        import psutil
+
+        return psutil.cpu_count(logical=False) or os.cpu_count() or 1
+    except ImportError:
+        pass
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            blocks = f.read().split("\n\n")
+        cores = set()
+        for block in blocks:
+            fields = dict(
+                (k.strip(), v.strip()) for k, _, v in (line.partition(":") for line in block.splitlines())
+            )
+            if "core id" in fields:
+                cores.add((fields.get("physical id"), fields["core id"]))
+        if cores:
+            return len(cores)
+    except OSError:
+        pass
+    return os.cpu_count() or 1
+
+
+def approx_token_lengths(texts: Sequence[str]) -> np.ndarray:
+    """Word-piece count estimate (whitespace words plus one per 8 characters); only the order matters."""
+    return np.fromiter((len(t.split()) + len(t) // 8 for t in texts), dtype=np.int64, count=len(texts))
+
+
+def length_batches(lengths: np.ndarray, max_tokens: int = 16_384, max_batch: int = 512) -> list[np.ndarray]:
+    """
+    Index batches over texts sorted by length.
+
+    A batch grows while batch size x its longest text stays within
+    max_tokens, so batches of short tweets are large and long texts come in
+    small batches, with little padding in either.
+    """
+    order = np.argsort(lengths, kind="stable")
+    batches, start = [], 0
+    for i, length in enumerate(lengths[order]):
+        size = i - start
+        if size and (size == max_batch or (size + 1) * max(int(length), 1) > max_tokens):
+            batches.append(order[start:i])
+            start = i
+    if start < len(order):
+        batches.append(order[start:])
+    return batches
+
+
+def load_model(
+    model_name: str = "all-MiniLM-L6-v2",
+    backend: str = "torch",
+    onnx_file: str | None = None,
+    threads: int | None = None,
+):
+    """
+    SentenceTransformer on CPU with the given backend.
+
+    threads caps onnxruntime's intra-op threads; it ignores torch and
+    OMP_NUM_THREADS settings and would otherwise use every core per worker.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}")
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name, device="cpu")
+    model_kwargs = {"file_name": onnx_file or INT8_FILE} if onnx_file or backend == "onnx-int8" else {}
+    if threads:
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        model_kwargs["session_options"] = options
+    return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs or None)
+
+
+_worker_model = None
+
+
+def _init_worker(model_name: str, backend: str, onnx_file: str | None, threads: int):
+    global _worker_model
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    _worker_model = load_model(model_name, backend, onnx_file, threads)
+
+
+def _encode_with(model, texts: list[str], normalize: bool) -> np.ndarray:
+    return model.encode(
+        texts, batch_size=len(texts), normalize_embeddings=normalize, convert_to_numpy=True
+    ).astype(np.float32, copy=False)
+
+
+def _encode_batch(texts: list[str], normalize: bool) -> np.ndarray:
+    return _encode_with(_worker_model, texts, normalize)
+
+
+class ParallelEncoder:
+    """
+    Length-bucketed, multi-process encoder with SentenceTransformer's encode signature.
+
+    The pool (spawned, so parents that already imported torch are safe) is
+    started on first use and kept until close(); workers=1 encodes in process
+    with every physical core as intra-op threads.
+    batch_size passed by callers is ignored in favour of the token budget.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        backend: str = "torch",
+        workers: int | None = None,
+        threads_per_worker: int = 1,
+        max_tokens: int = 16_384,
+        max_batch: int = 512,
+        onnx_file: str | None = None,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}")
+        self.model_name = model_name
+        self.backend = backend
+        self.workers = workers or max(1, physical_cores() // threads_per_worker)
+        self.threads_per_worker = threads_per_worker
+        self.max_tokens = max_tokens
+        self.max_batch = max_batch
+        self.onnx_file = onnx_file
+        self._pool = None
+        self._model = None
+
+    @property
+    def cache_name(self) -> str:
+        """EmbeddingStore model name: ONNX vectors are namespaced by backend and model file."""
+        if self.backend == "torch":
+            return self.model_name
+        onnx_file = self.onnx_file or (INT8_FILE if self.backend == "onnx-int8" else ONNX_FILE)
+        return f"{self.model_name}-{self.backend}-{Path(onnx_file).stem}"
+
+    def _init_args(self) -> tuple:
+        return (self.model_name, self.backend, self.onnx_file, self.threads_per_worker)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=self._init_args(),
+            )
+        return self._pool
+
+    def encode(
+        self,
+        texts: Sequence[str],
+        batch_size: int | None = None,
+        show_progress_bar: bool = False,
+        normalize_embeddings: bool = False,
+        convert_to_numpy: bool = True,
+        **kwargs,
+    ) -> np.ndarray:
+        texts = list(texts)
+        batches = length_batches(approx_token_lengths(texts), self.max_tokens, self.max_batch)
+        if not batches:
+            return np.empty((0, 0), dtype=np.float32)
+        jobs = ([texts[i] for i in batch] for batch in batches)
+
+        start = time.perf_counter()
+        if self.workers == 1:
+            if self._model is None:
+                self._model = load_model(self.model_name, self.backend, self.onnx_file)
+            results = (_encode_with(self._model, job, normalize_embeddings) for job in jobs)
+        else:
+            pool = self._get_pool()
+            results = pool.map(_encode_batch, jobs, [normalize_embeddings] * len(batches))
+
+        out = None
+        for done, (batch, vectors) in enumerate(zip(batches, results), 1):
+            if out is None:
+                out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[batch] = vectors
+            if show_progress_bar and done % 100 == 0:
+                print(f"  {done:,}/{len(batches):,} batches ({time.perf_counter() - start:.0f}s)")
+        return out
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def make_store(encoder: ParallelEncoder, dtype: str = "float32", normalize: bool = True, **kwargs) -> EmbeddingStore:
+    """EmbeddingStore in the encoder's namespace, encoding through it."""
+    return EmbeddingStore(encoder.cache_name, normalize=normalize, dtype=dtype, encoder=encoder, **kwargs)
+
+
+def shard_texts(data_dir: Path, pattern: str = "*.csv", text_col: str = "Text", chunksize: int = 200_000) -> Iterable[list[str]]:
+    """Non-empty texts of every shard, chunk by chunk."""
+    files = sorted(Path(data_dir).glob(pattern))
+    if not files:
+        raise FileNotFoundError(f"No CSV files matching {pattern} in {data_dir}")
+    for path in files:
+        for chunk in pd.read_csv(path, usecols=[text_col], chunksize=chunksize):
+            texts = chunk[text_col].fillna("").astype(str)
+            yield texts[texts.str.strip() != ""].tolist()
+
+
+def sample_texts(chunks: Iterable[list[str]], k: int, seed: int = 0) -> list[str]:
+    """Uniform sample of k texts from a stream of chunks, in one pass (reservoir sampling)."""
+    rng = np.random.default_rng(seed)
+    reservoir: list[str] = []
+    seen = 0
+    for chunk in chunks:
+        fill = min(len(chunk), k - len(reservoir))
+        reservoir.extend(chunk[:fill])
+        # Item i (0-based over the stream) replaces a random slot with probability k / (i + 1).
+        slots = rng.integers(0, np.arange(seen + fill, seen + len(chunk)) + 1)
+        for offset in np.flatnonzero(slots < k):
+            reservoir[slots[offset]] = chunk[fill + offset]
+        seen += len(chunk)
+    return reservoir
+
+
+def encode_to_store(chunks: Iterable[list[str]], store: EmbeddingStore) -> int:
+    """Append every new text of the chunks to the store; returns the texts seen."""
+    seen = 0
+    for texts in chunks:
+        store.add(texts)
+        seen += len(texts)
+    return seen
+
+
+def compare_embeddings(reference: np.ndarray, candidate: np.ndarray, k: int = 10) -> dict:
+    """
+    Agreement of candidate (e.g. int8) with reference (fp32) embeddings of the same texts.
+
+    cosine_*: per-text cosine between the two versions; neighbour_overlap:
+    mean share of each text's k nearest neighbours (by reference cosine)
+    that the candidate also ranks in its top k.
+    """
+    ref = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    cand = candidate / np.maximum(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12)
+    cosine = np.sum(ref * cand, axis=1)
+    k = min(k, len(ref) - 1)
+    overlap = []
+    for start in range(0, len(ref), 1024):
+        rows = np.arange(start, min(start + 1024, len(ref)))
+        neighbours = []
+        for emb in (ref, cand):
+            sim = emb[rows] @ emb.T
+            sim[np.arange(len(rows)), rows] = -np.inf
+            neighbours.append(np.argpartition(-sim, k - 1, axis=1)[:, :k])
+        overlap.extend(len(np.intersect1d(a, b)) / k for a, b in zip(*neighbours))
+    return {
+        "texts": len(ref),
+        "cosine_mean": float(cosine.mean()),
+        "cosine_p01": float(np.quantile(cosine, 0.01)),
+        "cosine_min": float(cosine.min()),
+        f"neighbour_overlap@{k}": float(np.mean(overlap)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Length-bucketed multi-process CPU encoding into the embedding cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    encode = sub.add_parser("encode", help="Encode every tweet of the shards into the embedding cache")
+    check = sub.add_parser("check", help="Compare a backend's embeddings with fp32 torch on a sample")
+    for p in (encode, check):
+        p.add_argument("--data-dir", type=Path, default=Path("2011-12-csv"))
+        p.add_argument("--pattern", default="*.csv")
+        p.add_argument("--text-col", default="Text")
+        p.add_argument("--model", default="all-MiniLM-L6-v2")
+        p.add_argument("--workers", type=int, default=None, help="Encoding processes (default: physical cores)")
+        p.add_argument("--max-tokens", type=int, default=16_384, help="Token budget per batch")
+        p.add_argument("--onnx-file", default=None, help=f"ONNX file in the model repo (int8 default: {INT8_FILE})")
+    encode.add_argument("--backend", choices=BACKENDS, default="torch")
+    encode.add_argument("--dtype", choices=("float32", "float16"), default="float32", help="Embedding storage dtype")
+    encode.add_argument("--chunksize", type=int, default=200_000, help="Texts read and appended per step")
+    check.add_argument("--backend", choices=BACKENDS, default="onnx-int8")
+    check.add_argument("--sample", type=int, default=20_000)
+    check.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    encoder = ParallelEncoder(
+        args.model, args.backend, workers=args.workers, max_tokens=args.max_tokens, onnx_file=args.onnx_file
+    )
+    with encoder:
+        if args.command == "encode":
+            store = make_store(encoder, dtype=args.dtype)
+            start = time.perf_counter()
+            seen = encode_to_store(shard_texts(args.data_dir, args.pattern, args.text_col, args.chunksize), store)
+            elapsed = time.perf_counter() - start
+            print(f"{seen:,} texts, {len(store):,} stored in {store.dir} ({elapsed:.0f}s, {seen / max(elapsed, 1e-9):,.0f} texts/s)")
+            return
+
+        texts = sample_texts(shard_texts(args.data_dir, args.pattern, args.text_col), args.sample, args.seed)
+        with ParallelEncoder(args.model, "torch", workers=args.workers, max_tokens=args.max_tokens) as reference:
+            ref = reference.encode(texts, normalize_embeddings=True)
+        start = time.perf_counter()
+        cand = encoder.encode(texts, normalize_embeddings=True)
+        print(f"{args.backend}: {len(texts) / (time.perf_counter() - start):,.0f} texts/s")
+        for name, value in compare_embeddings(ref, cand).items():
+            print(f"  {name}: {value:.4f}" if isinstance(value, float) else f"  {name}: {value:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""Country assignment from coordinates and country names, without geopandas.
+
+Loads the bundled Natural Earth admin-0 countries (data/naturalearth/) once
+by parsing the .shp/.dbf files directly, and builds:
+
+- a grid index: each cell lists the countries whose part bounding boxes
+  touch it, and cells no border crosses are resolved up front, so most
+  points need no polygon test and the rest are tested against few polygons;
+- vectorized even-odd point-in-polygon tests over whole batches of points;
+- a coastal fallback: a point in no polygon takes the country whose border
+  is nearest, if within COAST_SNAP_DEG degrees. The 1:110m shapes are coarse,
+  so coastal cities (New York, Istanbul) otherwise fall in the sea;
+- a name alias table (English, local and translated Natural Earth names plus
+  a few Twitter spellings such as "Brasil"), so free-text place.country
+  values map to the same ISO 3166-1 alpha-2 codes.
+
+    geo = CountryGeocoder.load()
+    geo.locate(lons, lats)        # -> array of ISO codes ("" outside land)
+    country_code("Brasil")        # -> "BR"
+
+Countries too small for the 1:110m shapes (Singapore, Hong Kong, Bahrain,
+Luxembourg, ...) have no polygon: their points get the surrounding or
+nearest neighbour (Singapore -> "MY"). Use place.country where present.
+"""
+from __future__ import annotations
+
+import re
+import struct
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+NATURAL_EARTH = Path(__file__).resolve().parent / "data" / "naturalearth" / "ne_110m_admin_0_countries" / "ne_110m_admin_0_countries"
+
+# Twitter place.country spellings and common short forms missing from Natural Earth.
+EXTRA_ALIASES = {
+    "usa": "US",
+    "us": "US",
+    "united states": "US",
+    "uk": "GB",
+    "great britain": "GB",
+    "england": "GB",
+    "scotland": "GB",
+    "wales": "GB",
+    "northern ireland": "GB",
+    "the netherlands": "NL",
+    "holland": "NL",
+    "brasil": "BR",
+    "republic of korea": "KR",
+    "korea": "KR",
+    "russian federation": "RU",
+    "turkiye": "TR",
+}
+
+_POINTS_PER_TEST = 4_000_000  # points x edges evaluated at once
+COAST_SNAP_DEG = 0.25  # ~25 km; New York is 0.005 deg and Istanbul 0.11 deg off the 1:110m coast
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def read_dbf(path: Path, encoding: str = "utf-8") -> pd.DataFrame:
+    """Attribute table of a dBase III file (character and numeric fields)."""
+    data = Path(path).read_bytes()
+    n_records, header_len, record_len = struct.unpack("<IHH", data[4:12])
+    fields = []
+    pos = 32
+    while data[pos] != 0x0D:
+        name = data[pos:pos + 11].split(b"\0", 1)[0].decode("ascii")
+        fields.append((name, chr(data[pos + 11]), data[pos + 16]))
+        pos += 32
+
+    columns: dict[str, list] = {name: [] for name, _, _ in fields}
+    for i in range(n_records):
+        record = data[header_len + i * record_len: header_len + (i + 1) * record_len]
+        if record[:1] == b"*":  # deleted
+            continue
+        offset = 1
+        for name, kind, length in fields:
+            raw = record[offset:offset + length].decode(encoding, errors="replace").strip("\x00 ")
+            offset += length
+            if kind in "NF":
+                try:
+                    columns[name].append(float(raw) if raw else np.nan)
+                except ValueError:
+                    columns[name].append(np.nan)
+            else:
+                columns[name].append(raw)
+    return pd.DataFrame(columns)
+
+
+def read_shp_polygons(path: Path) -> list[list[np.ndarray]]:
+    """Rings (each an (n, 2) lon/lat array) of every polygon record, in file order."""
+    data = Path(path).read_bytes()
+    shapes = []
+    pos = 100
+    while pos + 8 <= len(data):
+        _number, length_words = struct.unpack(">ii", data[pos:pos + 8])
+        content = data[pos + 8:pos + 8 + 2 * length_words]
+        pos += 8 + 2 * length_words
+        shape_type = struct.unpack("<i", content[:4])[0]
+        if shape_type == 0:  # null shape
+            shapes.append([])
+            continue
+        if shape_type not in (5, 15, 25):
+            raise ValueError(f"Unsupported shape type {shape_type} in {path}")
+        n_parts, n_points = struct.unpack("<ii", content[36:44])
+        parts = np.frombuffer(content, dtype="<i4", count=n_parts, offset=44)
+        points = np.frombuffer(content, dtype="<f8", count=2 * n_points, offset=44 + 4 * n_parts).reshape(-1, 2)
+        bounds = list(parts) + [n_points]
+        shapes.append([points[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])])
+    return shapes
+
+
+def _normalize_name(name: str) -> str:
+    """Lowercase, accents stripped, punctuation collapsed ("México" -> "mexico")."""
+    name = "".join(ch for ch in unicodedata.normalize("NFKD", str(name)) if not unicodedata.combining(ch))
+    return _NON_WORD.sub(" ", name.lower()).strip()
+
+
+@dataclass
+class _Polygon:
+    """Edges of one country (all rings; even-odd rule handles holes)."""
+
+    code: str
+    x1: np.ndarray
+    y1: np.ndarray
+    x2: np.ndarray
+    y2: np.ndarray
+    bbox: tuple[float, float, float, float]
+
+    def contains(self, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        inside = np.zeros(len(lon), dtype=bool)
+        step = max(1, _POINTS_PER_TEST // max(len(self.x1), 1))
+        for start in range(0, len(lon), step):
+            px = lon[start:start + step, None]
+            py = lat[start:start + step, None]
+            straddles = (self.y1 > py) != (self.y2 > py)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_cross = self.x1 + (py - self.y1) * (self.x2 - self.x1) / (self.y2 - self.y1)
+            crossings = np.count_nonzero(straddles & (px < x_cross), axis=1)
+            inside[start:start + step] = crossings % 2 == 1
+        return inside
+
+    def distance(self, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        """Distance in degrees (plain lon/lat) from each point to the nearest edge."""
+        out = np.empty(len(lon))
+        dx, dy = self.x2 - self.x1, self.y2 - self.y1
+        length2 = np.where((dx != 0) | (dy != 0), dx * dx + dy * dy, 1.0)
+        step = max(1, _POINTS_PER_TEST // max(len(self.x1), 1))
+        for start in range(0, len(lon), step):
+            px = lon[start:start + step, None] - self.x1
+            py = lat[start:start + step, None] - self.y1
+            t = np.clip((px * dx + py * dy) / length2, 0.0, 1.0)
+            out[start:start + step] = np.sqrt(((px - t * dx) ** 2 + (py - t * dy) ** 2).min(axis=1))
+        return out
+
+
+class CountryGeocoder:
+    """Natural Earth countries with a grid index for batched point lookups."""
+
+    def __init__(self, shapes: list[list[np.ndarray]], attributes: pd.DataFrame, cell_deg: float = 1.0):
+        self.cell_deg = cell_deg
+        self.n_lon = int(np.ceil(360 / cell_deg))
+        self.n_lat = int(np.ceil(180 / cell_deg))
+        self.attributes = attributes.reset_index(drop=True)
+        self.codes = np.array([_iso_code(row) for _, row in self.attributes.iterrows()], dtype=object)
+        self.names = self.attributes["NAME"].tolist()
+
+        self.polygons: list[_Polygon] = []
+        cell_country: list[tuple[int, int]] = []
+        for country, rings in enumerate(shapes):
+            rings = [r for r in rings if len(r) >= 3]
+            if not rings:
+                self.polygons.append(None)
+                continue
+            starts = np.concatenate([r[:-1] for r in rings])
+            ends = np.concatenate([r[1:] for r in rings])
+            lo, hi = starts.min(axis=0), starts.max(axis=0)
+            self.polygons.append(_Polygon(
+                self.codes[country], starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1],
+                (lo[0], lo[1], hi[0], hi[1]),
+            ))
+            # Register each ring's bounding box separately so far-flung parts
+            # (e.g. Alaska, overseas territories) don't cover whole oceans.
+            for ring in rings:
+                (x0, y0), (x1, y1) = ring.min(axis=0), ring.max(axis=0)
+                cx = np.arange(self._col(x0), self._col(x1) + 1)
+                cy = np.arange(self._row(y0), self._row(y1) + 1)
+                cells = (cy[:, None] * self.n_lon + cx[None, :]).ravel()
+                cell_country.extend((int(c), country) for c in cells)
+
+        pairs = np.unique(np.array(cell_country, dtype=np.int64), axis=0)
+        counts = np.bincount(pairs[:, 0], minlength=self.n_lat * self.n_lon)
+        self.cell_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.cell_offsets[1:])
+        self.cell_countries = pairs[:, 1]
+        self.cell_owner = self._resolve_interior_cells()
+
+        self.aliases = _build_aliases(self.attributes, self.codes)
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def load(cls, base: Path = NATURAL_EARTH, cell_deg: float = 1.0) -> "CountryGeocoder":
+        """Parse the shapefile once per process (cached)."""
+        base = Path(base)
+        cpg = base.with_suffix(".cpg")
+        encoding = cpg.read_text().strip() if cpg.exists() else "utf-8"
+        return cls(read_shp_polygons(base.with_suffix(".shp")), read_dbf(base.with_suffix(".dbf"), encoding), cell_deg)
+
+    def _resolve_interior_cells(self) -> np.ndarray:
+        """
+        Per cell: the country owning all of it, -1 for no country, or -2 when
+        a border crosses the cell and points must be tested individually.
+        """
+        n_cells = self.n_lat * self.n_lon
+        crossed = np.zeros(n_cells, dtype=bool)
+        for polygon in self.polygons:
+            if polygon is None:
+                continue
+            c0 = self._col(np.minimum(polygon.x1, polygon.x2))
+            c1 = self._col(np.maximum(polygon.x1, polygon.x2))
+            r0 = self._row(np.minimum(polygon.y1, polygon.y2))
+            r1 = self._row(np.maximum(polygon.y1, polygon.y2))
+            for a, b, c, d in zip(r0, r1, c0, c1):
+                crossed.reshape(self.n_lat, self.n_lon)[a:b + 1, c:d + 1] = True
+
+        owner = np.where(crossed, -2, -1).astype(np.int64)
+        # A border-free cell lies wholly inside or outside each candidate; its center decides.
+        candidates = np.flatnonzero(~crossed & (np.diff(self.cell_offsets) > 0))
+        rows, cols = np.divmod(candidates, self.n_lon)
+        centers_lon = (cols + 0.5) * self.cell_deg - 180
+        centers_lat = (rows + 0.5) * self.cell_deg - 90
+        owner[candidates] = self._test_points(centers_lon, centers_lat, candidates)
+        return owner
+
+    def _col(self, lon) -> np.ndarray:
+        return np.clip(np.floor((np.asarray(lon) + 180) / self.cell_deg).astype(np.int64), 0, self.n_lon - 1)
+
+    def _row(self, lat) -> np.ndarray:
+        return np.clip(np.floor((np.asarray(lat) + 90) / self.cell_deg).astype(np.int64), 0, self.n_lat - 1)
+
+    def _candidates(self, points: np.ndarray, cells: np.ndarray):
+        """(country, points) for every country listed in the given (point, cell) pairs."""
+        starts = self.cell_offsets[cells]
+        n_candidates = self.cell_offsets[cells + 1] - starts
+        point_idx = np.repeat(points, n_candidates)
+        run_starts = np.cumsum(n_candidates) - n_candidates
+        country_idx = self.cell_countries[
+            np.repeat(starts - run_starts, n_candidates) + np.arange(n_candidates.sum())
+        ]
+        if not len(country_idx):
+            return
+        # Unique pairs as one int64 key, sorted by country.
+        span = int(point_idx.max()) + 1
+        country_idx, point_idx = np.divmod(np.unique(country_idx * span + point_idx), span)
+        bounds = np.flatnonzero(np.diff(country_idx)) + 1
+        yield from zip(country_idx[np.r_[0, bounds]], np.split(point_idx, bounds))
+
+    def _test_points(self, lon: np.ndarray, lat: np.ndarray, cells: np.ndarray) -> np.ndarray:
+        """Point-in-polygon against the candidates of each point's cell; -1 when none contains it."""
+        result = np.full(len(lon), -1, dtype=np.int64)
+        for country, points in self._candidates(np.arange(len(lon)), cells):
+            points = points[result[points] < 0]
+            polygon = self.polygons[country]
+            x0, y0, x1, y1 = polygon.bbox
+            px, py = lon[points], lat[points]
+            points = points[(px >= x0) & (px <= x1) & (py >= y0) & (py <= y1)]
+            if len(points):
+                hit = polygon.contains(lon[points], lat[points])
+                result[points[hit]] = country
+        return result
+
+    def _nearest(self, lon: np.ndarray, lat: np.ndarray, max_deg: float) -> np.ndarray:
+        """Country with the nearest border within max_deg degrees of each point, -1 when none."""
+        result = np.full(len(lon), -1, dtype=np.int64)
+        best = np.full(len(lon), np.inf)
+        reach = np.arange(-int(np.ceil(max_deg / self.cell_deg)), int(np.ceil(max_deg / self.cell_deg)) + 1)
+        rows = np.clip(self._row(lat)[:, None, None] + reach[None, :, None], 0, self.n_lat - 1)
+        cols = np.clip(self._col(lon)[:, None, None] + reach[None, None, :], 0, self.n_lon - 1)
+        cells = (rows * self.n_lon + cols).reshape(len(lon), -1)
+        # Only points with land or a border in reach can be near a country.
+        near = np.flatnonzero((self.cell_owner[cells] != -1).any(axis=1))
+        cells = cells[near]
+        points = np.repeat(near, cells.shape[1])
+        for country, points in self._candidates(points, cells.ravel()):
+            x0, y0, x1, y1 = self.polygons[country].bbox
+            px, py = lon[points], lat[points]
+            points = points[(px >= x0 - max_deg) & (px <= x1 + max_deg) & (py >= y0 - max_deg) & (py <= y1 + max_deg)]
+            if len(points):
+                dist = self.polygons[country].distance(lon[points], lat[points])
+                closer = (dist <= max_deg) & (dist < best[points])
+                best[points[closer]] = dist[closer]
+                result[points[closer]] = country
+        return result
+
+    def locate_index(
+        self, lons: Iterable[float], lats: Iterable[float], snap_deg: float = COAST_SNAP_DEG
+    ) -> np.ndarray:
+        """
+        Row in self.attributes containing each point, -1 when none (or invalid).
+
+        A point in no country takes the nearest one within snap_deg degrees
+        (0 disables the fallback).
+        """
+        lon = np.asarray(lons, dtype=np.float64)
+        lat = np.asarray(lats, dtype=np.float64)
+        result = np.full(len(lon), -1, dtype=np.int64)
+        valid = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat) & (np.abs(lon) <= 180) & (np.abs(lat) <= 90))
+        if not len(valid):
+            return result
+
+        cells = self._row(lat[valid]) * self.n_lon + self._col(lon[valid])
+        owner = self.cell_owner[cells]
+        result[valid] = owner
+        border = owner == -2
+        if border.any():
+            idx = valid[border]
+            result[idx] = self._test_points(lon[idx], lat[idx], cells[border])
+        if snap_deg > 0:
+            idx = valid[result[valid] < 0]
+            if len(idx):
+                result[idx] = self._nearest(lon[idx], lat[idx], snap_deg)
+        return result
+
+    def locate(
+        self,
+        lons: Iterable[float],
+        lats: Iterable[float],
+        batch_size: int = 1_000_000,
+        snap_deg: float = COAST_SNAP_DEG,
+    ) -> np.ndarray:
+        """ISO alpha-2 code per point ("" when it falls in no country within snap_deg)."""
+        lon = np.asarray(lons, dtype=np.float64)
+        lat = np.asarray(lats, dtype=np.float64)
+        codes = np.empty(len(lon), dtype=object)
+        lookup = np.append(self.codes, "")
+        for start in range(0, len(lon), batch_size):
+            index = self.locate_index(lon[start:start + batch_size], lat[start:start + batch_size], snap_deg)
+            codes[start:start + batch_size] = lookup[index]
+        return codes
+
+    def code_for_name(self, name: str | None) -> str:
+        """ISO code for a country name or code in any known spelling, "" if unknown."""
+        if not name or not isinstance(name, str):
+            return ""
+        key = _normalize_name(name)
+        if key in self.aliases:
+            return self.aliases[key]
+        upper = name.strip().upper()
+        return upper if upper in set(self.codes) else ""
+
+    def name_for_code(self, code: str) -> str:
+        matches = np.flatnonzero(self.codes == code)
+        return self.names[matches[0]] if len(matches) else ""
+
+
+def _iso_code(row: pd.Series) -> str:
+    """ISO_A2, falling back to ISO_A2_EH / WB_A2 where Natural Earth has -99 (e.g. France, Norway)."""
+    for col in ("ISO_A2", "ISO_A2_EH", "WB_A2"):
+        value = str(row.get(col, "") or "").strip()
+        if len(value) == 2 and value.isalpha():
+            return value.upper()
+    return ""
+
+
+def _build_aliases(attributes: pd.DataFrame, codes: np.ndarray) -> dict[str, str]:
+    name_cols = [c for c in attributes.columns if c == "ADMIN" or c == "FORMAL_EN" or c.startswith("NAME")]
+    name_cols = [c for c in name_cols if pd.api.types.is_string_dtype(attributes[c])]
+    aliases: dict[str, str] = {}
+    # English names first so they win over translated names that collide.
+    ordered = [c for c in ("NAME", "NAME_LONG", "ADMIN", "FORMAL_EN", "NAME_EN", "NAME_SORT") if c in name_cols]
+    ordered += [c for c in name_cols if c not in ordered]
+    for col in ordered:
+        for name, code in zip(attributes[col], codes):
+            key = _normalize_name(name) if name else ""
+            if key and code and key not in aliases:
+                aliases[key] = code
+    aliases.update(EXTRA_ALIASES)
+    return aliases
+
+
+def country_code(name: str | None) -> str:
+    """ISO alpha-2 code for a free-text country name ("Brasil" -> "BR"), "" if unknown."""
+    return CountryGeocoder.load().code_for_name(name)
+
+
+def country_codes(names: pd.Series) -> pd.Series:
+    """Vectorized country_code(): each distinct value is resolved once."""
+    geocoder = CountryGeocoder.load()
+    unique = names.dropna().unique()
+    mapping = {name: geocoder.code_for_name(name) for name in unique}
+    return names.map(mapping).fillna("")
+
+
+def country_options() -> list[tuple[str, str]]:
+    """(name, ISO code) of every country with a code, sorted by name."""
+    geocoder = CountryGeocoder.load()
+    return sorted({(name, code) for name, code in zip(geocoder.names, geocoder.codes) if code})
@@ -0,0 +1,260 @@
+"""Incremental topic modelling across daily tweet shards.
+
+A reference BERTopic model is fitted once (on one day or a sample of days) and
+saved. Every day is then assigned to the reference topics without refitting:
+
+- `approximate`: UMAP.transform + HDBSCAN approximate_predict (BERTopic.transform)
+- `embedding`: cosine similarity of document embeddings to topic embeddings
+
+With `--update`, each day's outliers are fitted into a small model that is
+merged into the reference (BERTopic.merge_models), so new topics can appear
+as shards arrive. The merged model is saved to --updated-model-path; the
+reference file is never overwritten, so every run starts from the same
+reference. Merged topics have no HDBSCAN cluster, so updating always
+assigns with the `embedding` method, and needs a positive --min-similarity
+(default 0.4) for any doc to be an outlier at all. Because every day shares
+one topic space, the per-day distributions are directly comparable.
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bertopic import BERTopic
+from umap import UMAP
+from hdbscan import HDBSCAN
+from sklearn.feature_extraction.text import CountVectorizer
+
+from dedup import collapse_duplicates
+from embedding_cache import EmbeddingStore
+
+TEXT_COL = "Text"
+# Cosine similarity to the nearest topic below which --update treats a doc as new.
+UPDATE_MIN_SIMILARITY = 0.4
+
+
+def load_day_texts(csv_path: Path) -> list[str]:
+    df = pd.read_csv(csv_path, usecols=[TEXT_COL])
+    texts = df[TEXT_COL].fillna("").astype(str).tolist()
+    return [t for t in texts if t.strip()]
+
+
+def build_model(min_cluster_size: int = 15) -> BERTopic:
+    umap_model = UMAP(
+        n_neighbors=15,
+        n_components=5,
+        min_dist=0.0,
+        metric="cosine",
+        random_state=42,
+    )
+    hdbscan_model = HDBSCAN(
+        min_cluster_size=min_cluster_size,
+        metric="euclidean",
+        cluster_selection_method="eom",
+        prediction_data=True,
+    )
+    vectorizer_model = CountVectorizer(
+        stop_words="english",
+        ngram_range=(1, 2),
+        min_df=2,
+    )
+    # No dense doc x topic probabilities: assignment only needs labels.
+    return BERTopic(
+        umap_model=umap_model,
+        hdbscan_model=hdbscan_model,
+        vectorizer_model=vectorizer_model,
+        calculate_probabilities=False,
+        verbose=True,
+    )
+
+
+def fit_reference(
+    texts: list[str],
+    store: EmbeddingStore,
+    sample_size: int | None = None,
+    seed: int = 42,
+) -> BERTopic:
+    """Fit the reference model on texts (or a random sample of them)."""
+    if sample_size is not None and len(texts) > sample_size:
+        rng = np.random.default_rng(seed)
+        idx = np.sort(rng.choice(len(texts), size=sample_size, replace=False))
+        texts = [texts[i] for i in idx]
+    embeddings = store.encode(texts, show_progress_bar=True)
+    model = build_model()
+    model.fit(texts, embeddings)
+    return model
+
+
+def assign_topics(
+    model: BERTopic,
+    texts: list[str],
+    embeddings: np.ndarray,
+    method: str = "approximate",
+    min_similarity: float = 0.0,
+) -> np.ndarray:
+    """Assign texts to the model's existing topics without refitting."""
+    if method == "approximate":
+        topics, _ = model.transform(texts, embeddings)
+        return np.asarray(topics)
+    if method != "embedding":
+        raise ValueError("method must be 'approximate' or 'embedding'")
+
+    topic_ids = np.array(sorted(model.topic_representations_))
+    topic_emb = np.asarray(model.topic_embeddings_, dtype=np.float32)
+    keep = topic_ids != -1
+    topic_ids, topic_emb = topic_ids[keep], topic_emb[keep]
+    topic_emb /= np.linalg.norm(topic_emb, axis=1, keepdims=True)
+
+    doc_emb = np.asarray(embeddings, dtype=np.float32)
+    doc_emb = doc_emb / np.maximum(np.linalg.norm(doc_emb, axis=1, keepdims=True), 1e-12)
+    sims = doc_emb @ topic_emb.T
+    best = sims.argmax(axis=1)
+    topics = topic_ids[best]
+    topics[sims[np.arange(len(best)), best] < min_similarity] = -1
+    return topics
+
+
+def merge_outlier_topics(
+    model: BERTopic,
+    texts: list[str],
+    embeddings: np.ndarray,
+    topics: np.ndarray,
+    min_outliers: int = 500,
+    min_similarity: float = 0.7,
+) -> BERTopic:
+    """Fit the day's outliers and merge any genuinely new topics into model."""
+    outliers = np.flatnonzero(topics == -1)
+    if len(outliers) < min_outliers:
+        print(f"No merge: {len(outliers):,} outliers, fewer than {min_outliers:,}")
+        return model
+    day_model = build_model()
+    day_model.fit([texts[i] for i in outliers], embeddings[outliers])
+    merged = BERTopic.merge_models([model, day_model], min_similarity=min_similarity)
+    n_new = len(merged.topic_representations_) - len(model.topic_representations_)
+    print(f"Merged {n_new} new topics from {len(outliers):,} outliers")
+    return merged
+
+
+def run_incremental(
+    data_dir: Path,
+    output_dir: Path,
+    reference_days: list[str],
+    model_path: Path,
+    pattern: str = "*.csv",
+    sample_size: int | None = 50_000,
+    method: str = "approximate",
+    update: bool = False,
+    min_similarity: float | None = None,
+    updated_model_path: Path | None = None,
+) -> pd.DataFrame:
+    """
+    Assign every shard to the reference topics; returns day x topic counts.
+
+    min_similarity defaults to 0.0, or UPDATE_MIN_SIMILARITY with update.
+    With update, merged models are saved to updated_model_path (default:
+    <model_path stem>_updated next to it), never over model_path.
+    """
+    if min_similarity is None:
+        min_similarity = UPDATE_MIN_SIMILARITY if update else 0.0
+    if update and min_similarity <= 0:
+        raise ValueError("update needs min_similarity > 0, otherwise no doc is ever an outlier")
+    if updated_model_path is None:
+        updated_model_path = model_path.with_name(f"{model_path.stem}_updated{model_path.suffix}")
+    if update and Path(updated_model_path).resolve() == Path(model_path).resolve():
+        raise ValueError("updated_model_path must differ from the reference model_path")
+    files = sorted(Path(data_dir).glob(pattern))
+    if not files:
+        raise FileNotFoundError(f"No CSV files matching {pattern} in {data_dir}")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    store = EmbeddingStore("all-MiniLM-L6-v2", normalize=True)
+
+    if model_path.exists():
+        model = BERTopic.load(str(model_path))
+        print(f"Loaded reference model from {model_path}")
+    else:
+        ref_texts = []
+        for day in reference_days:
+            ref_texts.extend(load_day_texts(Path(data_dir) / f"{day}.csv"))
+        model = fit_reference(ref_texts, store, sample_size=sample_size)
+        model.save(str(model_path), serialization="pickle")
+        print(f"Saved reference model -> {model_path}")
+
+    if update:
+        method = "embedding"
+
+    per_day = {}
+    for csv_path in files:
+        texts = load_day_texts(csv_path)
+        if not texts:
+            per_day[csv_path.stem] = pd.Series(dtype=int)
+            continue
+
+        dedup = collapse_duplicates(texts)
+        rep_texts = [texts[i] for i in dedup.representatives]
+        embeddings = store.encode(rep_texts)
+        rep_topics = assign_topics(model, rep_texts, embeddings, method=method, min_similarity=min_similarity)
+
+        if update:
+            merged = merge_outlier_topics(model, rep_texts, embeddings, rep_topics)
+            if merged is not model:
+                model = merged
+                model.save(str(updated_model_path), serialization="pickle")
+                rep_topics = assign_topics(model, rep_texts, embeddings, method=method, min_similarity=min_similarity)
+
+        topics = dedup.expand(rep_topics)
+        pd.DataFrame({"text": texts, "topic": topics}).to_csv(
+            output_dir / f"doc_topics_{csv_path.stem}.csv", index=False
+        )
+        per_day[csv_path.stem] = pd.Series(topics).value_counts()
+        n_outliers = int((topics == -1).sum())
+        print(f"{csv_path.stem}: {len(texts):,} docs, outliers {n_outliers / len(texts):.3f}")
+
+    distribution = pd.DataFrame(per_day).T.fillna(0).astype(int).sort_index(axis=1)
+    distribution.index.name = "day"
+    distribution.to_csv(output_dir / "topic_distribution.csv")
+    model.get_topic_info().to_csv(output_dir / "topic_info.csv", index=False)
+    return distribution
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assign daily tweet shards to one reference topic model.")
+    parser.add_argument("--data-dir", type=Path, default=Path("2011-12-csv"))
+    parser.add_argument("--pattern", default="*.csv")
+    parser.add_argument("--output-dir", type=Path, default=Path("topics_2011-12"))
+    parser.add_argument("--reference-day", action="append", default=None,
+                        help="Day(s) the reference model is fitted on (repeatable; default: 2011-12-01)")
+    parser.add_argument("--sample-size", type=int, default=50_000,
+                        help="Max reference docs sampled from the reference days (default: 50000)")
+    parser.add_argument("--model-path", type=Path, default=None,
+                        help="Reference model file; fitted and saved if missing (default: <output-dir>/reference_model.pkl)")
+    parser.add_argument("--method", choices=["approximate", "embedding"], default="approximate")
+    parser.add_argument("--min-similarity", type=float, default=None,
+                        help="Embedding method only: below this cosine similarity a doc is an outlier "
+                             f"(default: 0.0, or {UPDATE_MIN_SIMILARITY} with --update)")
+    parser.add_argument("--update", action="store_true", help="Merge new topics found in each day's outliers")
+    parser.add_argument("--updated-model-path", type=Path, default=None,
+                        help="Where --update saves the merged model (default: <model-path stem>_updated.pkl)")
+    args = parser.parse_args()
+    if args.update and args.min_similarity is not None and args.min_similarity <= 0:
+        parser.error("--update needs --min-similarity > 0, otherwise no doc is ever an outlier")
+
+    distribution = run_incremental(
+        data_dir=args.data_dir,
+        output_dir=args.output_dir,
+        reference_days=args.reference_day or ["2011-12-01"],
+        model_path=args.model_path or args.output_dir / "reference_model.pkl",
+        pattern=args.pattern,
+        sample_size=args.sample_size,
+        method=args.method,
+        update=args.update,
+        min_similarity=args.min_similarity,
+        updated_model_path=args.updated_model_path,
+    )
+    print(f"\nTopic distribution: {distribution.shape[0]} days x {distribution.shape[1]} topics")
+
+
+if __name__ == "__main__":
+    main()
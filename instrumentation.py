@@ -0,0 +1,386 @@
+"""Per-stage timing, memory and row-flow metrics for pipeline runs.
+
+Pipeline stages and filter functions report into one process-wide recorder:
+
+    from instrumentation import configure, stage
+
+    configure(enabled=True, trace_memory=True, profile="cprofile")
+    with stage("filter", rows_in=len(df)) as s:
+        out = do_filter(df)
+        s.update(rows_out=len(out))
+    save_report("run_metrics.json")
+
+Every stage records wall and CPU time, resident memory (start, end and the
+peak reached inside the stage), optionally the tracemalloc peak, rows in/out
+and throughput. Stages nest; the report lists them in start order with their
+parent path. On Linux the RSS high-water mark is reset per stage through
+/proc/self/clear_refs, elsewhere rss_peak_mb is the process-lifetime peak.
+
+Disabled (the default), stage() returns a shared no-op context and
+@instrumented calls the function directly, so instrumentation can stay in
+the code paths of production runs. Enabled, a stage costs roughly 0.1 ms
+(more for very large processes, as resetting the RSS peak walks the page
+tables), so stages should be coarse. Profiling wraps each outermost profiled
+stage in cProfile (.prof files) or pyinstrument (.html, optional package).
+"""
+from __future__ import annotations
+
+import cProfile
+import functools
+import json
+import os
+import platform
+import re
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+_PROC_STATUS = Path("/proc/self/status")
+_CLEAR_REFS = Path("/proc/self/clear_refs")
+# ru_maxrss is in KiB on Linux and bytes on macOS.
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def _proc_status_mb(field: str) -> float | None:
+    try:
+        with _PROC_STATUS.open("r") as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def rss_mb() -> float | None:
+    """Current resident set size (Linux only)."""
+    return _proc_status_mb("VmRSS:")
+
+
+def _peak_rss_mb() -> float:
+    peak = _proc_status_mb("VmHWM:")
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNIT / 2**20
+    return peak
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's RSS high-water mark; False where that is unsupported."""
+    try:
+        with _CLEAR_REFS.open("w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class StageRecord:
+    """Metrics of one stage; update() adds row counts and free-form fields."""
+
+    def __init__(self, index: int, name: str, path: str, depth: int, rows_in: int | None):
+        self.index = index
+        self.name = name
+        self.path = path
+        self.depth = depth
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.extra: dict = {}
+        self.start_s = 0.0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.rss_start_mb = None
+        self.rss_end_mb = None
+        self.rss_peak_mb = 0.0
+        self.traced_peak_mb = None
+        self.profile = None
+        self.error = None
+
+    def update(self, rows_in: int | None = None, rows_out: int | None = None, **extra):
+        if rows_in is not None:
+            self.rows_in = int(rows_in)
+        if rows_out is not None:
+            self.rows_out = int(rows_out)
+        self.extra.update(extra)
+
+    def to_dict(self) -> dict:
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        return {
+            "index": self.index,
+            "name": self.name,
+            "path": self.path,
+            "depth": self.depth,
+            "start_s": round(self.start_s, 6),
+            "wall_s": round(self.wall_s, 6),
+            "cpu_s": round(self.cpu_s, 6),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_per_s": round(rows / self.wall_s, 1) if rows is not None and self.wall_s > 0 else None,
+            "rss_start_mb": self.rss_start_mb,
+            "rss_end_mb": self.rss_end_mb,
+            "rss_peak_mb": round(self.rss_peak_mb, 1),
+            "traced_peak_mb": self.traced_peak_mb,
+            "profile": self.profile,
+            "error": self.error,
+            **self.extra,
+        }
+
+
+class _NullStage:
+    """Stand-in returned while the recorder is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def update(self, rows_in=None, rows_out=None, **extra):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, recorder: "Recorder", name: str, rows_in: int | None):
+        self.recorder = recorder
+        self.name = name
+        self.rows_in = rows_in
+        self.record: StageRecord | None = None
+        self._profiler = None
+
+    def __enter__(self) -> StageRecord:
+        rec = self.recorder
+        stack = rec._stack
+        path = "/".join([s.name for s in stack] + [self.name])
+        record = self.record = StageRecord(len(rec.stages), self.name, path, len(stack), self.rows_in)
+        rec.stages.append(record)
+
+        # Fold the running peaks into the open parents before resetting them,
+        # so each stage sees its own peak and parents still see their children's.
+        rec._fold_peaks()
+        rec._rss_resettable = _reset_peak_rss()
+        if rec.trace_memory:
+            tracemalloc.reset_peak()
+        stack.append(record)
+
+        record.rss_start_mb = rss_mb()
+        if rec.profile and rec._active_profiler is None and rec._should_profile(self.name):
+            self._profiler = rec._start_profiler()
+        record.start_s = time.perf_counter() - rec._t0
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return record
+
+    def __exit__(self, exc_type, exc, tb):
+        rec = self.recorder
+        record = self.record
+        record.wall_s = time.perf_counter() - self._wall
+        record.cpu_s = time.process_time() - self._cpu
+        if self._profiler is not None:
+            record.profile = rec._stop_profiler(self._profiler, record)
+        if exc_type is not None:
+            record.error = f"{exc_type.__name__}: {exc}"
+        record.rss_end_mb = rss_mb()
+        rec._fold_peaks()
+        rec._stack.pop()
+        return False
+
+
+class Recorder:
+    """Collects StageRecords for one run; see configure() for the options."""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        trace_memory: bool = False,
+        profile: str | None = None,
+        profile_dir: Path = Path("profiles"),
+        profile_stages: set[str] | None = None,
+    ):
+        if profile is not None and profile not in PROFILERS:
+            raise ValueError(f"profile must be one of {PROFILERS}")
+        self.enabled = enabled
+        self.trace_memory = trace_memory and enabled
+        self.profile = profile if enabled else None
+        self.profile_dir = Path(profile_dir)
+        self.profile_stages = set(profile_stages) if profile_stages else None
+        self.stages: list[StageRecord] = []
+        self.started = datetime.now(timezone.utc)
+        self._t0 = time.perf_counter()
+        self._stack: list[StageRecord] = []
+        self._active_profiler = None
+        self._rss_resettable = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name: str, rows_in: int | None = None):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, rows_in)
+
+    def _fold_peaks(self):
+        if not self._stack:
+            return
+        peak = _peak_rss_mb()
+        traced = tracemalloc.get_traced_memory()[1] / 2**20 if self.trace_memory else None
+        for record in self._stack:
+            record.rss_peak_mb = max(record.rss_peak_mb, peak)
+            if traced is not None:
+                record.traced_peak_mb = round(max(record.traced_peak_mb or 0.0, traced), 2)
+
+    def _should_profile(self, name: str) -> bool:
+        return self.profile_stages is None or name in self.profile_stages
+
+    def _start_profiler(self):
+        if self.profile == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError as exc:
+                raise ImportError("profile='pyinstrument' requires the 'pyinstrument' package") from exc
+            profiler = Profiler()
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        self._active_profiler = profiler
+        return profiler
+
+    def _stop_profiler(self, profiler, record: StageRecord) -> str:
+        self._active_profiler = None
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{self.started:%Y%m%dT%H%M%S}-{record.index:03d}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', record.path)}"
+        if self.profile == "pyinstrument":
+            profiler.stop()
+            out = self.profile_dir / f"{stem}.html"
+            out.write_text(profiler.output_html(), encoding="utf-8")
+        else:
+            profiler.disable()
+            out = self.profile_dir / f"{stem}.prof"
+            profiler.dump_stats(out)
+        return str(out)
+
+    def report(self) -> dict:
+        return {
+            "run": {
+                "started": self.started.isoformat(timespec="seconds"),
+                "argv": sys.argv,
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "pid": os.getpid(),
+                "wall_s": round(time.perf_counter() - self._t0, 6),
+                "rss_peak_per_stage": self._rss_resettable,
+                "trace_memory": self.trace_memory,
+                "profile": self.profile,
+            },
+            "stages": [record.to_dict() for record in self.stages],
+        }
+
+    def save(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=1, default=str)
+        os.replace(tmp, path)
+        return path
+
+    def summary(self) -> str:
+        """Plain-text table of the stages, indented by depth."""
+        lines = [f"{'stage':<40} {'wall s':>9} {'cpu s':>9} {'rows in':>11} {'rows out':>11} {'peak MB':>9}"]
+        for r in self.stages:
+            rows_in = f"{r.rows_in:,}" if r.rows_in is not None else ""
+            rows_out = f"{r.rows_out:,}" if r.rows_out is not None else ""
+            label = ("  " * r.depth + r.name)[:40]
+            lines.append(f"{label:<40} {r.wall_s:>9.2f} {r.cpu_s:>9.2f} {rows_in:>11} {rows_out:>11} {r.rss_peak_mb:>9.0f}")
+        return "\n".join(lines)
+
+
+_recorder = Recorder()
+
+
+def configure(
+    enabled: bool = True,
+    trace_memory: bool = False,
+    profile: str | None = None,
+    profile_dir: Path = Path("profiles"),
+    profile_stages: set[str] | None = None,
+) -> Recorder:
+    """
+    Start a new run, replacing the current recorder.
+
+    trace_memory starts tracemalloc (Python allocations, noticeably slower).
+    profile is "cprofile" or "pyinstrument"; only outermost profiled stages
+    get a profiler, restricted to profile_stages when given.
+    """
+    global _recorder
+    _recorder = Recorder(enabled, trace_memory, profile, profile_dir, profile_stages)
+    return _recorder
+
+
+def get_recorder() -> Recorder:
+    return _recorder
+
+
+def stage(name: str, rows_in: int | None = None):
+    """Context manager timing one stage of the current run (a no-op while disabled)."""
+    return _recorder.stage(name, rows_in)
+
+
+def save_report(path: Path) -> Path:
+    return _recorder.save(path)
+
+
+def _row_count(value) -> int | None:
+    if hasattr(value, "shape") and getattr(value, "ndim", 0) >= 1:
+        return int(value.shape[0])
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    return None
+
+
+def instrumented(name: str | None = None, rows_out: bool = True) -> Callable:
+    """
+    Decorator recording a function call as a stage.
+
+    rows_in is the length of the first argument (DataFrame, array or list)
+    and rows_out the length of the result when rows_out is True.
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _recorder.enabled:
+                return func(*args, **kwargs)
+            with _recorder.stage(stage_name, _row_count(args[0]) if args else None) as record:
+                result = func(*args, **kwargs)
+                if rows_out:
+                    record.update(rows_out=_row_count(result))
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_methods(obj, name: str, methods=("fit", "fit_transform", "transform", "predict")):
+    """
+    Record calls of obj's methods (e.g. a UMAP or HDBSCAN model used inside
+    BERTopic) as stages named "<name>.<method>". Patches the instance, so the
+    object no longer pickles; only call it when the recorder is enabled.
+    """
+    for method in methods:
+        bound = getattr(obj, method, None)
+        if bound is None:
+            continue
+        setattr(obj, method, instrumented(f"{name}.{method}", rows_out=False)(bound))
+    return obj
@@ -0,0 +1,315 @@
+"""Single-pass aggregate scanner for the NDJSON tweet dump.
+
+Every shard is read once and all requested aggregates are computed in that
+pass, one shard per worker process. Aggregates are Counters (plus a 1-degree
+coordinate grid), so per-shard results merge by addition. Shards are read
+plain or compressed (.json.gz, .json.zst) through ndjson_io. orjson is used to
+decode lines when installed, the stdlib json module otherwise; a scan that
+only needs line counts does not decode JSON at all.
+
+Aggregates:
+    lines     raw line count
+    daily     tweets per UTC date (from created_at; tweets without a
+              parseable one are counted in ScanResult.undated)
+    hourly    tweets per UTC hour of day
+    weekday   tweets per weekday
+    country   place.country
+    geo       coverage of place / bounding box / coordinates fields
+    hashtags  lowercased entities.hashtags
+    mentions  lowercased entities.user_mentions
+    sources   source field
+    lang      user.lang
+    retweets  retweet_count values
+    grid      180 x 360 coordinate histogram (lat, lon)
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from ndjson_io import list_shards, loads, open_ndjson
+
+AGGREGATES = (
+    "lines", "daily", "hourly", "weekday", "country", "geo",
+    "hashtags", "mentions", "sources", "lang", "retweets", "grid",
+)
+COUNTER_AGGREGATES = tuple(a for a in AGGREGATES if a not in ("lines", "grid"))
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+_WEEKDAY_NAMES = {day[:3]: day for day in WEEKDAYS}
+_MONTHS = {m: f"{i:02d}" for i, m in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], start=1
+)}
+_GRID_SHAPE = (180, 360)
+# Twitter format: "Wed Dec 07 00:00:01 +0000 2011" (always UTC).
+_CREATED_AT = re.compile(r"(\w{3}) (\w{3}) (\d{2}) (\d{2}):\d{2}:\d{2} [+-]\d{4} (\d{4})")
+
+
+@dataclass
+class ScanResult:
+    """Mergeable aggregates for one or more shards."""
+
+    lines: int = 0
+    undated: int = 0
+    counters: dict[str, Counter] = field(default_factory=dict)
+    grid: np.ndarray | None = None
+    files: list[str] = field(default_factory=list)
+
+    def merge(self, other: "ScanResult") -> "ScanResult":
+        self.lines += other.lines
+        self.undated += other.undated
+        for name, counter in other.counters.items():
+            self.counters.setdefault(name, Counter()).update(counter)
+        if other.grid is not None:
+            self.grid = other.grid.copy() if self.grid is None else self.grid + other.grid
+        self.files.extend(other.files)
+        return self
+
+    def top(self, name: str, n: int = 15) -> pd.DataFrame:
+        """Most common values of one counter aggregate."""
+        return pd.DataFrame(self.counters.get(name, Counter()).most_common(n), columns=[name, "count"])
+
+    def daily_frame(self) -> pd.DataFrame:
+        daily = pd.DataFrame(sorted(self.counters.get("daily", Counter()).items()), columns=["date", "tweet_count"])
+        daily["weekday"] = pd.to_datetime(daily["date"], format="%Y-%m-%d").dt.day_name()
+        return daily
+
+    def weekday_frame(self) -> pd.DataFrame:
+        weekday = self.counters.get("weekday", Counter())
+        return pd.DataFrame([(w, weekday.get(w, 0)) for w in WEEKDAYS], columns=["weekday", "tweet_count"])
+
+    def hourly_frame(self) -> pd.DataFrame:
+        hourly = self.counters.get("hourly", Counter())
+        return pd.DataFrame([(h, hourly.get(h, 0)) for h in range(24)], columns=["hour", "tweet_count"])
+
+    def geo_share(self) -> dict[str, float]:
+        """Percent of tweets carrying each geo field."""
+        geo = self.counters.get("geo", Counter())
+        total = geo.get("total", 0)
+        return {k: v / total * 100 for k, v in geo.items() if k != "total"} if total else {}
+
+    def to_json(self) -> dict:
+        out = {"lines": self.lines, "undated": self.undated, "files": self.files}
+        out.update({name: dict(counter) for name, counter in self.counters.items()})
+        if self.grid is not None:
+            out["grid"] = self.grid.tolist()
+        return out
+
+
+def count_lines(path: Path, block_size: int = 1 << 20) -> int:
+    """Newline count without decoding (a trailing unterminated line counts)."""
+    lines = 0
+    last = b"\n"
+    with open_ndjson(path) as f:
+        while block := f.read(block_size):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    return lines + (last != b"\n")
+
+
+def _add_created_at(created_at, counters: dict[str, Counter]) -> bool:
+    """Count one created_at; returns False (nothing counted) when it does not parse."""
+    match = _CREATED_AT.fullmatch(created_at) if isinstance(created_at, str) else None
+    if match is None:
+        return False
+    weekday, month, day, hour, year = match.groups()
+    if "daily" in counters:
+        counters["daily"][f"{year}-{_MONTHS.get(month, '00')}-{day}"] += 1
+    if "hourly" in counters:
+        counters["hourly"][int(hour)] += 1
+    if "weekday" in counters:
+        counters["weekday"][_WEEKDAY_NAMES.get(weekday, weekday)] += 1
+    return True
+
+
+def _add_geo(tweet: dict, geo: Counter):
+    place = tweet.get("place")
+    coords = tweet.get("coordinates")
+    geo["total"] += 1
+    if place is not None:
+        geo["place"] += 1
+        if place.get("country"):
+            geo["place_country"] += 1
+        if place.get("country_code"):
+            geo["place_country_code"] += 1
+        bb = place.get("bounding_box")
+        if bb and bb.get("coordinates"):
+            geo["bounding_box"] += 1
+    if coords and coords.get("coordinates"):
+        geo["coordinates_point"] += 1
+        if place is None:
+            geo["no_place_but_coords"] += 1
+    point = tweet.get("geo")
+    if point and point.get("coordinates"):
+        geo["geo_point"] += 1
+
+
+def add_tweet(tweet: dict, counters: dict[str, Counter], points: list | None = None) -> bool:
+    """
+    Update the requested counters (keys of counters) from one decoded tweet.
+
+    Returns whether the tweet had a parseable created_at.
+    """
+    dated = _add_created_at(tweet.get("created_at"), counters)
+
+    if "country" in counters:
+        place = tweet.get("place")
+        if place and place.get("country"):
+            counters["country"][place["country"]] += 1
+    if "geo" in counters:
+        _add_geo(tweet, counters["geo"])
+    if "hashtags" in counters or "mentions" in counters:
+        ents = tweet.get("entities") or {}
+        if "hashtags" in counters:
+            counters["hashtags"].update(h["text"].lower() for h in ents.get("hashtags") or [] if h.get("text"))
+        if "mentions" in counters:
+            counters["mentions"].update(
+                m["screen_name"].lower() for m in ents.get("user_mentions") or [] if m.get("screen_name")
+            )
+    if "sources" in counters:
+        source = tweet.get("source")
+        if source:
+            counters["sources"][source] += 1
+    if "lang" in counters:
+        counters["lang"][(tweet.get("user") or {}).get("lang") or ""] += 1
+    if "retweets" in counters:
+        retweets = tweet.get("retweet_count")
+        if isinstance(retweets, int):
+            counters["retweets"][retweets] += 1
+    if points is not None:
+        coords = tweet.get("coordinates")
+        if coords and coords.get("coordinates"):
+            points.append(coords["coordinates"][:2])
+    return dated
+
+
+def _grid(points: list) -> np.ndarray:
+    grid = np.zeros(_GRID_SHAPE, dtype=np.int64)
+    if not points:
+        return grid
+    lon, lat = np.asarray(points, dtype=np.float64).T
+    valid = (np.abs(lon) <= 180) & (np.abs(lat) <= 90) & ~((np.abs(lon) < 1e-6) & (np.abs(lat) < 1e-6))
+    x = np.clip(((lon[valid] + 180) / 360 * _GRID_SHAPE[1]).astype(int), 0, _GRID_SHAPE[1] - 1)
+    y = np.clip(((lat[valid] + 90) / 180 * _GRID_SHAPE[0]).astype(int), 0, _GRID_SHAPE[0] - 1)
+    np.add.at(grid, (y, x), 1)
+    return grid
+
+
+def scan_file(path: Path, aggregates: Iterable[str] = AGGREGATES) -> ScanResult:
+    """One pass over one NDJSON shard."""
+    aggregates = set(aggregates)
+    counters = {name: Counter() for name in COUNTER_AGGREGATES if name in aggregates}
+    if not counters and "grid" not in aggregates:
+        return ScanResult(lines=count_lines(path), files=[str(path)])
+
+    points: list | None = [] if "grid" in aggregates else None
+    lines = undated = 0
+    with open_ndjson(path) as f:
+        for line in f:
+            lines += 1
+            if not line.strip():
+                continue
+            try:
+                tweet = loads(line)
+            except ValueError:
+                continue
+            undated += not add_tweet(tweet, counters, points)
+
+    return ScanResult(
+        lines=lines,
+        undated=undated,
+        counters=counters,
+        grid=_grid(points) if points is not None else None,
+        files=[str(path)],
+    )
+
+
+def scan_files(
+    files: Iterable[Path],
+    aggregates: Iterable[str] = AGGREGATES,
+    workers: int | None = None,
+) -> ScanResult:
+    """Scan shards in parallel and merge their aggregates."""
+    files = list(files)
+    aggregates = list(aggregates)
+    unknown = set(aggregates) - set(AGGREGATES)
+    if unknown:
+        raise ValueError(f"Unknown aggregates: {', '.join(sorted(unknown))}")
+
+    total = ScanResult()
+    worker = partial(scan_file, aggregates=aggregates)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        for result in pool.map(worker, files):
+            total.merge(result)
+    return total
+
+
+def scan_directory(
+    data_dir: Path,
+    pattern: str | None = None,
+    aggregates: Iterable[str] = AGGREGATES,
+    workers: int | None = None,
+) -> ScanResult:
+    """Scan every shard in data_dir (any supported compression unless pattern is given)."""
+    files = list_shards(data_dir, pattern)
+    if not files:
+        raise FileNotFoundError(f"No NDJSON shards matching {pattern or '*.json[.gz|.zst]'} in {data_dir}")
+    return scan_files(files, aggregates=aggregates, workers=workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One-pass aggregate scan over NDJSON tweet shards.")
+    parser.add_argument("--data-dir", type=Path, default=Path("2011-12"))
+    parser.add_argument("--pattern", default=None, help="Glob for shards (default: any .json/.json.gz/.json.zst)")
+    parser.add_argument(
+        "--aggregates",
+        nargs="+",
+        choices=AGGREGATES,
+        default=[a for a in AGGREGATES if a != "grid"],
+        help="Aggregates to compute (default: all but grid)",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--top-n", type=int, default=15)
+    parser.add_argument("--output", type=Path, default=None, help="Write all aggregates to this JSON file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = scan_directory(args.data_dir, args.pattern, args.aggregates, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Scanned {len(result.files)} files, {result.lines:,} lines in {elapsed:.1f}s")
+
+    if "daily" in result.counters:
+        print(f"\nTweets per day ({result.undated:,} without a parseable created_at):")
+        print(result.daily_frame().to_string(index=False))
+    if "weekday" in result.counters:
+        print("\nTweets by weekday:")
+        print(result.weekday_frame().to_string(index=False))
+    if "geo" in result.counters:
+        print("\nGeo field coverage (%):")
+        for name, pct in sorted(result.geo_share().items()):
+            print(f"  {name}: {pct:.2f}")
+    for name in ("country", "hashtags", "mentions", "sources", "lang"):
+        if name in result.counters:
+            print(f"\nTop {name}:")
+            print(result.top(name, args.top_n).to_string(index=False))
+
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as f:
+            json.dump(result.to_json(), f)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""Align news articles with the tweets most similar to them.
+
+Articles (NYT, UK news, ...) and tweets are embedded with the same model
+through the embedding cache. For every article the top-k tweets by cosine
+similarity are kept, looking only at tweet shards whose day lies within
+window_days of the article's date (all shards when articles have no date).
+
+Search is exact by default: tweets are streamed shard by shard in blocks, each
+block is scored against the articles in its window with one float32 matrix
+multiply, and a running top-k per article is merged block by block, so
+memory is bounded by articles x block_size whatever the corpus size. By
+default block_size is derived per shard from the articles in its window, so
+the score matrix stays around SCORE_CELLS cells (64 MB of float32).
+method="hnsw" builds an approximate hnswlib index per day instead (optional
+package). Stored embeddings may be float16; blocks are upcast before the
+multiply because numpy has no fast float16 matmul.
+
+    python news_alignment.py --articles nyt_2011_12.csv news_uk_dataset.csv \\
+        --tweets-dir 2011-12-csv --output news_tweet_alignment.parquet --top-k 20
+
+Output is a compact (article_id, tweet_id, score) table, best tweets first per
+article, written as Parquet or CSV depending on the suffix.
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from dedup import collapse_duplicates
+from embedding_cache import EmbeddingStore
+from instrumentation import stage
+from tweet_store import parse_tweet_ids
+
+METHODS = ("exact", "hnsw")
+DATE_COLUMNS = ("date", "pub_date", "published", "day")
+# Articles x tweets scored per block; TopK.push adds about three times this in temporaries.
+SCORE_CELLS = 16 << 20
+MIN_BLOCK, MAX_BLOCK = 256, 65_536
+
+
+class TopK:
+    """Running top-k (highest score) per query across streamed corpus blocks."""
+
+    def __init__(self, n_queries: int, k: int):
+        self.k = k
+        self.scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        self.ids = np.full((n_queries, k), -1, dtype=np.int64)
+
+    def push(self, rows: np.ndarray, scores: np.ndarray, ids: np.ndarray):
+        """
+        Merge a (len(rows) x m) score block into the queries at rows.
+
+        ids holds the corpus id of each column (shape m) or of each cell
+        (same shape as scores).
+        """
+        if scores.shape[1] == 0:
+            return
+        ids = np.broadcast_to(ids, scores.shape)
+        if scores.shape[1] > self.k:
+            top = np.argpartition(-scores, self.k - 1, axis=1)[:, :self.k]
+            scores = np.take_along_axis(scores, top, axis=1)
+            ids = np.take_along_axis(ids, top, axis=1)
+        merged_scores = np.concatenate([self.scores[rows], scores.astype(np.float32)], axis=1)
+        merged_ids = np.concatenate([self.ids[rows], ids], axis=1)
+        top = np.argpartition(-merged_scores, self.k - 1, axis=1)[:, :self.k]
+        self.scores[rows] = np.take_along_axis(merged_scores, top, axis=1)
+        self.ids[rows] = np.take_along_axis(merged_ids, top, axis=1)
+
+    def result(self) -> tuple[np.ndarray, np.ndarray]:
+        """(scores, ids) sorted best first; unfilled slots have id -1."""
+        order = np.argsort(-self.scores, axis=1, kind="stable")
+        return np.take_along_axis(self.scores, order, axis=1), np.take_along_axis(self.ids, order, axis=1)
+
+
+def search_exact(
+    queries: np.ndarray,
+    corpus: np.ndarray,
+    corpus_ids: np.ndarray,
+    topk: TopK,
+    rows: np.ndarray | None = None,
+    block_size: int = 65_536,
+):
+    """Score queries against corpus (both L2-normalized) block by block into topk."""
+    rows = np.arange(len(queries)) if rows is None else rows
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    for start in range(0, len(corpus), block_size):
+        block = np.asarray(corpus[start:start + block_size], dtype=np.float32)
+        topk.push(rows, queries @ block.T, corpus_ids[start:start + block_size])
+
+
+def search_hnsw(
+    queries: np.ndarray,
+    corpus: np.ndarray,
+    corpus_ids: np.ndarray,
+    topk: TopK,
+    rows: np.ndarray | None = None,
+    ef: int = 200,
+    m: int = 16,
+):
+    """Approximate top-k through an in-memory hnswlib index over corpus."""
+    try:
+        import hnswlib
+    except ImportError as exc:
+        raise ImportError("method='hnsw' requires the 'hnswlib' package") from exc
+    if not len(corpus):
+        return
+    rows = np.arange(len(queries)) if rows is None else rows
+    index = hnswlib.Index(space="ip", dim=corpus.shape[1])
+    index.init_index(max_elements=len(corpus), ef_construction=ef, M=m)
+    index.add_items(np.asarray(corpus, dtype=np.float32), np.arange(len(corpus)))
+    index.set_ef(max(ef, topk.k))
+    labels, distances = index.knn_query(np.asarray(queries, dtype=np.float32), k=min(topk.k, len(corpus)))
+    # hnswlib's inner-product distance is 1 - dot.
+    topk.push(rows, 1.0 - distances, corpus_ids[labels.astype(np.int64)])
+
+
+def load_articles(
+    paths: Iterable[Path],
+    text_col: str = "Text",
+    id_col: str = "id",
+    date_col: str | None = None,
+) -> pd.DataFrame:
+    """
+    Articles from one or more CSVs as (article_id, text, date).
+
+    Missing ids become "<file stem>:<row>". The date comes from date_col or
+    the first of DATE_COLUMNS present; it is NaT when there is none.
+    """
+    frames = []
+    for path in paths:
+        path = Path(path)
+        df = pd.read_csv(path)
+        if text_col not in df.columns:
+            raise KeyError(f"'{text_col}' not found in {path}. Columns: {list(df.columns)}")
+        ids = df[id_col].astype(str) if id_col in df.columns else pd.Series([f"{path.stem}:{i}" for i in range(len(df))])
+        col = date_col or next((c for c in DATE_COLUMNS if c in df.columns), None)
+        dates = (
+            pd.to_datetime(df[col], errors="coerce", utc=True).dt.tz_localize(None).dt.normalize()
+            if col in df.columns else pd.Series(pd.NaT, index=df.index)
+        )
+        frames.append(pd.DataFrame({
+            "article_id": ids.to_numpy(),
+            "text": df[text_col].fillna("").astype(str).to_numpy(),
+            "date": dates.to_numpy(),
+        }))
+    articles = pd.concat(frames, ignore_index=True)
+    return articles[articles["text"].str.strip() != ""].reset_index(drop=True)
+
+
+def auto_block_size(n_queries: int, max_cells: int = SCORE_CELLS) -> int:
+    """Tweets per block keeping the n_queries x block score matrix within max_cells."""
+    return int(np.clip(max_cells // max(n_queries, 1), MIN_BLOCK, MAX_BLOCK))
+
+
+def _shard_day(path: Path) -> pd.Timestamp | None:
+    try:
+        return pd.Timestamp(Path(path).stem).normalize()
+    except ValueError:
+        return None
+
+
+def load_tweets(csv_path: Path, text_col: str = "Text", dedup: bool = True) -> tuple[list[str], np.ndarray]:
+    """(texts, int64 tweet ids) of one shard; with dedup, one tweet per exact-duplicate group."""
+    df = pd.read_csv(csv_path, usecols=[text_col, "id"], dtype={"id": str})
+    df = df[df[text_col].fillna("").astype(str).str.strip() != ""]
+    texts = df[text_col].astype(str).tolist()
+    ids = parse_tweet_ids(df["id"]).fill_null(-1).to_numpy()
+    if dedup and texts:
+        # Retweets of one text would otherwise fill every slot of an article.
+        reps = collapse_duplicates(texts, near_duplicates=False).representatives
+        texts = [texts[i] for i in reps]
+        ids = ids[reps]
+    return texts, ids
+
+
+def align(
+    articles: pd.DataFrame,
+    tweets_dir: Path,
+    store: EmbeddingStore,
+    top_k: int = 20,
+    window_days: int = 1,
+    pattern: str = "*.csv",
+    method: str = "exact",
+    block_size: int | None = None,
+    text_col: str = "Text",
+    dedup: bool = True,
+) -> pd.DataFrame:
+    """
+    Top-k tweets per article (from load_articles) as an (article_id, tweet_id, score) frame.
+
+    block_size defaults to auto_block_size() of the articles in each shard's window.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}")
+    files = sorted(Path(tweets_dir).glob(pattern))
+    if not files:
+        raise FileNotFoundError(f"No CSV files matching {pattern} in {tweets_dir}")
+
+    with stage("encode_articles", rows_in=len(articles)):
+        article_emb = store.encode(articles["text"].tolist())
+    topk = TopK(len(articles), top_k)
+    dates = articles["date"].to_numpy(dtype="datetime64[ns]")
+    undated = np.isnat(dates)
+    if undated.all():
+        print("Articles have no dates; every article is matched against every shard.")
+
+    for path in files:
+        day = _shard_day(path)
+        if day is None:
+            window = np.ones(len(articles), dtype=bool)
+        else:
+            gap = np.abs((dates - day.to_datetime64()) / np.timedelta64(1, "D"))
+            window = undated | (gap <= window_days)
+        rows = np.flatnonzero(window)
+        if not len(rows):
+            continue
+        with stage("align_shard") as record:
+            texts, ids = load_tweets(path, text_col=text_col, dedup=dedup)
+            queries = article_emb[rows]
+            if method == "hnsw":
+                search_hnsw(queries, store.encode(texts), ids, topk, rows)
+            else:
+                # Encode in blocks too, so a shard never sits in memory as float32.
+                size = block_size or auto_block_size(len(rows))
+                for start in range(0, len(texts), size):
+                    block = store.encode(texts[start:start + size])
+                    search_exact(queries, block, ids[start:start + size], topk, rows, size)
+            record.update(rows_in=len(texts), articles=len(rows), shard=path.name)
+        print(f"{path.name}: {len(texts):,} tweets x {len(rows):,} articles")
+
+    scores, tweet_ids = topk.result()
+    filled = tweet_ids >= 0
+    return pd.DataFrame({
+        "article_id": np.repeat(articles["article_id"].to_numpy(), top_k)[filled.ravel()],
+        "tweet_id": tweet_ids[filled],
+        "score": scores[filled].astype(np.float32),
+    })
+
+
+def write_alignment(table: pd.DataFrame, path: Path) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".parquet":
+        table.to_parquet(path, index=False)
+    else:
+        table.to_csv(path, index=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the tweets most similar to each news article.")
+    parser.add_argument("--articles", type=Path, nargs="+", default=[Path("nyt_2011_12.csv")])
+    parser.add_argument("--tweets-dir", type=Path, default=Path("2011-12-csv"))
+    parser.add_argument("--pattern", default="*.csv")
+    parser.add_argument("--output", type=Path, default=Path("news_tweet_alignment.parquet"))
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--window-days", type=int, default=1, help="Tweets from article date +/- this many days")
+    parser.add_argument("--method", choices=METHODS, default="exact")
+    parser.add_argument("--block-size", type=int, default=None,
+                        help="Tweets scored per matrix multiply (default: derived from the articles in each window)")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--dtype", choices=("float32", "float16"), default="float32", help="Embedding storage dtype")
+    parser.add_argument("--text-col", default="Text")
+    parser.add_argument("--id-col", default="id", help="Article id column (row numbers when missing)")
+    parser.add_argument("--date-col", default=None, help=f"Article date column (default: first of {', '.join(DATE_COLUMNS)})")
+    parser.add_argument("--no-dedup", action="store_true", help="Keep duplicate tweets (retweets) as separate candidates")
+    args = parser.parse_args()
+
+    articles = load_articles(args.articles, text_col=args.text_col, id_col=args.id_col, date_col=args.date_col)
+    print(f"{len(articles):,} articles")
+    store = EmbeddingStore(args.model, normalize=True, dtype=args.dtype)
+    table = align(
+        articles,
+        args.tweets_dir,
+        store,
+        top_k=args.top_k,
+        window_days=args.window_days,
+        pattern=args.pattern,
+        method=args.method,
+        block_size=args.block_size,
+        text_col=args.text_col,
+        dedup=not args.no_dedup,
+    )
+    print(f"Wrote {len(table):,} pairs to {write_alignment(table, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""Stream news metadata dumps into month-partitioned CSVs.
+
+Replaces the notebook extraction (nyt_dataset.ipynb, la_news.ipynb), which
+loaded whole dumps and parsed every date. Here a dump is read in chunks of
+only the needed columns; rows are kept by comparing the first 10
+characters of the raw date string ("2011-12-07...") with the requested
+range, so ISO dates are never parsed. Only rows whose date does not start
+with YYYY-MM-DD go through pd.to_datetime. Kept rows are appended to
+<output-dir>/<source>/<YYYY-MM>.csv in the schema of nyt_2011_12.csv
+(Text, Origin, id, country, language), plus `date` with --with-date
+(left empty for sources with only year/month, which have no day).
+
+    python news_ingest.py nyt --input nyt-metadata.csv --months 2011-12
+    python news_ingest.py uk --input news_uk_dataset.csv --start 2011-12-01 --end 2012-01-31
+    python news_ingest.py latimes --months 2011-12 2012-01      # Hugging Face streaming, needs `datasets`
+
+A partition is written to a temporary file and replaced when the job
+finishes. Partitions not touched by the job are left alone, so adding a
+month or a source only streams that dump once.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import pandas as pd
+
+SCHEMA = ["Text", "Origin", "id", "country", "language"]
+ISO_DAY = r"^\d{4}-\d{2}-\d{2}"
+
+
+@dataclass(frozen=True)
+class NewsSource:
+    """How one dump maps onto the news schema."""
+
+    name: str
+    text_cols: tuple[str, ...]        # first non-empty one is the text
+    date_col: str | None = None       # ISO-like date string
+    year_col: str | None = None       # or separate year / month columns
+    month_col: str | None = None
+    id_col: str | None = None         # "<name>:<row>" when missing
+    origin: str = ""
+    origin_col: str | None = None     # per-row origin, falling back to origin
+    country: str = ""
+    language: str = "en"
+    dataset: str | None = None        # Hugging Face dataset, streamed instead of a CSV
+
+    @property
+    def columns(self) -> list[str]:
+        cols = [*self.text_cols, self.date_col, self.year_col, self.month_col, self.id_col, self.origin_col]
+        return list(dict.fromkeys(c for c in cols if c))
+
+
+SOURCES = {
+    "nyt": NewsSource(
+        "nyt",
+        text_cols=("lead_paragraph", "abstract", "snippet"),
+        date_col="pub_date",
+        id_col="_id",
+        origin="NYTimes",
+        country="United States of America",
+    ),
+    "uk": NewsSource(
+        "uk",
+        text_cols=("title",),
+        date_col="published",
+        origin="Google News UK",
+        origin_col="source",
+        country="United Kingdom",
+    ),
+    "latimes": NewsSource(
+        "latimes",
+        text_cols=("title",),
+        year_col="year",
+        month_col="month",
+        id_col="link",
+        origin="LA Times",
+        country="United States of America",
+        dataset="Astris/LA-Times-Linked-Headlines",
+    ),
+}
+
+
+def day_strings(chunk: pd.DataFrame, source: NewsSource) -> pd.Series:
+    """
+    YYYY-MM-DD (or YYYY-MM for year/month sources) per row, "" when unknown.
+
+    ISO-prefixed strings are only sliced; the rest are parsed.
+    """
+    if source.date_col is None:
+        year = pd.to_numeric(chunk[source.year_col], errors="coerce")
+        month = pd.to_numeric(chunk[source.month_col], errors="coerce")
+        valid = year.notna() & month.between(1, 12)
+        out = pd.Series("", index=chunk.index, dtype=object)
+        out[valid] = year[valid].astype(int).astype(str).str.zfill(4) + "-" + month[valid].astype(int).astype(str).str.zfill(2)
+        return out
+    raw = chunk[source.date_col].fillna("").astype(str).str.strip()
+    iso = raw.str.contains(ISO_DAY, regex=True)
+    days = raw.str[:10].where(iso, "")
+    other = ~iso & (raw != "")
+    if other.any():
+        parsed = pd.to_datetime(raw[other], errors="coerce", utc=True, format="mixed")
+        days[other] = parsed.dt.strftime("%Y-%m-%d").fillna("")
+    return days
+
+
+def to_schema(chunk: pd.DataFrame, source: NewsSource, row_start: int) -> pd.DataFrame:
+    """
+    Map a raw chunk onto SCHEMA; empty texts are dropped.
+
+    Missing ids are the dump row number, chunk.index + row_start.
+    """
+    text = pd.Series(pd.NA, index=chunk.index, dtype=object)
+    for col in source.text_cols:
+        if col in chunk.columns:
+            values = chunk[col].where(chunk[col].fillna("").astype(str).str.strip() != "")
+            text = text.fillna(values)
+    if source.id_col and source.id_col in chunk.columns:
+        ids = chunk[source.id_col].fillna("").astype(str)
+    else:
+        ids = pd.Series([f"{source.name}:{i}" for i in chunk.index + row_start], index=chunk.index)
+    origin = pd.Series(source.origin, index=chunk.index, dtype=object)
+    if source.origin_col and source.origin_col in chunk.columns:
+        origin = chunk[source.origin_col].fillna(source.origin).astype(str)
+    out = pd.DataFrame({
+        "Text": text.fillna("").astype(str),
+        "Origin": origin,
+        "id": ids,
+        "country": source.country,
+        "language": source.language,
+    })
+    return out[out["Text"].str.strip() != ""]
+
+
+class MonthPartitions:
+    """Appends rows to <dir>/<YYYY-MM>.csv through temporary files, replaced on close()."""
+
+    def __init__(self, out_dir: Path, columns: list[str]):
+        self.dir = Path(out_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.columns = columns
+        self.rows: dict[str, int] = {}
+
+    def _tmp(self, month: str) -> Path:
+        return self.dir / f"{month}.csv.tmp"
+
+    def write(self, frame: pd.DataFrame, months: pd.Series):
+        for month, group in frame.groupby(months, sort=False):
+            first = month not in self.rows
+            group[self.columns].to_csv(self._tmp(month), mode="w" if first else "a", header=first, index=False)
+            self.rows[month] = self.rows.get(month, 0) + len(group)
+
+    def close(self) -> dict[str, int]:
+        for month in self.rows:
+            os.replace(self._tmp(month), self.dir / f"{month}.csv")
+        return dict(sorted(self.rows.items()))
+
+
+def read_chunks(source: NewsSource, path: Path | None, chunksize: int, split: str = "train") -> Iterator[pd.DataFrame]:
+    """Raw chunks of the source's columns from a CSV dump or a streamed Hugging Face dataset."""
+    if source.dataset and path is None:
+        try:
+            from datasets import load_dataset
+        except ImportError as exc:
+            raise ImportError(f"Streaming {source.dataset} requires the 'datasets' package") from exc
+        ds = load_dataset(source.dataset, split=split, streaming=True)
+        for batch in ds.iter(batch_size=chunksize):
+            yield pd.DataFrame({c: batch[c] for c in source.columns if c in batch})
+        return
+    if path is None:
+        raise ValueError(f"--input is required for source '{source.name}'")
+    header = pd.read_csv(path, nrows=0).columns
+    columns = [c for c in source.columns if c in header]
+    missing = [c for c in (source.date_col, source.year_col, source.month_col) if c and c not in header]
+    if missing:
+        raise KeyError(f"{path} has no {missing} column. Columns: {list(header)}")
+    yield from pd.read_csv(path, usecols=columns, dtype=str, chunksize=chunksize)
+
+
+def ingest(
+    source: NewsSource,
+    output_dir: Path,
+    start: str | None = None,
+    end: str | None = None,
+    months: Iterable[str] | None = None,
+    path: Path | None = None,
+    chunksize: int = 100_000,
+    with_date: bool = False,
+) -> dict[str, int]:
+    """
+    Stream a dump and write its rows dated start..end (inclusive, YYYY-MM-DD)
+    and/or in months (YYYY-MM), one CSV per month.
+
+    Returns rows written per month. Sources with only year/month keep the
+    months overlapping the range, and their `date` column is left empty:
+    "YYYY-MM" would read as the 1st of the month in news_alignment, while
+    an empty date matches the article against every shard.
+    """
+    if start is None and end is None and not months:
+        raise ValueError("give start/end or months")
+    months = sorted(set(months or ()))
+    columns = SCHEMA + (["date"] if with_date else [])
+    partitions = MonthPartitions(Path(output_dir) / source.name, columns)
+    rows_in = 0
+    for chunk in read_chunks(source, path, chunksize):
+        chunk = chunk.reset_index(drop=True)
+        days = day_strings(chunk, source)
+        # Plain string comparisons: "2011-12-07" sorts between "2011-12-01" and "2011-12-31".
+        width = 7 if source.date_col is None else 10
+        keep = days != ""
+        if start:
+            keep &= days >= start[:width]
+        if end:
+            keep &= days <= end[:width]
+        if months:
+            keep &= days.str[:7].isin(months)
+        if keep.any():
+            out = to_schema(chunk[keep], source, rows_in)
+            out["date"] = days[out.index] if source.date_col else ""
+            partitions.write(out, days[out.index].str[:7])
+        rows_in += len(chunk)
+    written = partitions.close()
+    print(f"{source.name}: {sum(written.values()):,} of {rows_in:,} rows kept")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream news dumps into month-partitioned CSVs (nyt_2011_12.csv schema).")
+    parser.add_argument("source", choices=sorted(SOURCES))
+    parser.add_argument("--input", type=Path, default=None, help="CSV dump (optional for Hugging Face sources)")
+    parser.add_argument("--months", nargs="+", default=None, help="YYYY-MM months to keep")
+    parser.add_argument("--start", default=None, help="First day kept (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Last day kept (YYYY-MM-DD)")
+    parser.add_argument("--output-dir", type=Path, default=Path("news"))
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--with-date", action="store_true", help="Add a date column (for news_alignment windows)")
+    args = parser.parse_args()
+
+    if not (args.months or args.start or args.end):
+        parser.error("give --months and/or --start/--end")
+
+    written = ingest(
+        SOURCES[args.source], args.output_dir, start=args.start, end=args.end, months=args.months,
+        path=args.input, chunksize=args.chunksize, with_date=args.with_date,
+    )
+    for month, rows in written.items():
+        print(f"  {args.output_dir / args.source / month}.csv: {rows:,} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,28 @@
+from pathlib import Path
+
 import pandas as pd
 
 from bertopic import BERTopic
-from sentence_transformers import SentenceTransformer
 from umap import UMAP
 from hdbscan import HDBSCAN
 from sklearn.feature_extraction.text import CountVectorizer
 
-# 1) Load your CSV
-df = pd.read_csv("2010-05-csv/2010-05-07.csv")
+from dedup import collapse_duplicates
+from embedding_cache import EmbeddingStore
+from tweet_store import load_tweets
 
 # ✅ IMPORTANT: set this to your actual text column name
 TEXT_COL = "Text"   # change if needed (e.g., "text")
 
+# 1) Load one day: from the Parquet store if it exists (only the text column
+#    of that day's partition is read), otherwise from the CSV shard
+DAY = "2010-05-07"
+STORE_DIR = Path("2010-05-parquet")
+if STORE_DIR.exists():
+    df = load_tweets(STORE_DIR, columns=[TEXT_COL], days=[DAY])
+else:
+    df = pd.read_csv(f"2010-05-csv/{DAY}.csv")
+
 if TEXT_COL not in df.columns:
     raise KeyError(f"'{TEXT_COL}' not found. Columns: {list(df.columns)}")
 
@@ -19,13 +30,17 @@ texts = df[TEXT_COL].fillna("").astype(str).tolist()
 texts = [t for t in texts if t.strip()]
 print("Loaded docs:", len(texts))
 
-# 2) Embedding model (fast/light)
-encoder = SentenceTransformer("all-MiniLM-L6-v2")
-embeddings = encoder.encode(
-    texts,
+# Collapse retweets/near-duplicates; the model is fitted on one text per group
+dedup = collapse_duplicates(texts)
+rep_texts = [texts[i] for i in dedup.representatives]
+print("Representatives after dedup:", len(rep_texts))
+
+# 2) Embedding model (fast/light); texts seen in earlier runs come from the on-disk cache
+embedding_store = EmbeddingStore("all-MiniLM-L6-v2", normalize=True)
+embeddings = embedding_store.encode(
+    rep_texts,
     show_progress_bar=True,
     batch_size=64,
-    normalize_embeddings=True,
 )
 
 # 3) UMAP (fixed hyperparams)
@@ -61,10 +76,12 @@ topic_model = BERTopic(
     verbose=True,
 )
 
-topics, probs = topic_model.fit_transform(texts, embeddings)
+rep_topics, probs = topic_model.fit_transform(rep_texts, embeddings)
+topics = dedup.expand(rep_topics)
 
-# 7) Save outputs
+# 7) Save outputs (counts cover every original row, not just representatives)
 topic_info = topic_model.get_topic_info()
+topic_info["Count"] = topic_info["Topic"].map(pd.Series(topics).value_counts()).fillna(0).astype(int)
 topic_info.to_csv("topic_info_2010-05-07.csv", index=False)
 print("Saved topic info -> topic_info_2010-05-07.csv")
 
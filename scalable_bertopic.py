@@ -0,0 +1,331 @@
+"""Memory-bounded BERTopic over a full month of subject-filtered tweets and news.
+
+bertopic_jsd keeps every text, embedding and a dense documents x topics
+float64 probability matrix in RAM, which limits it to about a day. Here:
+
+1. The subject filter streams the month into one CSV (filter_csv_directory).
+2. The model is fitted on a stratified sample: proportional per (source,
+   day), with at least min_per_stratum documents from every stratum, so
+   small days and the news side are represented.
+3. Every document (the sample included, so all labels come from the same
+   procedure) is assigned by BERTopic.transform in streamed batches, each
+   deduplicated and encoded through the embedding cache.
+4. Each document keeps only its top_k topic probabilities, as float32,
+   appended to fixed-width files on disk (load_probabilities reads them back
+   as a sparse matrix).
+
+doc_topics_*.csv is appended batch by batch and topic counts are summed as
+batches pass, so peak memory depends on sample_size and batch_size, not on
+the corpus. topic_info_*.csv and the twitter/nyt JSD come from those counts.
+
+    python scalable_bertopic.py --pattern "*.csv" --sample-size 100000 --output-dir topics_2011-12_scalable
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from bertopic import BERTopic
+
+from bertopic_jsd import (
+    NEWS_CSV,
+    SUBJECT,
+    TEXT_COL,
+    TOPICS,
+    TWITTER_DIR,
+    build_model,
+    expand_subject_keywords,
+    load_df,
+    to_texts,
+)
+from dedup import collapse_duplicates
+from divergence import bootstrap_pairwise, jsd
+from embedding_cache import EmbeddingStore
+from instrumentation import stage
+from stage1_subject_filtering.shard_filtering import filter_csv_directory
+from stage1_subject_filtering.subject_keyword_list_filtering import filter_subject_keywords_list
+
+ChunkSource = Callable[[], Iterator[pd.DataFrame]]
+
+
+def document_chunks(twitter_csv: Path, news_texts: list[str], chunksize: int = 50_000) -> ChunkSource:
+    """
+    Factory of (text, source, day) chunks: the filtered tweets CSV, then the news.
+
+    Each call starts a new pass; the order is the same every time.
+    """
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        for chunk in pd.read_csv(twitter_csv, chunksize=chunksize, dtype=str):
+            texts = chunk[TEXT_COL].fillna("").astype(str)
+            chunk = pd.DataFrame({
+                "text": texts,
+                "source": "twitter",
+                "day": chunk["day"].fillna("") if "day" in chunk.columns else "",
+            })
+            yield chunk[texts.str.strip() != ""].reset_index(drop=True)
+        for start in range(0, len(news_texts), chunksize):
+            yield pd.DataFrame({"text": news_texts[start:start + chunksize], "source": "nyt", "day": ""})
+
+    return chunks
+
+
+def stratified_sample(
+    chunks: ChunkSource,
+    sample_size: int,
+    min_per_stratum: int = 500,
+    seed: int = 42,
+) -> pd.DataFrame:
+    """
+    Sample per (source, day) stratum in two streamed passes (count, then pick).
+
+    Strata get sample_size * share of the corpus documents, but at least
+    min_per_stratum (or all of them when smaller).
+    """
+    counts = Counter()
+    for chunk in chunks():
+        counts.update(chunk.groupby(["source", "day"]).size().to_dict())
+    total = sum(counts.values())
+    rng = np.random.default_rng(seed)
+    chosen = {}
+    for stratum, n in sorted(counts.items()):
+        take = min(n, max(min_per_stratum, round(sample_size * n / total)))
+        chosen[stratum] = np.sort(rng.choice(n, take, replace=False))
+
+    seen = Counter()
+    parts = []
+    for chunk in chunks():
+        for stratum, group in chunk.groupby(["source", "day"], sort=False):
+            ranks = seen[stratum] + np.arange(len(group))
+            seen[stratum] += len(group)
+            parts.append(group[np.isin(ranks, chosen[stratum])])
+    sample = pd.concat(parts, ignore_index=True)
+    print(f"Stratified sample: {len(sample):,} of {total:,} documents from {len(counts)} strata")
+    return sample
+
+
+def fit_on_sample(sample: pd.DataFrame, store: EmbeddingStore, topics: list[str]) -> BERTopic:
+    """Guided fit (bertopic_jsd.build_model) on the sample's deduplicated texts."""
+    texts = sample["text"].tolist()
+    with stage("fit_topics", rows_in=len(texts)) as record:
+        reps = [texts[i] for i in collapse_duplicates(texts).representatives]
+        model = build_model([[t.lower()] for t in topics] or None)
+        model.fit(reps, store.encode(reps))
+        record.update(rows_out=len(reps), topics=len(model.topic_representations_) - 1)
+    return model
+
+
+def top_k_probabilities(probs: np.ndarray, topics: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (topic ids, float32 probabilities) of each row's k most probable topics, best first.
+
+    Rows with fewer topics are padded with -1 / 0. When the model only gives
+    the assigned topic's probability (1-d probs), that is the single entry.
+    """
+    n = len(topics)
+    ids = np.full((n, k), -1, dtype=np.int32)
+    values = np.zeros((n, k), dtype=np.float32)
+    probs = np.asarray(probs)
+    if probs.ndim == 1:
+        ids[:, 0] = np.where(topics >= 0, topics, -1)
+        values[:, 0] = np.where(topics >= 0, probs, 0)
+        return ids, values
+    width = min(k, probs.shape[1])
+    if not width:
+        return ids, values
+    top = np.argpartition(-probs, width - 1, axis=1)[:, :width]
+    top_values = np.take_along_axis(probs, top, axis=1)
+    order = np.argsort(-top_values, axis=1, kind="stable")
+    top, top_values = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_values, order, axis=1)
+    filled = top_values > 0
+    ids[:, :width] = np.where(filled, top, -1)
+    values[:, :width] = np.where(filled, top_values, 0)
+    return ids, values
+
+
+class ProbabilityWriter:
+    """Appends fixed-width (n x k) top-k topic ids (int32) and probabilities (float32) to disk."""
+
+    def __init__(self, out_dir: Path, k: int):
+        self.dir = Path(out_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.k = k
+        self.n = 0
+        self._ids = (self.dir / "topics.i32").open("wb")
+        self._values = (self.dir / "probabilities.f32").open("wb")
+
+    def write(self, ids: np.ndarray, values: np.ndarray):
+        np.ascontiguousarray(ids, dtype=np.int32).tofile(self._ids)
+        np.ascontiguousarray(values, dtype=np.float32).tofile(self._values)
+        self.n += len(ids)
+
+    def close(self, n_topics: int):
+        self._ids.close()
+        self._values.close()
+        with (self.dir / "meta.json").open("w", encoding="utf-8") as f:
+            json.dump({"documents": self.n, "k": self.k, "topics": n_topics}, f)
+
+
+def load_probabilities(prob_dir: Path) -> sparse.csr_matrix:
+    """documents x topics float32 CSR matrix of the stored top-k probabilities."""
+    prob_dir = Path(prob_dir)
+    with (prob_dir / "meta.json").open("r", encoding="utf-8") as f:
+        meta = json.load(f)
+    shape = (meta["documents"], meta["k"])
+    ids = np.memmap(prob_dir / "topics.i32", dtype=np.int32, mode="r", shape=shape)
+    values = np.memmap(prob_dir / "probabilities.f32", dtype=np.float32, mode="r", shape=shape)
+    filled = ids >= 0
+    indptr = np.concatenate([[0], np.cumsum(filled.sum(axis=1))])
+    return sparse.csr_matrix((values[filled], ids[filled], indptr), shape=(meta["documents"], meta["topics"]))
+
+
+def assign_streamed(
+    model: BERTopic,
+    chunks: ChunkSource,
+    store: EmbeddingStore,
+    doc_topics_path: Path,
+    prob_dir: Path,
+    top_k: int = 5,
+) -> pd.DataFrame:
+    """
+    Assign every document batch by batch; returns topic x source document counts.
+
+    doc_topics_path gets (text, source, day, topic) rows in corpus order; row
+    i of the stored probabilities belongs to row i of that CSV.
+    """
+    writer = ProbabilityWriter(prob_dir, top_k)
+    counts = Counter()
+    header = True
+    for chunk in chunks():
+        if not len(chunk):
+            continue
+        with stage("assign", rows_in=len(chunk)) as record:
+            texts = chunk["text"].tolist()
+            dedup = collapse_duplicates(texts)
+            reps = [texts[i] for i in dedup.representatives]
+            rep_topics, rep_probs = model.transform(reps, store.encode(reps))
+            rep_topics = np.asarray(rep_topics)
+            ids, values = top_k_probabilities(rep_probs, rep_topics, top_k)
+            # Every member of a duplicate group gets its representative's row.
+            writer.write(ids[dedup.group_ids], values[dedup.group_ids])
+            chunk["topic"] = dedup.expand(rep_topics)
+            chunk.to_csv(doc_topics_path, mode="w" if header else "a", header=header, index=False)
+            header = False
+            counts.update(chunk.groupby(["topic", "source"]).size().to_dict())
+            record.update(rows_out=len(chunk), representatives=len(reps))
+        print(f"Assigned {writer.n:,} documents")
+    writer.close(n_topics=len(model.topic_representations_) - (-1 in model.topic_representations_))
+
+    table = pd.Series(counts, dtype=int)
+    if table.empty:
+        return pd.DataFrame(columns=["twitter", "nyt"], dtype=int)
+    table = table.unstack(fill_value=0).reindex(columns=["twitter", "nyt"], fill_value=0)
+    table.index.name = "topic"
+    return table.sort_index()
+
+
+def divergence_from_counts(counts: pd.DataFrame, n_boot: int = 1000) -> dict:
+    """Like bertopic_jsd.source_divergence, from topic x source counts (outliers dropped)."""
+    values = counts.drop(index=-1, errors="ignore")[["twitter", "nyt"]].to_numpy(dtype=float).T
+    divergence = jsd(values[0], values[1]) if values.size else float("nan")
+    if np.isnan(divergence):
+        return {"jsd": divergence, "low": np.nan, "high": np.nan, "counts": values}
+    interval = bootstrap_pairwise(values, n_boot=n_boot)
+    return {"jsd": divergence, "low": interval["low"][0, 1], "high": interval["high"][0, 1], "counts": values}
+
+
+def run_scalable(
+    subject: str = SUBJECT,
+    topics: list[str] = TOPICS,
+    twitter_dir: str = TWITTER_DIR,
+    pattern: str = "*.csv",
+    news_csv: str = NEWS_CSV,
+    output_dir: Path = Path("topics_scalable"),
+    tag: str = "twitter_nyt_scalable",
+    sample_size: int = 100_000,
+    min_per_stratum: int = 500,
+    batch_size: int = 50_000,
+    top_k: int = 5,
+    model_path: Path | None = None,
+    store: EmbeddingStore | None = None,
+) -> dict:
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    store = store or EmbeddingStore("all-MiniLM-L6-v2", normalize=True)
+
+    subject_keywords = expand_subject_keywords(subject)
+    print("Subject keywords:", subject_keywords)
+    filtered_csv = output_dir / "twitter_filtered.csv"
+    with stage("filter"):
+        filter_csv_directory(twitter_dir, filtered_csv, subject_keywords, text_col=TEXT_COL, pattern=pattern)
+        news_texts = to_texts(filter_subject_keywords_list(load_df(news_csv), subject_keywords, text_col=TEXT_COL))
+    chunks = document_chunks(filtered_csv, news_texts, chunksize=batch_size)
+
+    model_path = Path(model_path or output_dir / f"model_{tag}.pkl")
+    if model_path.exists():
+        model = BERTopic.load(str(model_path))
+        print(f"Loaded model from {model_path}")
+    else:
+        with stage("sample"):
+            sample = stratified_sample(chunks, sample_size, min_per_stratum)
+        model = fit_on_sample(sample, store, topics)
+        del sample
+        model.save(str(model_path), serialization="pickle")
+
+    counts = assign_streamed(
+        model, chunks, store, output_dir / f"doc_topics_{tag}.csv", output_dir / f"probabilities_{tag}", top_k=top_k
+    )
+    topic_info = model.get_topic_info()
+    topic_info["Count"] = topic_info["Topic"].map(counts.sum(axis=1)).fillna(0).astype(int)
+    topic_info.to_csv(output_dir / f"topic_info_{tag}.csv", index=False)
+    return divergence_from_counts(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory-bounded guided BERTopic over a month of tweets and NYT.")
+    parser.add_argument("--subject", default=SUBJECT)
+    parser.add_argument("--topics", nargs="*", default=TOPICS, help="Seed topics")
+    parser.add_argument("--data-dir", default=TWITTER_DIR)
+    parser.add_argument("--pattern", default="*.csv")
+    parser.add_argument("--news-csv", default=NEWS_CSV)
+    parser.add_argument("--output-dir", type=Path, default=Path("topics_scalable"))
+    parser.add_argument("--tag", default="twitter_nyt_scalable", help="Suffix of the output file names")
+    parser.add_argument("--sample-size", type=int, default=100_000, help="Documents the model is fitted on")
+    parser.add_argument("--min-per-stratum", type=int, default=500, help="Minimum sample per (source, day)")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="Documents assigned per batch")
+    parser.add_argument("--top-k", type=int, default=5, help="Topic probabilities kept per document")
+    parser.add_argument("--model-path", type=Path, default=None, help="Reuse or save the fitted model here")
+    args = parser.parse_args()
+
+    result = run_scalable(
+        subject=args.subject,
+        topics=args.topics,
+        twitter_dir=args.data_dir,
+        pattern=args.pattern,
+        news_csv=args.news_csv,
+        output_dir=args.output_dir,
+        tag=args.tag,
+        sample_size=args.sample_size,
+        min_per_stratum=args.min_per_stratum,
+        batch_size=args.batch_size,
+        top_k=args.top_k,
+        model_path=args.model_path,
+    )
+    if np.isnan(result["jsd"]):
+        print("One of the sources has zero non-outlier topics; divergence is undefined (NaN).")
+    else:
+        print(
+            f"Jensen-Shannon divergence: {result['jsd']:.6f} "
+            f"(95% bootstrap CI {result['low']:.6f}-{result['high']:.6f})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,38 @@ from collections import Counter
 import re
 import pandas as pd
 
-from .preprocess import normalize_text
+from instrumentation import instrumented
 
+from .preprocess import normalize_series, normalize_text, normalized_text
 
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by",
+    "for", "from", "has", "he", "i", "in", "is", "it", "its",
+    "me", "my", "of", "on", "or", "our", "she", "so", "that",
+    "the", "their", "they", "this", "to", "was", "we", "were",
+    "with", "you", "your",
+}
+
+
+@instrumented(rows_out=False)
 def expand_subject_keywords_frequency(
     df: pd.DataFrame,
     subject: str,
     top_n: int = 25,
+    index=None,
+    ranking: str = "count",
 ) -> list[str]:
     """
     Expand a subject keyword by counting the most common co-occurring words.
     Returns up to top_n keywords from rows that contain the subject.
+
+    With index (an inverted_index.DayIndex built from the same rows as df),
+    only the index's candidate rows are normalized and checked; the rows
+    kept and the counts are the same as without it.
+
+    ranking="pmi" or "llr" scores words by association with the subject
+    instead of raw frequency (see sparse_cooccurence), so words common
+    everywhere stop dominating the list.
     """
     subject = (subject or "").strip()
     if not subject:
@@ -25,25 +46,42 @@ def expand_subject_keywords_frequency(
     subject_norm = normalize_text(subject)
     subject_terms = set(subject_norm.split())
 
-    stopwords = {
-        "a", "an", "and", "are", "as", "at", "be", "but", "by",
-        "for", "from", "has", "he", "i", "in", "is", "it", "its",
-        "me", "my", "of", "on", "or", "our", "she", "so", "that",
-        "the", "their", "they", "this", "to", "was", "we", "were",
-        "with", "you", "your",
-    }
+    if ranking != "count":
+        from .sparse_cooccurence import CooccurrenceStats
+
+        stats = CooccurrenceStats([subject_norm])
+        if index is not None:
+            stats.add_index(index, texts=df["text"])
+        else:
+            stats.add_texts(df["text"])
+        return stats.top_terms(subject_norm, top_n=top_n, ranking=ranking)
 
-    text_norm = df["text"].fillna("").astype(str).map(normalize_text)
-    mask = text_norm.str.contains(subject_norm, case=False, na=False)
-    matched = text_norm[mask]
+    if index is not None:
+        return _expand_with_index(df, subject_norm, subject_terms, top_n, index)
+
+    return _count_cooccurring(normalized_text(df, "text"), subject_norm, subject_terms, top_n)
+
+
+def _count_cooccurring(text_norm: pd.Series, subject_norm: str, subject_terms: set, top_n: int) -> list[str]:
+    """Most common words, counted per occurrence, in the texts containing subject_norm."""
+    matched = text_norm[text_norm.str.contains(subject_norm, regex=False, na=False).to_numpy(dtype=bool)]
 
     counter: Counter[str] = Counter()
     for text in matched:
         for token in re.findall(r"[a-z0-9]+", text):
             if token in subject_terms:
                 continue
-            if token in stopwords:
+            if token in STOPWORDS:
                 continue
             counter[token] += 1
 
     return [word for word, _ in counter.most_common(top_n)]
+
+
+def _expand_with_index(df, subject_norm, subject_terms, top_n, index) -> list[str]:
+    if len(df) != index.n_rows:
+        raise ValueError(f"index covers {index.n_rows} rows but df has {len(df)}")
+    # Candidates are a superset; the scan's predicate and counting run on them only.
+    rows = index.query_substring(subject_norm)
+    text_norm = normalize_series(df["text"].iloc[rows]).reset_index(drop=True)
+    return _count_cooccurring(text_norm, subject_norm, subject_terms, top_n)
@@ -0,0 +1,280 @@
+"""Persistent token inverted index over the tweet CSV shards, one partition per day.
+
+Each partition stores, as .npy files opened with mmap_mode="r":
+
+- vocab.txt         tokens by term id (normalized words and '#hashtags')
+- term_offsets.npy  start of each term's posting list
+- postings.npy      gap-encoded row ids (uint16 when every gap fits, else uint32)
+- doc_offsets.npy / doc_terms.npy   forward index (row -> term ids), CSR layout
+
+Row ids are positions within the day's CSV shard, so they line up with
+pd.read_csv(shard). Queries are whole-token: a keyword matches a row when all
+of its tokens occur in it; callers verify phrase order on the candidates.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from .keyword_matcher import KeywordMatcher
+from .preprocess import normalize_series, normalize_text
+
+_TOKEN = re.compile(r"\w+")
+_HASHTAG = re.compile(r"#(\w+)")
+
+
+def tokenize(text: str) -> list[str]:
+    """Normalized word tokens plus '#tag' tokens for hashtags."""
+    text = text or ""
+    tokens = _TOKEN.findall(normalize_text(text))
+    tokens.extend("#" + tag.lower() for tag in _HASHTAG.findall(text))
+    return tokens
+
+
+def build_day_index(
+    csv_path: Path,
+    out_dir: Path,
+    text_col: str = "Text",
+    chunksize: int = 200_000,
+) -> int:
+    """Index one CSV shard into out_dir; returns the number of rows."""
+    vocab: dict[str, int] = {}
+    doc_terms: list[np.ndarray] = []
+    doc_lengths: list[int] = []
+
+    for chunk in pd.read_csv(csv_path, usecols=[text_col], chunksize=chunksize):
+        for text in chunk[text_col].fillna("").astype(str):
+            ids = {vocab.setdefault(tok, len(vocab)) for tok in tokenize(text)}
+            doc_terms.append(np.fromiter(sorted(ids), dtype=np.int32, count=len(ids)))
+            doc_lengths.append(len(ids))
+
+    n_rows = len(doc_lengths)
+    doc_offsets = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(doc_lengths, out=doc_offsets[1:])
+    terms = np.concatenate(doc_terms) if doc_terms else np.empty(0, dtype=np.int32)
+    rows = np.repeat(np.arange(n_rows, dtype=np.int64), doc_lengths)
+
+    order = np.argsort(terms, kind="stable")  # stable keeps rows ascending per term
+    posting_rows = rows[order]
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terms, minlength=len(vocab)), out=term_offsets[1:])
+
+    # Each posting list starts with an absolute row id, followed by gaps.
+    gaps = np.diff(posting_rows, prepend=0)
+    list_heads = term_offsets[:-1][np.diff(term_offsets) > 0]
+    gaps[list_heads] = posting_rows[list_heads]
+    postings_dtype = np.uint16 if gaps.size == 0 or gaps.max() <= np.iinfo(np.uint16).max else np.uint32
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with (out_dir / "vocab.txt").open("w", encoding="utf-8") as f:
+        f.write("\n".join(vocab))
+    np.save(out_dir / "term_offsets.npy", term_offsets)
+    np.save(out_dir / "postings.npy", gaps.astype(postings_dtype))
+    np.save(out_dir / "doc_offsets.npy", doc_offsets)
+    np.save(out_dir / "doc_terms.npy", terms)
+    stat = Path(csv_path).stat()
+    with (out_dir / "meta.json").open("w", encoding="utf-8") as f:
+        json.dump({"rows": n_rows, "source": str(csv_path), "size": stat.st_size, "mtime": stat.st_mtime}, f)
+    return n_rows
+
+
+class DayIndex:
+    """Read-only, memory-mapped view of one day partition."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with (self.path / "meta.json").open("r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.n_rows = self.meta["rows"]
+        text = (self.path / "vocab.txt").read_text(encoding="utf-8")
+        self.vocab = text.split("\n") if text else []
+        self.term_ids = {term: i for i, term in enumerate(self.vocab)}
+        self.term_offsets = np.load(self.path / "term_offsets.npy", mmap_mode="r")
+        self.postings_gaps = np.load(self.path / "postings.npy", mmap_mode="r")
+        self.doc_offsets = np.load(self.path / "doc_offsets.npy", mmap_mode="r")
+        self.doc_terms = np.load(self.path / "doc_terms.npy", mmap_mode="r")
+
+    def postings(self, token: str) -> np.ndarray:
+        """Sorted row ids containing token."""
+        term = self.term_ids.get(token)
+        if term is None:
+            return np.empty(0, dtype=np.int64)
+        start, stop = self.term_offsets[term], self.term_offsets[term + 1]
+        return np.cumsum(self.postings_gaps[start:stop], dtype=np.int64)
+
+    def query_keyword(self, keyword: str) -> np.ndarray:
+        """Rows containing every token of keyword (candidates for a phrase match)."""
+        tokens = tokenize(keyword)
+        if not tokens:
+            return np.empty(0, dtype=np.int64)
+        lists = sorted((self.postings(tok) for tok in dict.fromkeys(tokens)), key=len)
+        rows = lists[0]
+        for other in lists[1:]:
+            if not len(rows):
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def query_substring(self, text: str) -> np.ndarray:
+        """
+        Candidate rows whose normalized text may contain text as a substring.
+
+        Every word run of text must lie inside some token of the row, so the
+        candidates are the rows having, for each run, a token containing it.
+        Callers verify the substring on the candidates.
+        """
+        runs = list(dict.fromkeys(_TOKEN.findall(normalize_text(text))))
+        if not runs:
+            return np.arange(self.n_rows, dtype=np.int64)
+        rows = None
+        for run in sorted(runs, key=len, reverse=True):
+            lists = [self.postings(term) for term in self.vocab if run in term]
+            hit = np.unique(np.concatenate(lists)) if lists else np.empty(0, dtype=np.int64)
+            rows = hit if rows is None else np.intersect1d(rows, hit, assume_unique=True)
+            if not len(rows):
+                break
+        return rows
+
+    def query_any(self, keywords: Iterable[str]) -> np.ndarray:
+        hits = [self.query_keyword(kw) for kw in keywords]
+        return np.unique(np.concatenate(hits)) if hits else np.empty(0, dtype=np.int64)
+
+    def query_all(self, keywords: Iterable[str]) -> np.ndarray:
+        rows = None
+        for kw in keywords:
+            hit = self.query_keyword(kw)
+            rows = hit if rows is None else np.intersect1d(rows, hit, assume_unique=True)
+        return rows if rows is not None else np.empty(0, dtype=np.int64)
+
+    def term_counts(self, rows: np.ndarray) -> np.ndarray:
+        """Number of the given rows containing each term id."""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.doc_offsets[rows]
+        lengths = self.doc_offsets[rows + 1] - starts
+        run_starts = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - run_starts, lengths) + np.arange(lengths.sum())
+        return np.bincount(self.doc_terms[positions], minlength=len(self.vocab))
+
+
+def index_mask(
+    df: pd.DataFrame,
+    keywords: Iterable[str],
+    index: DayIndex,
+    text_col: str = "Text",
+) -> pd.Series:
+    """
+    Boolean mask of rows matching any keyword as whole words.
+
+    Only the index's candidate rows are normalized and checked. df must hold
+    the same rows, in the same order, as the indexed shard.
+    """
+    if len(df) != index.n_rows:
+        raise ValueError(f"index covers {index.n_rows} rows but df has {len(df)}")
+    matcher = KeywordMatcher(keywords, word_boundary=True)
+    rows = index.query_any(matcher.keywords)
+    hits = np.zeros(len(df), dtype=bool)
+    hits[rows] = matcher.mask(normalize_series(df[text_col].iloc[rows])).to_numpy()
+    return pd.Series(hits, index=df.index)
+
+
+def filter_with_index(
+    df: pd.DataFrame,
+    keywords: Iterable[str],
+    index: DayIndex,
+    text_col: str = "Text",
+    return_matches: bool = False,
+) -> pd.DataFrame:
+    """
+    Rows of df matching any keyword as whole words, scanning only index candidates.
+
+    df must hold the same rows, in the same order, as the indexed shard.
+    """
+    out = df.loc[index_mask(df, keywords, index, text_col=text_col)]
+    if return_matches:
+        matcher = KeywordMatcher(keywords, word_boundary=True)
+        out = out.copy()
+        out["matched_keywords"] = matcher.matches(normalize_series(out[text_col]))
+    return out
+
+
+class InvertedIndex:
+    """All day partitions under index_dir (<index_dir>/day=YYYY-MM-DD/)."""
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = Path(index_dir)
+        self.days = sorted(p.name.split("=", 1)[1] for p in self.index_dir.glob("day=*") if p.is_dir())
+        self._partitions: dict[str, DayIndex] = {}
+
+    def partition(self, day: str) -> DayIndex:
+        if day not in self._partitions:
+            self._partitions[day] = DayIndex(self.index_dir / f"day={day}")
+        return self._partitions[day]
+
+    def query_any(self, keywords: Iterable[str], days: Iterable[str] | None = None) -> dict[str, np.ndarray]:
+        keywords = list(keywords)
+        return {day: self.partition(day).query_any(keywords) for day in (days or self.days)}
+
+
+def build_index(
+    data_dir: Path,
+    index_dir: Path,
+    pattern: str = "*.csv",
+    text_col: str = "Text",
+    chunksize: int = 200_000,
+    overwrite: bool = False,
+) -> InvertedIndex:
+    """Index every shard; partitions whose shard is unchanged (size/mtime) are kept."""
+    files = sorted(Path(data_dir).glob(pattern))
+    if not files:
+        raise FileNotFoundError(f"No CSV files matching {pattern} in {data_dir}")
+    for csv_path in files:
+        out_dir = Path(index_dir) / f"day={csv_path.stem}"
+        meta_path = out_dir / "meta.json"
+        if meta_path.exists() and not overwrite:
+            with meta_path.open("r", encoding="utf-8") as f:
+                meta = json.load(f)
+            stat = csv_path.stat()
+            if meta["size"] == stat.st_size and meta["mtime"] == stat.st_mtime:
+                continue
+        rows = build_day_index(csv_path, out_dir, text_col=text_col, chunksize=chunksize)
+        print(f"{csv_path.stem}: indexed {rows:,} rows")
+    return InvertedIndex(index_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the per-day token inverted index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Index CSV shards")
+    build.add_argument("--data-dir", type=Path, default=Path("2011-12-csv"))
+    build.add_argument("--index-dir", type=Path, default=Path("2011-12-index"))
+    build.add_argument("--pattern", default="*.csv")
+    build.add_argument("--text-col", default="Text")
+    build.add_argument("--overwrite", action="store_true")
+
+    query = sub.add_parser("query", help="Count rows matching any keyword per day")
+    query.add_argument("keywords", nargs="+")
+    query.add_argument("--index-dir", type=Path, default=Path("2011-12-index"))
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build_index(args.data_dir, args.index_dir, pattern=args.pattern, text_col=args.text_col, overwrite=args.overwrite)
+        return
+
+    start = time.perf_counter()
+    hits = InvertedIndex(args.index_dir).query_any(args.keywords)
+    elapsed = time.perf_counter() - start
+    for day, rows in hits.items():
+        print(f"{day}: {len(rows):,}")
+    print(f"\nCandidate rows: {sum(len(r) for r in hits.values()):,} in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import re
+from typing import Iterable, List
+
+import pandas as pd
+
+
+def clean_keywords(keywords: Iterable[str]) -> List[str]:
+    """
+    Lowercase, strip and de-duplicate keywords, keeping their first-seen order.
+    """
+    cleaned: List[str] = []
+    seen = set()
+    for kw in keywords:
+        if kw is None:
+            continue
+        kw = str(kw).strip().lower()
+        if kw and kw not in seen:
+            seen.add(kw)
+            cleaned.append(kw)
+    return cleaned
+
+
+class KeywordMatcher:
+    """
+    Matches a whole keyword list in one pass per document.
+
+    All keywords are compiled into a single alternation (longest first, so
+    "climate change" wins over "climate" at the same position). With
+    word_boundary=True a keyword only matches when it is not glued to other
+    word characters, so "ice" no longer matches "police".
+    """
+
+    def __init__(self, keywords: Iterable[str], word_boundary: bool = False):
+        self.keywords = clean_keywords(keywords)
+        if not self.keywords:
+            raise ValueError("keywords must contain at least one non-empty string")
+        self.word_boundary = word_boundary
+
+        alternation = "|".join(
+            re.escape(kw) for kw in sorted(self.keywords, key=len, reverse=True)
+        )
+        if word_boundary:
+            # RE2 (Arrow string kernels) has no lookarounds; consuming a
+            # non-word neighbour gives the same yes/no answer for mask().
+            self._arrow_pattern = rf"(?:^|[^\pL\pN_])(?:{alternation})(?:[^\pL\pN_]|$)"
+            alternation = rf"(?<!\w)(?:{alternation})(?!\w)"
+        else:
+            alternation = f"(?:{alternation})"
+            self._arrow_pattern = alternation
+        self.pattern = re.compile(alternation)
+        # Zero-width lookahead so overlapping hits ("immigration" and
+        # "migration") are all reported when auditing.
+        self._find_pattern = re.compile(f"(?=({alternation}))")
+        # The alternation reports one keyword per position; keywords nested
+        # inside a hit ("climate" in "climate change") are implied by it.
+        self._implied = {}
+        for kw in self.keywords:
+            others = [
+                other for other in self.keywords
+                if other != kw and re.search(self._single_pattern(other), kw)
+            ]
+            if others:
+                self._implied[kw] = others
+
+    def _single_pattern(self, kw: str) -> str:
+        if self.word_boundary:
+            return rf"(?<!\w){re.escape(kw)}(?!\w)"
+        return re.escape(kw)
+
+    def search(self, text: str) -> bool:
+        return self.pattern.search(text or "") is not None
+
+    def find_all(self, text: str) -> List[str]:
+        """Return the distinct keywords found in text, in order of first hit."""
+        hits = self._find_pattern.findall(text or "")
+        if self._implied:
+            hits = [kw for hit in hits for kw in (hit, *self._implied.get(hit, ()))]
+        return list(dict.fromkeys(hits))
+
+    def mask(self, texts: pd.Series) -> pd.Series:
+        """
+        Boolean mask of rows (already normalized) containing any keyword.
+
+        Arrow-backed strings (see preprocess.normalize_series) are matched
+        with RE2 in C++; other Series with Python's re, row by row.
+        """
+        if getattr(texts.dtype, "storage", None) == "pyarrow":
+            hits = texts.str.contains(self._arrow_pattern, regex=True, na=False)
+        else:
+            hits = texts.str.contains(self.pattern, na=False)
+        return hits.astype(bool)
+
+    def matches(self, texts: pd.Series) -> pd.Series:
+        """Per-row list of matched keywords (empty list when nothing hits)."""
+        return texts.map(self.find_all)
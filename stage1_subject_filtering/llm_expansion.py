@@ -1,22 +1,268 @@
+"""
+LLM synonym expansion with a persistent cache and pluggable backends.
+
+Nothing network-related happens at import time: the OpenAI client, pydantic
+and .env loading are only touched on the first uncached request. Results are
+cached on disk keyed by (model, prompt, word), so repeated runs never
+re-query the same subject. FileBackend lookups are not cached, so edits to
+its file take effect on the next run. Backends:
+
+- OpenAIBackend: the OpenAI Responses API (default)
+- LocalServerBackend: any OpenAI-compatible chat server, e.g. a local stand-in
+- FileBackend: a JSON file {word: [synonyms]} for fully offline runs
+
+The backend can be set with set_backend() or the SYNONYM_BACKEND environment
+variable ("openai", "file:<path>" or "local:<base_url>").
+"""
+import asyncio
+import hashlib
+import json
 import os
-from dotenv import load_dotenv
-from openai import OpenAI
-from pydantic import BaseModel
-
-load_dotenv()  # loads .env into environment
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-class Synonyms(BaseModel):
-    synonyms: list[str]
-
-def get_synonyms(word: str) -> list[str]:
-    response = client.responses.parse(
-        model="gpt-4o-2024-08-06",
-        input=[
-            {"role": "system", "content": "Return a concise list of synonyms."},
-            {"role": "user", "content": f"Give synonyms for: {word}"},
-        ],
-        text_format=Synonyms,
-    )
-    return response.output_parsed.synonyms
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_MODEL = "gpt-4o-2024-08-06"
+SYSTEM_PROMPT = "Return a concise list of synonyms."
+USER_PROMPT = "Give synonyms for: {word}"
+JSON_SYSTEM_PROMPT = SYSTEM_PROMPT + ' Answer as JSON: {"synonyms": [...]}'
+DEFAULT_CACHE_PATH = Path(".llm_cache/synonyms.sqlite")
+
+
+@lru_cache(maxsize=None)
+def synonyms_model():
+    """Pydantic schema for structured output (imported only when needed)."""
+    from pydantic import BaseModel
+
+    class Synonyms(BaseModel):
+        synonyms: list[str]
+
+    return Synonyms
+
+
+def _load_dotenv():
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()  # loads .env into environment
+
+
+class OpenAIBackend:
+    cacheable = True
+
+    def __init__(self, model: str = DEFAULT_MODEL, api_key: Optional[str] = None, base_url: Optional[str] = None):
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def prompt(self) -> str:
+        return f"{SYSTEM_PROMPT}\n{USER_PROMPT}"
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+
+                _load_dotenv()
+                self._client = OpenAI(
+                    api_key=self.api_key or os.getenv("OPENAI_API_KEY"),
+                    base_url=self.base_url,
+                )
+        return self._client
+
+    def fetch(self, word: str) -> List[str]:
+        response = self.client().responses.parse(
+            model=self.model,
+            input=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": USER_PROMPT.format(word=word)},
+            ],
+            text_format=synonyms_model(),
+        )
+        return response.output_parsed.synonyms
+
+
+class LocalServerBackend(OpenAIBackend):
+    """OpenAI-compatible chat completions server (no Responses API needed)."""
+
+    def __init__(self, base_url: str, model: str = "local", api_key: str = "not-needed"):
+        super().__init__(model=model, api_key=api_key, base_url=base_url)
+
+    @property
+    def prompt(self) -> str:
+        return f"{JSON_SYSTEM_PROMPT}\n{USER_PROMPT}"
+
+    def fetch(self, word: str) -> List[str]:
+        response = self.client().chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": JSON_SYSTEM_PROMPT},
+                {"role": "user", "content": USER_PROMPT.format(word=word)},
+            ],
+            response_format={"type": "json_object"},
+        )
+        return synonyms_model().model_validate_json(response.choices[0].message.content).synonyms
+
+
+class FileBackend:
+    """Offline lookup in a JSON file mapping words to synonym lists (case-insensitive)."""
+
+    # The table is already in memory, and caching would outlive edits to the file.
+    cacheable = False
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with self.path.open("r", encoding="utf-8") as f:
+            self.table = {str(k).strip().lower(): list(v) for k, v in json.load(f).items()}
+        self.model = f"file:{self.path.name}"
+        self.prompt = ""
+
+    def fetch(self, word: str) -> List[str]:
+        return self.table.get(word.strip().lower(), [])
+
+
+class SynonymCache:
+    """Persistent (model, prompt, word) -> synonyms cache backed by SQLite."""
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS synonyms ("
+            "model TEXT, prompt_hash TEXT, word TEXT, synonyms TEXT, "
+            "PRIMARY KEY (model, prompt_hash, word))"
+        )
+
+    @staticmethod
+    def _key(backend, word: str):
+        prompt_hash = hashlib.sha256(backend.prompt.encode("utf-8")).hexdigest()[:16]
+        return backend.model, prompt_hash, word.strip().lower()
+
+    def get(self, backend, word: str) -> Optional[List[str]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT synonyms FROM synonyms WHERE model = ? AND prompt_hash = ? AND word = ?",
+                self._key(backend, word),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, backend, word: str, synonyms: List[str]):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO synonyms VALUES (?, ?, ?, ?)",
+                (*self._key(backend, word), json.dumps(synonyms)),
+            )
+
+
+_backend = None
+_cache = None
+
+
+def backend_from_env():
+    _load_dotenv()
+    spec = os.getenv("SYNONYM_BACKEND", "openai")
+    if spec.startswith("file:"):
+        return FileBackend(Path(spec[len("file:"):]))
+    if spec.startswith("local:"):
+        return LocalServerBackend(base_url=spec[len("local:"):])
+    if spec == "openai":
+        return OpenAIBackend()
+    raise ValueError(f"Unknown SYNONYM_BACKEND: {spec}")
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = backend_from_env()
+    return _backend
+
+
+def get_cache() -> SynonymCache:
+    global _cache
+    if _cache is None:
+        _cache = SynonymCache(Path(os.getenv("SYNONYM_CACHE", DEFAULT_CACHE_PATH)))
+    return _cache
+
+
+def get_synonyms(word: str, use_cache: bool = True) -> list[str]:
+    backend = get_backend()
+    use_cache = use_cache and getattr(backend, "cacheable", True)
+    if use_cache:
+        cached = get_cache().get(backend, word)
+        if cached is not None:
+            return cached
+    synonyms = backend.fetch(word)
+    if use_cache:
+        get_cache().put(backend, word, synonyms)
+    return synonyms
+
+
+async def get_synonyms_many_async(
+    words: Iterable[str],
+    max_concurrency: int = 8,
+    use_cache: bool = True,
+) -> Dict[str, List[str]]:
+    """
+    Expand many words concurrently, at most max_concurrency requests in flight.
+
+    Cached words are answered without a request. A word whose request fails
+    maps to an empty list, so one failure does not abort the batch.
+    """
+    backend = get_backend()
+    use_cache = use_cache and getattr(backend, "cacheable", True)
+    words = list(dict.fromkeys(w for w in words if w and str(w).strip()))
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def expand(word: str) -> List[str]:
+        if use_cache:
+            cached = get_cache().get(backend, word)
+            if cached is not None:
+                return cached
+        async with semaphore:
+            try:
+                synonyms = await asyncio.to_thread(backend.fetch, word)
+            except Exception as exc:
+                print(f"Synonym expansion failed for {word!r}: {exc}")
+                return []
+        if use_cache:
+            get_cache().put(backend, word, synonyms)
+        return synonyms
+
+    results = await asyncio.gather(*(expand(w) for w in words))
+    return dict(zip(words, results))
+
+
+def get_synonyms_many(
+    words: Iterable[str],
+    max_concurrency: int = 8,
+    use_cache: bool = True,
+) -> Dict[str, List[str]]:
+    """
+    Blocking wrapper around get_synonyms_many_async.
+
+    Inside a running event loop (e.g. Jupyter) the batch runs on its own loop
+    in a worker thread; async callers can await get_synonyms_many_async instead.
+    """
+    words = list(words)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(get_synonyms_many_async(words, max_concurrency, use_cache))
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(
+            lambda: asyncio.run(get_synonyms_many_async(words, max_concurrency, use_cache))
+        ).result()
@@ -1,7 +1,81 @@
 import re
+import weakref
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+
+    _ARROW_STRING = "string[pyarrow]"
+except ImportError:  # pandas string kernels then run over Python objects
+    _ARROW_STRING = None
+
+# Every character str.isspace() accepts (what re's \s matches), spelled out
+# so the same class also compiles under pyarrow's RE2, where \s is ASCII only.
+_WHITESPACE = "\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000"
+_SEPARATORS = f"[#{_WHITESPACE}]+"
+# Characters whose str.lower() differs from the Arrow kernel ("İ" -> "i̇", final sigma).
+_SPECIAL_LOWER = "[\u0130\u03a3]"
+
 
 def normalize_text(s: str) -> str:
     s = (s or "").lower()
     s = s.replace("#", " ")                  # keep hashtag words, drop '#'
     s = re.sub(r"\s+", " ", s).strip()
     return s
+
+
+def normalize_series(texts: pd.Series) -> pd.Series:
+    """
+    normalize_text over a whole Series with pandas string kernels.
+
+    Gives the same strings as .map(normalize_text) (missing values become "").
+    Texts are converted to Arrow-backed strings when pyarrow is installed, so
+    lowercasing and the regex replace run in Arrow's C++ kernels.
+    """
+    texts = texts.fillna("").astype(str)
+    if _ARROW_STRING and texts.dtype == object:
+        texts = texts.astype(_ARROW_STRING)
+    lowered = texts.str.lower()
+    special = texts.str.contains(_SPECIAL_LOWER, regex=True).to_numpy(dtype=bool)
+    if special.any():
+        lowered = lowered.where(~special, texts[special].map(str.lower))
+    # '#' -> ' ' then collapsing whitespace runs equals collapsing runs of both.
+    return lowered.str.replace(_SEPARATORS, " ", regex=True).str.strip()
+
+
+# (id(df), column) -> (Arrow data, index, normalized Series); entries are
+# dropped when their DataFrame is garbage collected.
+_normalized_cache: dict[tuple[int, str], tuple] = {}
+
+
+def _arrow_data(column: pd.Series):
+    """The column's immutable Arrow data, or None when it is not Arrow-backed."""
+    # Arrow arrays are never written in place: editing a cell swaps in a new
+    # array, so its identity says whether the values changed. NumPy-backed
+    # columns can change under the same buffer and are not cached.
+    array = column.array
+    return array.__arrow_array__() if isinstance(array, pd.arrays.ArrowExtensionArray) else None
+
+
+def normalized_text(df: pd.DataFrame, text_col: str = "text") -> pd.Series:
+    """
+    normalize_series(df[text_col]), computed once per DataFrame and column.
+
+    Only Arrow-backed columns (pandas' default str dtype with pyarrow, or
+    string[pyarrow]) are cached; the cached Series is reused while df keeps
+    the same index and the same Arrow data, so any edit recomputes it.
+    """
+    column = df[text_col]
+    data = _arrow_data(column)
+    if data is None:
+        return normalize_series(column)
+    key = (id(df), text_col)
+    hit = _normalized_cache.get(key)
+    if hit is not None and hit[1] is df.index and hit[0] is data:
+        return hit[2]
+    text_norm = normalize_series(column)
+    if hit is None:
+        weakref.finalize(df, _normalized_cache.pop, key, None)
+    _normalized_cache[key] = (data, df.index, text_norm)
+    return text_norm
@@ -0,0 +1,434 @@
+"""Semantic subject filtering over a persistent nearest-neighbour index.
+
+`build` embeds every tweet of the month once (through embedding_cache, so
+texts already encoded are not encoded again) and writes an IVF index: a
+spherical k-means coarse quantizer plus the vectors stored list by list, with
+the (shard, row, id) of every vector. A query embeds the subject (and any
+expanded keywords), scores only the n_probe lists whose centroids are
+closest, and answers with a radius (cosine >= radius) or a top-k search; a
+row's score is its best similarity to any query text. Probing a few dozen of
+~10k lists scores well under 1% of the month per query.
+
+With hnswlib installed, `build --hnsw` also writes an HNSW graph, used for
+top-k queries instead of the lists.
+
+    python -m stage1_subject_filtering.semantic_filtering build --data-dir 2011-12-csv --index-dir 2011-12-semantic
+    python -m stage1_subject_filtering.semantic_filtering query immigration --keywords migrant asylum --top-k 5000
+
+Hits can be combined with the lexical filter (combine="and" keeps semantic
+hits that also contain a keyword, "or" adds every lexical match). Because
+the index is built through the same EmbeddingStore as bertopic_jsd, feeding
+the hit texts to prepare_corpus/embed_corpus only reads cached embeddings;
+SemanticIndex.embeddings() returns them directly as well.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from embedding_cache import EmbeddingStore
+from news_alignment import auto_block_size
+from tweet_store import parse_tweet_ids
+
+from .keyword_matcher import KeywordMatcher
+from .preprocess import normalize_series
+
+COMBINE = ("semantic", "and", "or")
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, block_size: int | None = None) -> np.ndarray:
+    # Blocks sized so the (block x n_lists) score matrix stays near SCORE_CELLS.
+    block_size = block_size or auto_block_size(len(centroids))
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(sample: np.ndarray, n_lists: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means (cosine) on a sample of normalized vectors."""
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = _nearest(sample, centroids)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=n_lists)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        sums = np.add.reduceat(sample[order], starts[filled], axis=0)
+        centroids[filled] = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        # Re-seed empty lists so every list ends up used.
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+    return centroids
+
+
+def _shard_texts(path: Path, text_col: str) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """(texts, rows, ids) of the non-empty tweets of one shard."""
+    df = pd.read_csv(path, usecols=[text_col, "id"], dtype={"id": str})
+    texts = df[text_col].fillna("").astype(str)
+    keep = (texts.str.strip() != "").to_numpy()
+    rows = np.flatnonzero(keep).astype(np.int32)
+    ids = parse_tweet_ids(df["id"]).fill_null(-1).to_numpy()[keep]
+    return texts[keep].tolist(), rows, ids
+
+
+def build_index(
+    data_dir: Path,
+    index_dir: Path,
+    store: EmbeddingStore,
+    pattern: str = "*.csv",
+    text_col: str = "Text",
+    n_lists: int | None = None,
+    dtype: str = "float16",
+    sample_size: int = 262_144,
+    chunk_size: int = 65_536,
+    hnsw: bool = False,
+) -> "SemanticIndex":
+    """
+    Embed every tweet in the shards and write the IVF index to index_dir.
+
+    n_lists defaults to 4 * sqrt(tweets). Vectors are stored as dtype
+    (float16 halves the index; scores are computed in float32).
+    """
+    files = sorted(Path(data_dir).glob(pattern))
+    if not files:
+        raise FileNotFoundError(f"No CSV files matching {pattern} in {data_dir}")
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    dtype = np.dtype(dtype)
+    raw_path = index_dir / "vectors.raw.tmp"
+
+    shards, rows, ids = [], [], []
+    n = 0
+    with raw_path.open("wb") as raw:
+        for shard_no, path in enumerate(files):
+            texts, shard_rows, shard_ids = _shard_texts(path, text_col)
+            for start in range(0, len(texts), chunk_size):
+                np.ascontiguousarray(store.encode(texts[start:start + chunk_size]), dtype=dtype).tofile(raw)
+            shards.append(np.full(len(texts), shard_no, dtype=np.int16))
+            rows.append(shard_rows)
+            ids.append(shard_ids)
+            n += len(texts)
+            print(f"{path.name}: {len(texts):,} tweets embedded")
+    if not n:
+        raise ValueError("No non-empty tweets to index")
+
+    dim = store.dim
+    vectors = np.memmap(raw_path, dtype=dtype, mode="r", shape=(n, dim))
+    n_lists = min(n, n_lists or max(1, int(4 * np.sqrt(n))))
+    rng = np.random.default_rng(0)
+    sample = vectors[np.sort(rng.choice(n, min(n, max(sample_size, n_lists)), replace=False))]
+    centroids = train_centroids(sample, n_lists)
+
+    labels = _nearest(vectors, centroids)
+    order = np.argsort(labels, kind="stable")
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=n_lists), out=offsets[1:])
+
+    out = np.memmap(index_dir / "vectors.bin", dtype=dtype, mode="w+", shape=(n, dim))
+    for start in range(0, n, chunk_size):
+        part = order[start:start + chunk_size]
+        out[start:start + len(part)] = vectors[np.sort(part)][np.argsort(np.argsort(part))]
+    out.flush()
+    del out, vectors
+    raw_path.unlink()
+
+    np.save(index_dir / "centroids.npy", centroids)
+    np.save(index_dir / "offsets.npy", offsets)
+    np.save(index_dir / "shards.npy", np.concatenate(shards)[order])
+    np.save(index_dir / "rows.npy", np.concatenate(rows)[order])
+    np.save(index_dir / "ids.npy", np.concatenate(ids)[order])
+    meta = {
+        "model": store.model_name,
+        "normalize": store.normalize,
+        "store_dtype": store.dtype.name,
+        "dtype": dtype.name,
+        "dim": dim,
+        "n": n,
+        "n_lists": n_lists,
+        "text_col": text_col,
+        "data_dir": str(Path(data_dir).resolve()),
+        "shards": [f.name for f in files],
+    }
+    with (index_dir / "meta.json").open("w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=1)
+
+    index = SemanticIndex(index_dir)
+    if hnsw:
+        index.build_hnsw()
+    return index
+
+
+class SemanticIndex:
+    """Read side of an index written by build_index."""
+
+    def __init__(self, index_dir: Path):
+        self.dir = Path(index_dir)
+        with (self.dir / "meta.json").open("r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.centroids = np.load(self.dir / "centroids.npy")
+        self.offsets = np.load(self.dir / "offsets.npy")
+        self.shards = np.load(self.dir / "shards.npy", mmap_mode="r")
+        self.rows = np.load(self.dir / "rows.npy", mmap_mode="r")
+        self.ids = np.load(self.dir / "ids.npy", mmap_mode="r")
+        self.vectors = np.memmap(
+            self.dir / "vectors.bin", dtype=self.meta["dtype"], mode="r", shape=(self.meta["n"], self.meta["dim"])
+        )
+        self._hnsw = None
+        self._positions = None
+
+    def __len__(self) -> int:
+        return self.meta["n"]
+
+    def store(self, root: Path | None = None, encoder=None) -> EmbeddingStore:
+        """The EmbeddingStore namespace the index was built with (for encoding queries)."""
+        kwargs = {"root": root} if root is not None else {}
+        return EmbeddingStore(
+            self.meta["model"], normalize=self.meta["normalize"], dtype=self.meta["store_dtype"], encoder=encoder, **kwargs
+        )
+
+    def build_hnsw(self, ef_construction: int = 200, m: int = 16, chunk_size: int = 65_536):
+        try:
+            import hnswlib
+        except ImportError as exc:
+            raise ImportError("The HNSW index requires the 'hnswlib' package") from exc
+        index = hnswlib.Index(space="ip", dim=self.meta["dim"])
+        index.init_index(max_elements=len(self), ef_construction=ef_construction, M=m)
+        for start in range(0, len(self), chunk_size):
+            block = np.asarray(self.vectors[start:start + chunk_size], dtype=np.float32)
+            index.add_items(block, np.arange(start, start + len(block)))
+        index.save_index(str(self.dir / "hnsw.bin"))
+        self._hnsw = index
+
+    def _load_hnsw(self):
+        if self._hnsw is None and (self.dir / "hnsw.bin").exists():
+            import hnswlib
+
+            self._hnsw = hnswlib.Index(space="ip", dim=self.meta["dim"])
+            self._hnsw.load_index(str(self.dir / "hnsw.bin"), max_elements=len(self))
+        return self._hnsw
+
+    def search(
+        self,
+        queries: np.ndarray,
+        top_k: int | None = None,
+        radius: float | None = None,
+        n_probe: int = 32,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (positions, scores) of vectors close to any query, best first.
+
+        radius keeps scores >= radius, top_k the k best (both may be given).
+        Queries must be normalized like the index vectors.
+        """
+        if top_k is None and radius is None:
+            raise ValueError("give top_k, radius or both")
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        hnsw = self._load_hnsw() if top_k is not None and radius is None else None
+        if hnsw is not None:
+            positions, scores = self._search_hnsw(hnsw, queries, top_k)
+        else:
+            positions, scores = self._search_lists(queries, n_probe)
+
+        if radius is not None:
+            keep = scores >= radius
+            positions, scores = positions[keep], scores[keep]
+        if top_k is not None and len(scores) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            positions, scores = positions[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+        return positions[order], scores[order]
+
+    def _search_lists(self, queries: np.ndarray, n_probe: int) -> tuple[np.ndarray, np.ndarray]:
+        n_probe = min(n_probe, len(self.centroids))
+        probe = np.argpartition(-(queries @ self.centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+        lists = np.unique(probe)
+        positions = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists])
+        # Lists are contiguous, so this reads a handful of slices of the memmap.
+        vectors = np.concatenate([self.vectors[self.offsets[i]:self.offsets[i + 1]] for i in lists])
+        scores = (np.asarray(vectors, dtype=np.float32) @ queries.T).max(axis=1)
+        return positions, scores
+
+    def _search_hnsw(self, hnsw, queries: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        k = min(top_k, len(self))
+        hnsw.set_ef(max(k, 64))
+        labels, distances = hnsw.knn_query(queries, k=k)
+        positions, scores = labels.ravel().astype(np.int64), 1.0 - distances.ravel()
+        # The same tweet can be a neighbour of several queries; keep its best score.
+        order = np.lexsort((-scores, positions))
+        first = np.concatenate([[True], np.diff(positions[order]) != 0])
+        return positions[order][first], scores[order][first]
+
+    def scores_at(self, positions: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """Exact best similarity to any query for the given index positions."""
+        vectors = np.asarray(self.vectors[np.sort(positions)], dtype=np.float32)
+        scores = (vectors @ np.atleast_2d(queries).T).max(axis=1)
+        return scores[np.argsort(np.argsort(positions))]
+
+    def positions(self, shards: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Index position per (shard number, row), -1 where the tweet is not indexed."""
+        if self._positions is None:
+            keys = (np.asarray(self.shards, dtype=np.int64) << 32) | np.asarray(self.rows, dtype=np.int64)
+            order = np.argsort(keys, kind="stable")
+            self._positions = (keys[order], order)
+        sorted_keys, order = self._positions
+        keys = (np.asarray(shards, dtype=np.int64) << 32) | np.asarray(rows, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        found = sorted_keys[pos] == keys
+        return np.where(found, order[pos], -1)
+
+    def hits_frame(self, positions: np.ndarray, scores: np.ndarray) -> pd.DataFrame:
+        """(day, row, id, score, position) per hit; day is the shard name without suffix."""
+        names = np.array([Path(s).stem for s in self.meta["shards"]], dtype=object)
+        return pd.DataFrame({
+            "day": names[np.asarray(self.shards[positions], dtype=np.int64)],
+            "row": np.asarray(self.rows[positions], dtype=np.int64),
+            "id": np.asarray(self.ids[positions]),
+            "score": np.asarray(scores, dtype=np.float32),
+            "position": positions,
+        })
+
+    def texts(self, hits: pd.DataFrame, data_dir: Path | None = None) -> pd.Series:
+        """Tweet text per hit, read from the shards the index was built from."""
+        data_dir = Path(data_dir or self.meta["data_dir"])
+        text_col = self.meta["text_col"]
+        out = pd.Series("", index=hits.index, dtype=object)
+        for day, group in hits.groupby("day", sort=False):
+            shard = pd.read_csv(data_dir / f"{day}.csv", usecols=[text_col])[text_col]
+            out.loc[group.index] = shard.iloc[group["row"].to_numpy()].fillna("").astype(str).to_numpy()
+        return out
+
+    def embeddings(self, hits: pd.DataFrame) -> np.ndarray:
+        """float32 vectors of the hits, in hit order, without encoding anything."""
+        positions = hits["position"].to_numpy()
+        vectors = np.asarray(self.vectors[np.sort(positions)], dtype=np.float32)
+        return vectors[np.argsort(np.argsort(positions))]
+
+
+def _lexical_hits(index: SemanticIndex, keywords: list[str], word_boundary: bool, data_dir: Path | None):
+    """(shard numbers, rows) of every tweet matching a keyword (scans the shard texts)."""
+    matcher = KeywordMatcher(keywords, word_boundary=word_boundary)
+    data_dir = Path(data_dir or index.meta["data_dir"])
+    text_col = index.meta["text_col"]
+    shards, rows = [], []
+    for shard_no, name in enumerate(index.meta["shards"]):
+        offset = 0
+        for chunk in pd.read_csv(data_dir / name, usecols=[text_col], chunksize=200_000):
+            hit = np.flatnonzero(matcher.mask(normalize_series(chunk[text_col])).to_numpy()) + offset
+            shards.append(np.full(len(hit), shard_no, dtype=np.int64))
+            rows.append(hit)
+            offset += len(chunk)
+    return np.concatenate(shards), np.concatenate(rows)
+
+
+def semantic_filter(
+    index: SemanticIndex,
+    subject: str,
+    keywords: Iterable[str] = (),
+    store: EmbeddingStore | None = None,
+    top_k: int | None = None,
+    radius: float | None = None,
+    n_probe: int = 32,
+    combine: str = "semantic",
+    word_boundary: bool = False,
+    with_text: bool = True,
+    data_dir: Path | None = None,
+) -> pd.DataFrame:
+    """
+    Tweets semantically close to the subject or any of its keywords.
+
+    Give top_k, radius (minimum cosine similarity) or both.
+    combine="and" keeps semantic hits whose text also contains the subject
+    or a keyword; "or" adds every lexical match (this rescans the texts).
+    Returns day, row, id, score, position (and text), best first.
+    """
+    if combine not in COMBINE:
+        raise ValueError(f"combine must be one of {COMBINE}")
+    query_texts = list(dict.fromkeys([subject, *keywords]))
+    store = store or index.store()
+    queries = store.encode(query_texts)
+    positions, scores = index.search(queries, top_k=top_k, radius=radius, n_probe=n_probe)
+    hits = index.hits_frame(positions, scores)
+
+    if combine == "or":
+        lex_shards, lex_rows = _lexical_hits(index, query_texts, word_boundary, data_dir)
+        extra = index.positions(lex_shards, lex_rows)
+        extra = np.setdiff1d(extra[extra >= 0], positions)
+        lexical = index.hits_frame(extra, index.scores_at(extra, queries))
+        hits = pd.concat([hits, lexical], ignore_index=True).sort_values("score", ascending=False, kind="stable")
+        hits = hits.reset_index(drop=True)
+
+    if with_text or combine == "and":
+        hits["text"] = index.texts(hits, data_dir)
+    if combine == "and":
+        matcher = KeywordMatcher(query_texts, word_boundary=word_boundary)
+        hits = hits.loc[matcher.mask(normalize_series(hits["text"])).to_numpy()].reset_index(drop=True)
+        if not with_text:
+            hits = hits.drop(columns=["text"])
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Semantic subject filtering with a nearest-neighbour index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Embed the shards and write the index")
+    build.add_argument("--data-dir", type=Path, default=Path("2011-12-csv"))
+    build.add_argument("--pattern", default="*.csv")
+    build.add_argument("--text-col", default="Text")
+    build.add_argument("--model", default="all-MiniLM-L6-v2")
+    build.add_argument("--n-lists", type=int, default=None, help="IVF lists (default: 4 * sqrt(tweets))")
+    build.add_argument("--dtype", choices=("float16", "float32"), default="float16")
+    build.add_argument("--hnsw", action="store_true", help="Also build an HNSW graph (needs hnswlib)")
+
+    query = sub.add_parser("query", help="Find tweets close to a subject")
+    query.add_argument("subject")
+    query.add_argument("--keywords", nargs="*", default=[])
+    query.add_argument("--top-k", type=int, default=None)
+    query.add_argument("--radius", type=float, default=None, help="Minimum cosine similarity (default 0.5 without --top-k)")
+    query.add_argument("--n-probe", type=int, default=32)
+    query.add_argument("--combine", choices=COMBINE, default="semantic")
+    query.add_argument("--word-boundary", action="store_true")
+    query.add_argument("--output", type=Path, default=None, help="Write hits (with text) to this CSV")
+
+    for p in (build, query):
+        p.add_argument("--index-dir", type=Path, default=Path("2011-12-semantic"))
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        store = EmbeddingStore(args.model, normalize=True)
+        index = build_index(
+            args.data_dir, args.index_dir, store, pattern=args.pattern, text_col=args.text_col,
+            n_lists=args.n_lists, dtype=args.dtype, hnsw=args.hnsw,
+        )
+        print(f"Indexed {len(index):,} tweets in {index.meta['n_lists']:,} lists ({time.perf_counter() - start:.0f}s)")
+        return
+
+    radius = args.radius if args.radius is not None or args.top_k else 0.5
+    index = SemanticIndex(args.index_dir)
+    start = time.perf_counter()
+    hits = semantic_filter(
+        index, args.subject, args.keywords, top_k=args.top_k, radius=radius, n_probe=args.n_probe,
+        combine=args.combine, word_boundary=args.word_boundary, with_text=True,
+    )
+    print(f"{len(hits):,} tweets ({time.perf_counter() - start:.2f}s)")
+    print(hits[["day", "id", "score", "text"]].head(20).to_string(index=False))
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        hits.to_csv(args.output, index=False)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
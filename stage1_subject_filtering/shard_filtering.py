@@ -0,0 +1,186 @@
+"""Filter a whole directory of CSV shards by subject keywords.
+
+Each shard is streamed in chunks inside a worker process and matching rows are
+written to a per-shard part file; the parts are then appended to one output
+CSV in shard order. Memory is bounded by chunksize x workers, not corpus size.
+filter_store() does the same against the Parquet store from tweet_store.py.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Iterable
+
+import pandas as pd
+
+from instrumentation import stage
+
+from .keyword_matcher import KeywordMatcher
+from .preprocess import normalize_series
+
+
+def filter_csv_shard(
+    csv_path: Path,
+    part_path: Path,
+    keywords: list[str],
+    text_col: str = "Text",
+    chunksize: int = 100_000,
+    word_boundary: bool = False,
+    columns: list[str] | None = None,
+) -> tuple[str, int, int]:
+    """
+    Stream one CSV shard and write matching rows to part_path (no header).
+
+    With columns, rows are written as "day" + columns in that order, so parts
+    of shards with differently ordered (or extra) columns line up under one
+    header; a shard lacking one of the columns raises KeyError.
+    """
+    matcher = KeywordMatcher(keywords, word_boundary=word_boundary)
+    if columns is not None:
+        shard_columns = pd.read_csv(csv_path, nrows=0).columns.tolist()
+        missing = [c for c in columns if c not in shard_columns]
+        if missing:
+            raise KeyError(f"{csv_path} has no {missing} column. Columns: {shard_columns}")
+    rows_in = 0
+    rows_out = 0
+    with open(part_path, "w", newline="", encoding="utf-8") as f_out:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype={"id": str}, usecols=columns):
+            rows_in += len(chunk)
+            text_norm = normalize_series(chunk[text_col])
+            matched = chunk.loc[matcher.mask(text_norm)]
+            if len(matched):
+                if columns is not None:
+                    matched = matched[columns]
+                matched.insert(0, "day", csv_path.stem)
+                matched.to_csv(f_out, header=False, index=False)
+                rows_out += len(matched)
+    return csv_path.stem, rows_in, rows_out
+
+
+def filter_csv_directory(
+    input_dir: Path,
+    output_path: Path,
+    keywords: Iterable[str],
+    text_col: str = "Text",
+    pattern: str = "*.csv",
+    chunksize: int = 100_000,
+    workers: int | None = None,
+    word_boundary: bool = False,
+) -> pd.DataFrame:
+    """
+    Filter every shard matching pattern in input_dir into one CSV.
+
+    The output keeps the columns of the first shard (other shards are written
+    in that order) and prepends a 'day' column with the shard name. Returns a
+    per-shard summary of rows in/out.
+    """
+    input_dir = Path(input_dir)
+    output_path = Path(output_path)
+    files = sorted(input_dir.glob(pattern))
+    if not files:
+        raise FileNotFoundError(f"No CSV files matching {pattern} in {input_dir}")
+
+    keywords = KeywordMatcher(keywords).keywords
+    header = pd.read_csv(files[0], nrows=0).columns.tolist()
+    if text_col not in header:
+        raise KeyError(f"'{text_col}' not found in {files[0]}. Columns: {header}")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    summary = []
+
+    with stage("filter_csv_directory") as record, tempfile.TemporaryDirectory(dir=output_path.parent) as tmp_dir:
+        part_paths = [Path(tmp_dir) / f"{f.stem}.part" for f in files]
+        worker = partial(
+            filter_csv_shard,
+            keywords=keywords,
+            text_col=text_col,
+            chunksize=chunksize,
+            word_boundary=word_boundary,
+            columns=header,
+        )
+        with open(output_path, "w", newline="", encoding="utf-8") as f_out:
+            pd.DataFrame(columns=["day"] + header).to_csv(f_out, index=False)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # map() yields in submission order, so parts are appended in
+                # shard order while later shards are still being filtered.
+                for part_path, result in zip(part_paths, pool.map(worker, files, part_paths)):
+                    with open(part_path, "r", newline="", encoding="utf-8") as f_part:
+                        shutil.copyfileobj(f_part, f_out)
+                    part_path.unlink()
+                    summary.append(result)
+                    print(f"{result[0]}: {result[2]:,}/{result[1]:,} rows matched")
+
+    summary = pd.DataFrame(summary, columns=["day", "rows_in", "rows_out"])
+    record.update(rows_in=summary["rows_in"].sum(), rows_out=summary["rows_out"].sum(), shards=len(files))
+    return summary
+
+
+def filter_store(
+    store_dir: Path,
+    keywords: Iterable[str],
+    text_col: str = "Text",
+    columns: list[str] | None = None,
+    days: Iterable[str] | None = None,
+    countries: Iterable[str] | None = None,
+    languages: Iterable[str] | None = None,
+    word_boundary: bool = False,
+    batch_size: int = 200_000,
+) -> pd.DataFrame:
+    """
+    Filter the Parquet tweet store (see tweet_store.py) by subject keywords.
+
+    Only the requested columns and the day/country/language partitions that
+    pass the predicates are read; matches are collected batch by batch.
+    """
+    from tweet_store import iter_tweet_batches
+
+    matcher = KeywordMatcher(keywords, word_boundary=word_boundary)
+    if columns is not None and text_col not in columns:
+        columns = [text_col] + list(columns)
+
+    parts = []
+    for batch in iter_tweet_batches(
+        store_dir, columns=columns, days=days, countries=countries,
+        languages=languages, batch_size=batch_size,
+    ):
+        text_norm = normalize_series(batch[text_col])
+        parts.append(batch.loc[matcher.mask(text_norm)])
+
+    if not parts:
+        return pd.DataFrame(columns=columns or [])
+    return pd.concat(parts, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filter CSV tweet shards by subject keywords.")
+    parser.add_argument("keywords", nargs="+", help="Subject keywords (any match keeps the row)")
+    parser.add_argument("--data-dir", type=Path, default=Path("2011-12-csv"))
+    parser.add_argument("--pattern", default="*.csv", help="Glob for shard files (default: *.csv)")
+    parser.add_argument("--output", type=Path, default=Path("filtered_2011-12.csv"))
+    parser.add_argument("--text-col", default="Text")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--word-boundary", action="store_true", help="Match whole words only")
+    args = parser.parse_args()
+
+    summary = filter_csv_directory(
+        input_dir=args.data_dir,
+        output_path=args.output,
+        keywords=args.keywords,
+        text_col=args.text_col,
+        pattern=args.pattern,
+        chunksize=args.chunksize,
+        workers=args.workers,
+        word_boundary=args.word_boundary,
+    )
+    print(f"\nKept {summary['rows_out'].sum():,} of {summary['rows_in'].sum():,} rows -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Sparse document-term co-occurrence statistics for subject keyword expansion.
+
+Texts are streamed chunk by chunk (or shard by shard on a process pool) into
+a binary document-term matrix X and a document-subject indicator matrix S.
+Only the aggregates are kept: the subject x term co-occurrence counts S.T @ X,
+per-term document frequencies, per-subject document counts and the number
+of documents. Memory depends on the vocabulary, not the corpus, and many
+subjects are expanded in a single pass.
+
+Terms can be ranked by raw co-occurrence count, PMI or Dunning's
+log-likelihood ratio (G^2), so very common words do not dominate.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from .cooccurence_keyword_filtering import STOPWORDS
+from .inverted_index import DayIndex, InvertedIndex, tokenize
+from .keyword_matcher import KeywordMatcher
+from .preprocess import normalize_series, normalize_text
+
+RANKINGS = ("count", "pmi", "llr")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class CooccurrenceStats:
+    """Mergeable subject x term co-occurrence aggregates."""
+
+    def __init__(self, subjects: Iterable[str]):
+        self.subjects = list(dict.fromkeys(normalize_text(s) for s in subjects if s and s.strip()))
+        if not self.subjects:
+            raise ValueError("subjects must contain at least one non-empty string")
+        self.vocab: dict[str, int] = {}
+        self.terms: list[str] = []
+        self.n_docs = 0
+        self.subject_docs = np.zeros(len(self.subjects), dtype=np.int64)
+        self.doc_freq = np.zeros(0, dtype=np.int64)
+        self.joint = csr_matrix((len(self.subjects), 0), dtype=np.int64)
+
+    def _global_ids(self, terms: list[str]) -> np.ndarray:
+        ids = np.empty(len(terms), dtype=np.int64)
+        for i, term in enumerate(terms):
+            gid = self.vocab.get(term)
+            if gid is None:
+                gid = self.vocab[term] = len(self.terms)
+                self.terms.append(term)
+            ids[i] = gid
+        return ids
+
+    def _add_counts(self, joint: csr_matrix, doc_freq: np.ndarray, subject_docs: np.ndarray, n_docs: int, terms: list[str]):
+        """Fold aggregates over a local vocabulary (terms) into the global one."""
+        mapping = self._global_ids(terms)
+        n_terms = len(self.terms)
+        if self.joint.shape[1] < n_terms:
+            self.joint.resize((len(self.subjects), n_terms))
+            self.doc_freq = np.pad(self.doc_freq, (0, n_terms - len(self.doc_freq)))
+        remap = csr_matrix(
+            (np.ones(len(mapping), dtype=np.int64), (np.arange(len(mapping)), mapping)),
+            shape=(len(mapping), n_terms),
+        )
+        self.joint = (self.joint + csr_matrix(joint, dtype=np.int64) @ remap).tocsr()
+        np.add.at(self.doc_freq, mapping, np.asarray(doc_freq, dtype=np.int64))
+        self.subject_docs += np.asarray(subject_docs, dtype=np.int64)
+        self.n_docs += int(n_docs)
+
+    def add_matrices(self, X: csr_matrix, S: csr_matrix, terms: list[str]):
+        """Add a binary (docs x terms) matrix X and (docs x subjects) indicator S."""
+        X = csr_matrix(X, dtype=np.int64)
+        self._add_counts(
+            S.T.astype(np.int64) @ X,
+            np.asarray(X.sum(axis=0)).ravel(),
+            np.asarray(S.sum(axis=0)).ravel(),
+            X.shape[0],
+            terms,
+        )
+
+    def add_texts(self, texts: Iterable[str]):
+        """Tokenize a chunk of raw texts and add it."""
+        text_norm = normalize_series(pd.Series(list(texts), dtype=object))
+        local: dict[str, int] = {}
+        indices: list[int] = []
+        indptr = [0]
+        for text in text_norm:
+            ids = {local.setdefault(tok, len(local)) for tok in _TOKEN.findall(text)}
+            indices.extend(ids)
+            indptr.append(len(indices))
+        X = csr_matrix(
+            (np.ones(len(indices), dtype=np.int8), np.asarray(indices, dtype=np.int64), np.asarray(indptr)),
+            shape=(len(text_norm), len(local)),
+        )
+        self.add_matrices(X, self.subject_indicator(text_norm), list(local))
+
+    def subject_indicator(self, text_norm: pd.Series) -> csr_matrix:
+        """(docs x subjects) matrix of substring matches, found in one pass per doc."""
+        matcher = KeywordMatcher(self.subjects)
+        column = {s: j for j, s in enumerate(self.subjects)}
+        rows, cols = [], []
+        for i, hits in enumerate(matcher.matches(text_norm)):
+            for hit in hits:
+                rows.append(i)
+                cols.append(column[hit])
+        return csr_matrix(
+            (np.ones(len(rows), dtype=np.int8), (rows, cols)),
+            shape=(len(text_norm), len(self.subjects)),
+        )
+
+    def add_index(self, index: DayIndex, texts: Iterable[str] | None = None):
+        """
+        Add one inverted-index day partition.
+
+        Subject rows come from posting lists and term counts from the forward
+        index. Multi-word subjects only guarantee that every word occurs, so
+        their candidates are phrase-checked against texts (the partition's
+        rows, in order); without texts they raise ValueError.
+        """
+        rows = [index.query_keyword(s) for s in self.subjects]
+        phrases = [j for j, s in enumerate(self.subjects) if len(tokenize(s)) > 1]
+        if phrases:
+            if texts is None:
+                raise ValueError(f"multi-word subjects need the partition's texts: {[self.subjects[j] for j in phrases]}")
+            texts = pd.Series(list(texts), dtype=object)
+            if len(texts) != index.n_rows:
+                raise ValueError(f"index covers {index.n_rows} rows but texts has {len(texts)}")
+            for j in phrases:
+                matcher = KeywordMatcher([self.subjects[j]], word_boundary=True)
+                rows[j] = rows[j][matcher.mask(normalize_series(texts.iloc[rows[j]])).to_numpy()]
+        joint = np.stack([index.term_counts(r) for r in rows])
+        subject_docs = [len(r) for r in rows]
+        self._add_counts(csr_matrix(joint), np.diff(index.term_offsets), subject_docs, index.n_rows, index.vocab)
+
+    def merge(self, other: "CooccurrenceStats") -> "CooccurrenceStats":
+        """Fold another set of aggregates (same subjects) into this one."""
+        if other.subjects != self.subjects:
+            raise ValueError("can only merge stats for the same subjects")
+        self._add_counts(other.joint, other.doc_freq, other.subject_docs, other.n_docs, other.terms)
+        return self
+
+    def scores(self, subject: str, ranking: str = "count", min_count: int = 2) -> np.ndarray:
+        """Score per term for one subject; terms below min_count score -inf."""
+        j = self.subjects.index(normalize_text(subject))
+        k11 = self.joint.getrow(j).toarray().ravel().astype(np.float64)
+        if ranking == "count":
+            scores = k11.copy()
+        else:
+            n = float(self.n_docs)
+            n_s = float(self.subject_docs[j])
+            df = self.doc_freq.astype(np.float64)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if ranking == "pmi":
+                    scores = np.log2(k11 * n / (n_s * df))
+                elif ranking == "llr":
+                    observed = np.stack([k11, n_s - k11, df - k11, n - n_s - df + k11])
+                    row = np.array([n_s, n_s, n - n_s, n - n_s])[:, None]
+                    col = np.stack([df, n - df, df, n - df])
+                    expected = row * col / n
+                    terms = np.where(observed > 0, observed * np.log(observed / expected), 0.0)
+                    scores = 2.0 * terms.sum(axis=0)
+                    # Only keep terms over-represented in subject documents.
+                    scores[k11 <= expected[0]] = -np.inf
+                else:
+                    raise ValueError(f"ranking must be one of {RANKINGS}")
+        scores[k11 < min_count] = -np.inf
+        return scores
+
+    def top_terms(self, subject: str, top_n: int = 25, ranking: str = "count", min_count: int = 2) -> list[str]:
+        subject_terms = set(normalize_text(subject).split())
+        scores = self.scores(subject, ranking=ranking, min_count=min_count)
+        words = []
+        for term_id in np.argsort(-scores, kind="stable"):
+            if not np.isfinite(scores[term_id]) or len(words) == top_n:
+                break
+            term = self.terms[term_id]
+            if term in subject_terms or term in STOPWORDS or not _TOKEN.fullmatch(term):
+                continue
+            words.append(term)
+        return words
+
+    def expand(self, top_n: int = 25, ranking: str = "count", min_count: int = 2) -> dict[str, list[str]]:
+        return {s: self.top_terms(s, top_n=top_n, ranking=ranking, min_count=min_count) for s in self.subjects}
+
+
+def _shard_stats(csv_path: Path, subjects: list[str], text_col: str, chunksize: int) -> CooccurrenceStats:
+    stats = CooccurrenceStats(subjects)
+    for chunk in pd.read_csv(csv_path, usecols=[text_col], chunksize=chunksize):
+        stats.add_texts(chunk[text_col])
+    return stats
+
+
+def cooccurrence_from_csv_directory(
+    data_dir: Path,
+    subjects: Iterable[str],
+    text_col: str = "Text",
+    pattern: str = "*.csv",
+    chunksize: int = 100_000,
+    workers: int | None = None,
+) -> CooccurrenceStats:
+    """Stream every shard (one per worker process) and merge the aggregates."""
+    files = sorted(Path(data_dir).glob(pattern))
+    if not files:
+        raise FileNotFoundError(f"No CSV files matching {pattern} in {data_dir}")
+    subjects = CooccurrenceStats(subjects).subjects
+    worker = partial(_shard_stats, subjects=subjects, text_col=text_col, chunksize=chunksize)
+
+    total = CooccurrenceStats(subjects)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        for stats in pool.map(worker, files):
+            total.merge(stats)
+    return total
+
+
+def cooccurrence_from_index(
+    index: InvertedIndex,
+    subjects: Iterable[str],
+    days: Iterable[str] | None = None,
+    text_col: str = "Text",
+) -> CooccurrenceStats:
+    """
+    Aggregate over inverted-index partitions (all days by default).
+
+    Multi-word subjects are phrase-checked, which reads text_col from each
+    partition's source shard.
+    """
+    stats = CooccurrenceStats(subjects)
+    needs_texts = any(len(tokenize(s)) > 1 for s in stats.subjects)
+    for day in days or index.days:
+        partition = index.partition(day)
+        texts = None
+        if needs_texts:
+            texts = pd.read_csv(partition.meta["source"], usecols=[text_col])[text_col]
+        stats.add_index(partition, texts=texts)
+    return stats
+
+
+def expand_subjects(
+    texts: Iterable[str],
+    subjects: Iterable[str],
+    top_n: int = 25,
+    ranking: str = "count",
+    min_count: int = 2,
+    chunksize: int = 100_000,
+) -> dict[str, list[str]]:
+    """Expand several subjects over in-memory texts in one pass."""
+    stats = CooccurrenceStats(subjects)
+    chunk: list[str] = []
+    for text in texts:
+        chunk.append(text)
+        if len(chunk) >= chunksize:
+            stats.add_texts(chunk)
+            chunk = []
+    if chunk:
+        stats.add_texts(chunk)
+    return stats.expand(top_n=top_n, ranking=ranking, min_count=min_count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expand several subjects by co-occurrence over the whole month.")
+    parser.add_argument("subjects", nargs="+")
+    parser.add_argument("--data-dir", type=Path, default=Path("2011-12-csv"))
+    parser.add_argument("--pattern", default="*.csv")
+    parser.add_argument("--index-dir", type=Path, help="Use a prebuilt inverted index instead of the CSV shards")
+    parser.add_argument("--ranking", choices=RANKINGS, default="llr")
+    parser.add_argument("--top-n", type=int, default=25)
+    parser.add_argument("--min-count", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.index_dir:
+        stats = cooccurrence_from_index(InvertedIndex(args.index_dir), args.subjects)
+    else:
+        stats = cooccurrence_from_csv_directory(args.data_dir, args.subjects, pattern=args.pattern, workers=args.workers)
+    print(f"{stats.n_docs:,} documents, {len(stats.terms):,} terms")
+    for subject, words in stats.expand(top_n=args.top_n, ranking=args.ranking, min_count=args.min_count).items():
+        print(f"\n{subject} ({stats.subject_docs[stats.subjects.index(subject)]:,} docs): {', '.join(words)}")
+
+
+if __name__ == "__main__":
+    main()
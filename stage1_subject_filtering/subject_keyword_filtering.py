@@ -1,23 +1,46 @@
 import pandas as pd
 
-from .preprocess import normalize_text 
+from instrumentation import instrumented
 
-def filter_subject_keyword_only(
+from .inverted_index import index_mask
+from .preprocess import normalized_text
+
+
+def subject_keyword_mask(
     df: pd.DataFrame,
     subject: str,
     text_col: str = "text",
-) -> pd.DataFrame:
+    index=None,
+) -> pd.Series:
     """
-    Keeps rows where the subject appears in the text (case-insensitive).
+    Boolean mask (aligned with df) of rows whose text contains the subject.
+
+    The normalized text is computed once per DataFrame and reused by later
+    calls, so chained filters only pay for the substring search.
     """
     subject = subject.strip().lower()
     if subject == "":
         raise ValueError("subject must be non-empty")
 
-    work = df.copy()
-    work["_text_norm"] = work[text_col].fillna("").astype(str).map(normalize_text)
+    if index is not None:
+        return index_mask(df, [subject], index, text_col=text_col)
+
+    text_norm = normalized_text(df, text_col)
+    return text_norm.str.contains(subject, regex=False, na=False).astype(bool)
+
 
-    mask = work["_text_norm"].str.contains(subject, case=False, na=False)
+@instrumented()
+def filter_subject_keyword_only(
+    df: pd.DataFrame,
+    subject: str,
+    text_col: str = "text",
+    index=None,
+) -> pd.DataFrame:
+    """
+    Keeps rows where the subject appears in the text (case-insensitive).
 
-    out = work.loc[mask].drop(columns=["_text_norm"])
-    return out
+    With index (an inverted_index.DayIndex built from the same rows as df),
+    only the index's candidate rows are checked, and the subject must match
+    whole words.
+    """
+    return df.loc[subject_keyword_mask(df, subject, text_col=text_col, index=index)]
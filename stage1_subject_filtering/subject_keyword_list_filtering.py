@@ -1,33 +1,59 @@
 import pandas as pd
-from typing import Iterable, List
+from typing import Iterable
 
-from .preprocess import normalize_text
+from instrumentation import instrumented
 
+from .inverted_index import filter_with_index, index_mask
+from .keyword_matcher import KeywordMatcher
+from .preprocess import normalized_text
 
+
+def subject_keywords_mask(
+    df: pd.DataFrame,
+    keywords: Iterable[str],
+    text_col: str = "text",
+    word_boundary: bool = False,
+    index=None,
+) -> pd.Series:
+    """
+    Boolean mask (aligned with df) of rows containing any keyword.
+
+    Combine masks with & / | and select once with df.loc[mask] (or pass
+    mask.to_numpy().nonzero()[0] around as row positions) instead of copying
+    intermediate frames.
+    """
+    if index is not None:
+        return index_mask(df, keywords, index, text_col=text_col)
+    matcher = KeywordMatcher(keywords, word_boundary=word_boundary)
+    return matcher.mask(normalized_text(df, text_col))
+
+
+@instrumented()
 def filter_subject_keywords_list(
     df: pd.DataFrame,
     keywords: Iterable[str],
     text_col: str = "text",
+    word_boundary: bool = False,
+    return_matches: bool = False,
+    index=None,
 ) -> pd.DataFrame:
     """
     Keeps rows where any keyword appears in the text (case-insensitive).
+
+    All keywords are matched in a single pass per row. With word_boundary=True
+    keywords must match whole words. With return_matches=True the output gets a
+    'matched_keywords' column listing which keyword(s) hit each row.
+
+    With index (an inverted_index.DayIndex built from the same rows as df),
+    only the index's candidate rows are scanned; matching is then whole-word.
     """
-    cleaned: List[str] = []
-    for kw in keywords:
-        if kw is None:
-            continue
-        kw = str(kw).strip().lower()
-        if kw:
-            cleaned.append(kw)
-
-    if not cleaned:
-        raise ValueError("keywords must contain at least one non-empty string")
-
-    work = df.copy()
-    work["_text_norm"] = work[text_col].fillna("").astype(str).map(normalize_text)
-
-    mask = False
-    for kw in cleaned:
-        mask |= work["_text_norm"].str.contains(kw, case=False, na=False, regex=False)
-    out = work.loc[mask].drop(columns=["_text_norm"])
+    if index is not None:
+        return filter_with_index(df, keywords, index, text_col=text_col, return_matches=return_matches)
+
+    mask = subject_keywords_mask(df, keywords, text_col=text_col, word_boundary=word_boundary)
+    if not return_matches:
+        return df.loc[mask]
+    matcher = KeywordMatcher(keywords, word_boundary=word_boundary)
+    out = df.loc[mask].copy()
+    out["matched_keywords"] = matcher.matches(normalized_text(df, text_col)[mask])
     return out
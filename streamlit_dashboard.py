@@ -1,11 +1,55 @@
-"""Streamlit dashboard for crafting a subject with topics, country, and language."""
+"""Streamlit dashboard for crafting a subject with topics, country, and language.
+
+Submitting the form runs the bertopic_jsd pipeline. Filter results are
+cached with st.cache_data (persisted to disk) and keyword expansion in
+memory only, so a failed LLM call does not outlive the process. The
+deduplicated corpus (at most CORPUS_ENTRIES, for CORPUS_TTL seconds),
+embeddings and fitted models are cached in-process with st.cache_resource,
+so changing only the topics skips straight to the fit.
+Fits run on a background thread and report progress while the page polls;
+only the MAX_JOBS most recently used finished fits are kept.
+"""
 from __future__ import annotations
 
+import hashlib
 import json
-from typing import List
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
 
+import numpy as np
 import streamlit as st
 
+import bertopic_jsd as pipeline
+from embedding_cache import EmbeddingStore
+from geocode import country_options
+
+CACHE_DIR = Path(".dashboard_cache")
+POLL_SECONDS = 1.0
+MAX_JOBS = 8
+CORPUS_ENTRIES = 4
+CORPUS_TTL = 6 * 60 * 60
+
+LANGUAGE_CODES = {
+    "English": "en",
+    "Spanish": "es",
+    "Portuguese": "pt",
+    "French": "fr",
+    "German": "de",
+    "Italian": "it",
+    "Russian": "ru",
+    "Turkish": "tr",
+    "Japanese": "ja",
+    "Bahasa Indonesia": "id",
+    "Malay": "ms",
+}
+
 
 def format_topics(raw: str) -> List[str]:
     """Turn a free-form textarea into a clean list of topics."""
@@ -25,6 +69,151 @@ def render_badges(items: List[str], label: str):
             )
 
 
+@dataclass
+class Job:
+    """One background embedding + topic fit, keyed by (corpus, topics)."""
+
+    key: tuple
+    stage: str = "queued"
+    progress: float = 0.0
+    started: float = field(default_factory=time.time)
+    future: Optional[Future] = None
+
+    def report(self, stage: str, fraction: float):
+        self.stage = stage
+        self.progress = min(max(fraction, 0.0), 1.0)
+
+    @property
+    def failed(self) -> bool:
+        return self.future is not None and self.future.done() and self.future.exception() is not None
+
+
+class JobRegistry:
+    """Process-wide fit jobs and corpus embeddings, shared by every session."""
+
+    def __init__(self, max_workers: int = 1, max_jobs: int = MAX_JOBS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="topic-fit")
+        self.max_jobs = max_jobs
+        self.jobs: OrderedDict[tuple, Job] = OrderedDict()
+        self.embeddings: dict[tuple, np.ndarray] = {}
+        self.store = EmbeddingStore("all-MiniLM-L6-v2", normalize=True)
+        self._lock = threading.Lock()
+
+    def submit(self, corpus_key: tuple, corpus: pipeline.Corpus, topics: List[str]) -> Job:
+        """Start a fit unless one for the same corpus and topics exists (failed jobs are retried)."""
+        key = (corpus_key, tuple(topics))
+        with self._lock:
+            job = self.jobs.get(key)
+            if job is None or job.failed:
+                job = Job(key)
+                job.future = self.executor.submit(self._run, job, corpus_key, corpus, topics)
+                self.jobs[key] = job
+            self.jobs.move_to_end(key)
+            self._evict()
+        return job
+
+    def _evict(self):
+        """Drop the least recently used finished jobs beyond max_jobs, and embeddings no job uses."""
+        excess = len(self.jobs) - self.max_jobs
+        for key in [k for k, job in self.jobs.items() if job.future.done()][:max(excess, 0)]:
+            del self.jobs[key]
+        corpus_keys = {corpus_key for corpus_key, _ in self.jobs}
+        for corpus_key in [k for k in self.embeddings if k not in corpus_keys]:
+            del self.embeddings[corpus_key]
+
+    def _run(self, job: Job, corpus_key: tuple, corpus: pipeline.Corpus, topics: List[str]) -> dict:
+        embeddings = self.embeddings.get(corpus_key)
+        if embeddings is None:
+            embeddings = pipeline.embed_corpus(corpus, store=self.store, progress=job.report)
+            with self._lock:
+                self.embeddings[corpus_key] = embeddings
+        doc_topics, topic_info, model = pipeline.fit_topics(corpus, embeddings, topics, progress=job.report)
+        job.report("divergence", 0.0)
+        divergence = pipeline.source_divergence(doc_topics)
+        job.report("done", 1.0)
+        return {"doc_topics": doc_topics, "topic_info": topic_info, "model": model, "divergence": divergence}
+
+
+@st.cache_resource
+def job_registry() -> JobRegistry:
+    return JobRegistry()
+
+
+@st.cache_data(show_spinner="Expanding subject keywords...")
+def cached_keywords(subject: str) -> List[str]:
+    return pipeline.expand_subject_keywords(subject)
+
+
+@st.cache_data(show_spinner="Filtering tweets and news...", persist="disk")
+def cached_texts(keywords: tuple, pattern: str, country: Optional[str], language: Optional[str]):
+    key = (keywords, pattern, country, language)
+    digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).hexdigest()
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # Each call filters into its own file, so concurrent sessions never read
+    # a half-written one; the finished file replaces filtered_<digest>.csv.
+    fd, part_path = tempfile.mkstemp(prefix=f"filtered_{digest}.", suffix=".part", dir=CACHE_DIR)
+    os.close(fd)
+    try:
+        texts = pipeline.filter_corpus(
+            list(keywords),
+            pattern=pattern,
+            filtered_csv=part_path,
+            country=country,
+            language=language,
+        )
+        os.replace(part_path, CACHE_DIR / f"filtered_{digest}.csv")
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return texts
+
+
+@st.cache_resource(show_spinner="Collapsing duplicates...", max_entries=CORPUS_ENTRIES, ttl=CORPUS_TTL)
+def cached_corpus(keywords: tuple, pattern: str, country: Optional[str], language: Optional[str]) -> pipeline.Corpus:
+    twitter_texts, news_texts = cached_texts(keywords, pattern, country, language)
+    return pipeline.prepare_corpus(twitter_texts, news_texts)
+
+
+def render_job(job: Job):
+    """Progress while the fit runs (polling with reruns), results once done."""
+    if not job.future.done():
+        elapsed = time.time() - job.started
+        st.progress(job.progress, text=f"{job.stage.capitalize()}... ({elapsed:.0f}s)")
+        time.sleep(POLL_SECONDS)
+        st.rerun()
+
+    if job.failed:
+        st.error(f"Topic fit failed: {job.future.exception()}")
+        return
+
+    result = job.future.result()
+    divergence = result["divergence"]
+    if np.isnan(divergence["jsd"]):
+        st.warning("One of the sources has zero non-outlier topics; divergence is undefined.")
+    else:
+        st.metric(
+            "Jensen-Shannon divergence (twitter vs nyt)",
+            f"{divergence['jsd']:.4f}",
+            help=f"95% bootstrap CI {divergence['low']:.4f}-{divergence['high']:.4f}",
+        )
+
+    st.markdown("**Topics**")
+    st.dataframe(result["topic_info"], use_container_width=True)
+
+    doc_topics = result["doc_topics"]
+    st.markdown("**Documents per topic and source**")
+    st.dataframe(
+        doc_topics.groupby(["topic", "source"]).size().unstack(fill_value=0),
+        use_container_width=True,
+    )
+    st.download_button(
+        "Download document topics (CSV)",
+        doc_topics.to_csv(index=False).encode("utf-8"),
+        file_name="doc_topics.csv",
+        mime="text/csv",
+    )
+
+
 # def inject_style():
 #     st.markdown(
 #         """
@@ -94,26 +283,12 @@ def app():
     st.title("Subject & Topic Builder")
     st.caption("Type your subject, list as many topics as you like, and pick country/language.")
 
-    countries = [
-        "United States",
-        "United Kingdom",
-        "Brasil",
-        "Indonesia",
-        "Japan",
-        "Malaysia",
-        "The Netherlands",
-        "Mexico",
-        "Spain",
-        "Russia",
-        "Turkey",
-        "Canada",
-        "Italy",
-        "France",
-        "Germany",
-        "Other / Custom",
-    ]
+    # Natural Earth names; the filter compares ISO codes, so any spelling of the
+    # country in the data ("Brasil", "United States") matches.
+    countries = ["Any"] + [name for name, _code in country_options()] + ["Other / Custom"]
 
     languages = [
+        "Any",
         "English",
         "Spanish",
         "Portuguese",
@@ -142,8 +317,13 @@ def app():
         with col2:
             language = st.selectbox("Language", languages, index=0)
             custom_language = st.text_input("Custom language (optional)")
+        pattern = st.text_input(
+            "Tweet shards",
+            value=pipeline.TWITTER_PATTERN,
+            help=f"Glob within {pipeline.TWITTER_DIR}; *.csv filters the whole month",
+        )
 
-        submitted = st.form_submit_button("Generate selection")
+        submitted = st.form_submit_button("Run pipeline")
 
     topics = format_topics(topics_raw)
     chosen_country = custom_country.strip() or country
@@ -153,6 +333,21 @@ def app():
         if not subject.strip():
             st.warning("Please provide a subject.")
             return
+        st.session_state["selection"] = {
+            "subject": subject.strip(),
+            "topics": topics,
+            "country": chosen_country,
+            "language": chosen_language,
+            "pattern": pattern.strip() or pipeline.TWITTER_PATTERN,
+        }
+
+    # Kept across the polling reruns while a fit is running.
+    selection = st.session_state.get("selection")
+    if selection:
+        subject = selection["subject"]
+        topics = selection["topics"]
+        chosen_country = selection["country"]
+        chosen_language = selection["language"]
 
         st.subheader("Your selection")
         st.write(f"**Subject:** {subject.strip()}")
@@ -175,8 +370,29 @@ def app():
             ),
             language="json",
         )
+
+        country_filter = None if chosen_country in ("Any", "Other / Custom") else chosen_country
+        language_filter = (
+            None if chosen_language in ("Any", "Other / Custom")
+            else LANGUAGE_CODES.get(chosen_language, chosen_language)
+        )
+        keywords = tuple(cached_keywords(subject))
+        st.write(f"**Subject keywords:** {', '.join(keywords)}")
+        corpus_key = (keywords, selection["pattern"], country_filter, language_filter)
+        try:
+            corpus = cached_corpus(*corpus_key)
+        except (FileNotFoundError, KeyError, ValueError) as exc:
+            st.error(str(exc))
+            return
+        st.write(
+            f"**Documents:** {len(corpus.twitter_texts):,} tweets, {len(corpus.news_texts):,} news "
+            f"({len(corpus.rep_texts):,} after collapsing duplicates)"
+        )
+
+        st.markdown("---")
+        render_job(job_registry().submit(corpus_key, corpus, topics))
     else:
-        st.info("Fill the form and hit Generate to see a structured summary.")
+        st.info("Fill the form and hit Run to filter, fit topics and compare sources.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,297 @@
+"""Hyperparameter sweep over UMAP / HDBSCAN / c-TF-IDF settings.
+
+A BERTopic fit is UMAP -> HDBSCAN -> c-TF-IDF, and UMAP dominates its cost.
+The sweep fits UMAP once per distinct UMAP setting, caches the reduction on
+disk keyed by (embedding fingerprint, UMAP params), and runs every HDBSCAN
+and vectorizer variant on top of the cached reductions on a process pool.
+A 3 x 4 x 2 grid (n_neighbors x min_cluster_size x selection) therefore
+costs 3 UMAP fits, and re-running it with other HDBSCAN values costs none.
+
+Per configuration the results table records topic count, outlier rate,
+topic coherence (mean NPMI of each topic's top c-TF-IDF words over document
+co-occurrence) and the twitter/nyt JSD, computed like
+bertopic_jsd.source_divergence (outliers dropped, duplicates weighted).
+c-TF-IDF is BERTopic's (topic-level term frequency x log(1 + A / f)),
+computed directly from one document-term matrix instead of refitting a
+vectorizer per configuration. Topics are unguided; seed topics only nudge
+BERTopic's embeddings and are left out so all configurations share them.
+
+    python sweep.py --n-neighbors 10 15 30 --min-cluster-size 10 15 30 50 --selection eom leaf
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+from divergence import jsd
+from instrumentation import stage
+
+DEFAULT_CACHE = Path(".umap_cache")
+UMAP_DEFAULTS = {"n_neighbors": 15, "n_components": 5, "min_dist": 0.0}
+HDBSCAN_DEFAULTS = {"min_cluster_size": 15, "min_samples": None, "cluster_selection_method": "eom"}
+VECTORIZER_DEFAULTS = {"ngram_range": (1, 2), "min_df": 2}
+
+
+def embedding_fingerprint(embeddings: np.ndarray) -> str:
+    """Content hash of an embedding matrix (shape, dtype and values)."""
+    embeddings = np.ascontiguousarray(embeddings)
+    digest = hashlib.blake2b(digest_size=10)
+    digest.update(repr((embeddings.shape, embeddings.dtype.str)).encode("utf-8"))
+    digest.update(embeddings.data)
+    return digest.hexdigest()
+
+
+def _params_key(params: dict) -> str:
+    return hashlib.blake2b(json.dumps(params, sort_keys=True).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def reduce_cached(
+    embeddings: np.ndarray,
+    params: dict,
+    cache_dir: Path = DEFAULT_CACHE,
+    fingerprint: str | None = None,
+) -> Path:
+    """
+    Path of the UMAP reduction of embeddings with params, fitting it only when not cached.
+
+    Uses the same metric and seed as bertopic_jsd.build_model.
+    """
+    fingerprint = fingerprint or embedding_fingerprint(embeddings)
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_dir / f"{fingerprint}-{_params_key(params)}.npy"
+    if path.exists():
+        return path
+
+    from umap import UMAP
+
+    with stage("umap", rows_in=len(embeddings)) as record:
+        reduced = UMAP(**params, metric="cosine", random_state=42).fit_transform(embeddings)
+        record.update(rows_out=len(reduced), **params)
+    tmp = path.with_suffix(".tmp.npy")
+    np.save(tmp, reduced.astype(np.float32))
+    os.replace(tmp, path)
+    with path.with_suffix(".json").open("w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, **params}, f)
+    return path
+
+
+def class_tfidf(topic_term: sparse.csr_matrix) -> sparse.csr_matrix:
+    """BERTopic's c-TF-IDF: l1-normalized topic term counts x log(1 + A / f)."""
+    topic_term = sparse.csr_matrix(topic_term, dtype=np.float64)
+    term_freq = np.asarray(topic_term.sum(axis=0)).ravel()
+    avg_words = topic_term.sum() / topic_term.shape[0]
+    idf = np.log(1 + avg_words / np.maximum(term_freq, 1e-12))
+    row_sums = np.asarray(topic_term.sum(axis=1)).ravel()
+    tf = sparse.diags(1 / np.maximum(row_sums, 1e-12)) @ topic_term
+    return sparse.csr_matrix(tf @ sparse.diags(idf))
+
+
+def npmi_coherence(doc_term: sparse.csr_matrix, top_terms: list[np.ndarray]) -> float:
+    """Mean NPMI over word pairs of each topic's top terms (document co-occurrence)."""
+    n_docs = doc_term.shape[0]
+    scores = []
+    for terms in top_terms:
+        if len(terms) < 2:
+            continue
+        present = (doc_term[:, terms] > 0).astype(np.float64)
+        df = np.asarray(present.sum(axis=0)).ravel()
+        co = (present.T @ present).toarray()
+        i, j = np.triu_indices(len(terms), k=1)
+        p_ij = co[i, j] / n_docs
+        p_i, p_j = df[i] / n_docs, df[j] / n_docs
+        with np.errstate(divide="ignore", invalid="ignore"):
+            npmi = np.log(p_ij / (p_i * p_j)) / -np.log(p_ij)
+        npmi = np.where(p_ij == 0, -1.0, np.where(p_ij == 1, 1.0, npmi))
+        scores.append(npmi.mean())
+    return float(np.mean(scores)) if scores else float("nan")
+
+
+def grid(umap: dict | None = None, hdbscan: dict | None = None, vectorizer: dict | None = None) -> list[tuple[dict, dict, dict]]:
+    """
+    Every combination of the listed values, as (umap, hdbscan, vectorizer) param dicts.
+
+    Each argument maps a parameter to the values to try; parameters not
+    listed keep their *_DEFAULTS value.
+    """
+    parts = []
+    for defaults, options in ((UMAP_DEFAULTS, umap), (HDBSCAN_DEFAULTS, hdbscan), (VECTORIZER_DEFAULTS, vectorizer)):
+        options = {**{k: [v] for k, v in defaults.items()}, **(options or {})}
+        parts.append([dict(zip(options, values)) for values in itertools.product(*options.values())])
+    return list(itertools.product(*parts))
+
+
+# Per-worker corpus, set once by _init_worker instead of pickled per task.
+_texts: list[str] = []
+_sources: np.ndarray = np.empty(0)
+_weights: np.ndarray = np.empty(0)
+_doc_terms: dict = {}
+
+
+def _init_worker(texts: list[str], sources: np.ndarray, weights: np.ndarray):
+    global _texts, _sources, _weights
+    _texts, _sources, _weights = texts, sources, weights
+    _doc_terms.clear()
+
+
+def _doc_term(ngram_range: tuple) -> tuple[sparse.csr_matrix, np.ndarray]:
+    key = tuple(ngram_range)
+    if key not in _doc_terms:
+        vectorizer = CountVectorizer(stop_words="english", ngram_range=key)
+        matrix = vectorizer.fit_transform(_texts).tocsr()
+        _doc_terms[key] = (matrix, vectorizer.get_feature_names_out())
+    return _doc_terms[key]
+
+
+def evaluate(reduction_path: Path, hdbscan_params: dict, vectorizer_params: dict, top_n: int = 10) -> dict:
+    """Cluster one cached reduction and score the topics (runs in a pool worker)."""
+    from hdbscan import HDBSCAN
+
+    reduced = np.load(reduction_path)
+    start = time.perf_counter()
+    labels = HDBSCAN(metric="euclidean", core_dist_n_jobs=1, **hdbscan_params).fit_predict(reduced)
+    hdbscan_seconds = time.perf_counter() - start
+
+    topic_ids = np.unique(labels)
+    real = topic_ids[topic_ids != -1]
+    result = {
+        "topics": len(real),
+        "outlier_rate": float(np.average(labels == -1, weights=_weights)),
+        "coherence": float("nan"),
+        "jsd": float("nan"),
+        "hdbscan_seconds": hdbscan_seconds,
+    }
+    if not len(real):
+        return result
+
+    # Topic x term counts (outliers are a class of their own, as in BERTopic).
+    doc_term, vocab = _doc_term(vectorizer_params["ngram_range"])
+    membership = sparse.csr_matrix(
+        (np.ones(len(labels)), (np.searchsorted(topic_ids, labels), np.arange(len(labels)))),
+        shape=(len(topic_ids), len(labels)),
+    )
+    topic_term = (membership @ doc_term).tocsc()
+    # min_df applies to the per-topic documents, like BERTopic's vectorizer.
+    kept = np.flatnonzero(np.diff(topic_term.indptr) >= vectorizer_params["min_df"])
+    weights = class_tfidf(topic_term[:, kept]).toarray()
+    top_terms = []
+    for row in np.flatnonzero(topic_ids != -1):
+        best = np.argsort(-weights[row])[:top_n]
+        top_terms.append(kept[best[weights[row, best] > 0]])
+    result["coherence"] = npmi_coherence(doc_term, top_terms)
+    result["top_words"] = " | ".join(" ".join(vocab[terms[:3]]) for terms in top_terms[:5])
+
+    counts = np.zeros((2, len(real)))
+    keep = labels != -1
+    np.add.at(counts, (_sources[keep], np.searchsorted(real, labels[keep])), _weights[keep])
+    if counts.sum(axis=1).all():
+        result["jsd"] = jsd(counts[0], counts[1])
+    return result
+
+
+def run_sweep(
+    texts: list[str],
+    embeddings: np.ndarray,
+    sources: np.ndarray,
+    configs: list[tuple[dict, dict, dict]],
+    weights: np.ndarray | None = None,
+    cache_dir: Path = DEFAULT_CACHE,
+    workers: int | None = None,
+) -> pd.DataFrame:
+    """
+    Evaluate every (umap, hdbscan, vectorizer) config; one results row each.
+
+    texts/embeddings are the deduplicated representatives, sources their
+    source (0 twitter, 1 nyt) and weights their duplicate counts.
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    weights = np.ones(len(texts)) if weights is None else np.asarray(weights, dtype=np.float64)
+    fingerprint = embedding_fingerprint(embeddings)
+
+    reductions, umap_seconds = {}, {}
+    for umap_params, _, _ in configs:
+        key = _params_key(umap_params)
+        if key not in reductions:
+            start = time.perf_counter()
+            reductions[key] = reduce_cached(embeddings, umap_params, cache_dir, fingerprint)
+            umap_seconds[key] = time.perf_counter() - start
+            print(f"UMAP {umap_params}: {umap_seconds[key]:.1f}s")
+
+    with stage("hdbscan_sweep", rows_in=len(configs)) as record:
+        with ProcessPoolExecutor(
+            max_workers=min(len(configs), workers or os.cpu_count() or 1),
+            initializer=_init_worker,
+            initargs=(texts, sources, weights),
+        ) as pool:
+            futures = [
+                pool.submit(evaluate, reductions[_params_key(u)], h, v)
+                for u, h, v in configs
+            ]
+            rows = []
+            for (u, h, v), future in zip(configs, futures):
+                rows.append({
+                    **{f"umap_{k}": val for k, val in u.items()},
+                    **{f"hdbscan_{k}": val for k, val in h.items()},
+                    **{f"vectorizer_{k}": str(val) if k == "ngram_range" else val for k, val in v.items()},
+                    "umap_seconds": umap_seconds[_params_key(u)],
+                    **future.result(),
+                })
+        record.update(rows_out=len(rows), umap_fits=len(reductions))
+    return pd.DataFrame(rows)
+
+
+def main():
+    from bertopic_jsd import SUBJECT, embed_corpus, expand_subject_keywords, filter_corpus, prepare_corpus
+
+    parser = argparse.ArgumentParser(description="Sweep UMAP/HDBSCAN/c-TF-IDF settings over the bertopic_jsd corpus.")
+    parser.add_argument("--subject", default=SUBJECT)
+    parser.add_argument("--n-neighbors", type=int, nargs="+", default=[15])
+    parser.add_argument("--n-components", type=int, nargs="+", default=[5])
+    parser.add_argument("--min-dist", type=float, nargs="+", default=[0.0])
+    parser.add_argument("--min-cluster-size", type=int, nargs="+", default=[10, 15, 30, 50])
+    parser.add_argument("--min-samples", type=int, nargs="+", default=None, help="Default: HDBSCAN's (= min cluster size)")
+    parser.add_argument("--selection", choices=("eom", "leaf"), nargs="+", default=["eom"])
+    parser.add_argument("--max-ngram", type=int, nargs="+", default=[2], help="c-TF-IDF ngram_range upper bounds")
+    parser.add_argument("--min-df", type=int, nargs="+", default=[2], help="Minimum topics a term must appear in")
+    parser.add_argument("--workers", type=int, default=None, help="HDBSCAN processes (default: all cores)")
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE)
+    parser.add_argument("--output", type=Path, default=Path("sweep_results.csv"))
+    args = parser.parse_args()
+
+    corpus = prepare_corpus(*filter_corpus(expand_subject_keywords(args.subject)))
+    embeddings = embed_corpus(corpus)
+    n_twitter = corpus.twitter_dedup.n_groups
+    sources = np.r_[np.zeros(n_twitter, dtype=np.int64), np.ones(corpus.news_dedup.n_groups, dtype=np.int64)]
+    weights = np.r_[corpus.twitter_dedup.weights, corpus.news_dedup.weights]
+
+    configs = grid(
+        umap={"n_neighbors": args.n_neighbors, "n_components": args.n_components, "min_dist": args.min_dist},
+        hdbscan={
+            "min_cluster_size": args.min_cluster_size,
+            "min_samples": args.min_samples or [None],
+            "cluster_selection_method": args.selection,
+        },
+        vectorizer={"ngram_range": [(1, n) for n in args.max_ngram], "min_df": args.min_df},
+    )
+    print(f"{len(configs)} configurations over {len(corpus.rep_texts):,} representatives")
+    results = run_sweep(
+        corpus.rep_texts, embeddings, sources, configs, weights=weights, cache_dir=args.cache_dir, workers=args.workers
+    )
+    results.to_csv(args.output, index=False)
+    print(results.drop(columns=["top_words"], errors="ignore").to_string(index=False))
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from stage1_subject_filtering.cooccurence_keyword_filtering import expand_subject_keywords_frequency
+from stage1_subject_filtering.inverted_index import DayIndex, build_day_index
+from stage1_subject_filtering.sparse_cooccurence import CooccurrenceStats
+
+TEXTS = [
+    "tax tax tax cuts now",
+    "anti-tax budget cuts",
+    "taxes budget budget budget",
+    "tax reform reform reform",
+    "café tax café",
+]
+
+
+def test_index_expansion_matches_scan(tmp_path):
+    csv_path = tmp_path / "2011-12-01.csv"
+    pd.DataFrame({"Text": TEXTS}).to_csv(csv_path, index=False)
+    build_day_index(csv_path, tmp_path / "day=2011-12-01")
+    index = DayIndex(tmp_path / "day=2011-12-01")
+    df = pd.DataFrame({"text": TEXTS})
+
+    scan = expand_subject_keywords_frequency(df, "tax", top_n=5)
+    assert scan == ["budget", "reform", "cuts", "caf", "now"]
+    assert expand_subject_keywords_frequency(df, "tax", top_n=5, index=index) == scan
+    assert expand_subject_keywords_frequency(df, "tax reform", index=index) == \
+        expand_subject_keywords_frequency(df, "tax reform")
+
+
+def test_add_index_phrase_checks_multi_word_subjects(tmp_path):
+    texts = ["tax reform now", "reform the tax code", "tax reform vote", "reform tax cuts"]
+    csv_path = tmp_path / "2011-12-01.csv"
+    pd.DataFrame({"Text": texts}).to_csv(csv_path, index=False)
+    build_day_index(csv_path, tmp_path / "day=2011-12-01")
+    index = DayIndex(tmp_path / "day=2011-12-01")
+
+    stats = CooccurrenceStats(["tax reform"])
+    with pytest.raises(ValueError):
+        stats.add_index(index)
+    stats.add_index(index, texts=texts)
+    scan = CooccurrenceStats(["tax reform"])
+    scan.add_texts(texts)
+    assert stats.subject_docs.tolist() == scan.subject_docs.tolist() == [2]
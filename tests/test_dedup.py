@@ -0,0 +1,9 @@
+from dedup import collapse_duplicates
+
+
+def test_empty_canonical_texts_are_not_one_group():
+    texts = ["http://t.co/abc", "@bob", "", "RT @x: http://t.co/zzz", "real tweet here", "@bob", "real  tweet here"]
+    result = collapse_duplicates(texts)
+    assert result.n_groups == 5
+    assert result.group_ids.tolist() == [0, 1, 2, 3, 4, 1, 4]
+    assert result.weights.tolist() == [1, 2, 1, 1, 2]
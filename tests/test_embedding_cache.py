@@ -0,0 +1,30 @@
+import numpy as np
+
+from embedding_cache import EmbeddingStore, text_keys
+
+
+class LengthEncoder:
+    def encode(self, texts, normalize_embeddings=True, **kwargs):
+        return np.array([[len(t), ord(t[0]), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_append_after_crash_drops_orphaned_vectors(tmp_path):
+    store = EmbeddingStore(root=tmp_path, encoder=LengthEncoder())
+    store.encode(["a", "bb"])
+
+    # A crash between writing vectors and keys: one orphaned vector and half a key.
+    with store.vectors_path.open("ab") as f:
+        np.full((1, 3), 99, dtype=np.float32).tofile(f)
+    with store.keys_path.open("ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    resumed = EmbeddingStore(root=tmp_path, encoder=LengthEncoder())
+    assert len(resumed) == 2
+    out = resumed.encode(["ccc", "a", "dddd"])
+
+    np.testing.assert_array_equal(out, [[3, ord("c"), 1], [1, ord("a"), 1], [4, ord("d"), 1]])
+    assert len(resumed) == 4
+    assert resumed.vectors_path.stat().st_size == 4 * 3 * 4
+    assert resumed.keys_path.stat().st_size == 4 * 8
+    reopened = EmbeddingStore(root=tmp_path, encoder=LengthEncoder())
+    np.testing.assert_array_equal(reopened.lookup(text_keys(["a", "bb", "ccc", "dddd"])), [0, 1, 2, 3])
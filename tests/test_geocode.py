@@ -0,0 +1,9 @@
+from geocode import CountryGeocoder
+
+
+def test_coastal_cities_snap_to_the_nearest_country():
+    geocoder = CountryGeocoder.load()
+    lons = [-74.0, 28.97, -40.0, -122.42]
+    lats = [40.7, 41.01, 30.0, 37.77]
+    assert geocoder.locate(lons, lats).tolist() == ["US", "TR", "", "US"]
+    assert geocoder.locate(lons, lats, snap_deg=0).tolist() == ["", "", "", "US"]
@@ -0,0 +1,28 @@
+import pandas as pd
+import pytest
+
+from stage1_subject_filtering.preprocess import normalized_text
+
+
+def _set_loc(df, value):
+    df.loc[0, "text"] = value
+
+
+def _set_at(df, value):
+    df.at[0, "text"] = value
+
+
+@pytest.mark.parametrize("set_cell", [_set_loc, _set_at])
+@pytest.mark.parametrize("dtype", ["string[pyarrow]", "string[python]", object])
+def test_normalized_text_sees_in_place_edits(dtype, set_cell):
+    df = pd.DataFrame({"text": ["Hello  #World", "Tax"]}).astype({"text": dtype})
+    assert normalized_text(df).tolist() == ["hello world", "tax"]
+    assert normalized_text(df).tolist() == ["hello world", "tax"]
+
+    set_cell(df, "ZZZ")
+    assert normalized_text(df).tolist() == ["zzz", "tax"]
+
+
+def test_normalized_text_reuses_unchanged_arrow_columns():
+    df = pd.DataFrame({"text": ["A", "b"]}).astype({"text": "string[pyarrow]"})
+    assert normalized_text(df) is normalized_text(df)
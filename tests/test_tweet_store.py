@@ -0,0 +1,30 @@
+import pandas as pd
+
+from tweet_store import convert_csv_shard, iter_tweet_batches, load_tweets, parse_tweet_ids
+
+
+def test_parse_tweet_ids_keeps_18_digit_ids_next_to_blanks():
+    ids = parse_tweet_ids(["141592653589793238", "", None, "141592653589793239", "n/a"])
+    assert ids.to_pylist() == [141592653589793238, None, None, 141592653589793239, None]
+
+
+def test_store_roundtrip_keeps_exact_ids(tmp_path):
+    csv_path = tmp_path / "2011-12-01.csv"
+    pd.DataFrame({
+        "Text": ["a", "b", "c"],
+        "Origin": ["x", "x", "x"],
+        "id": ["141592653589793238", "", "141592653589793239"],
+        "country": ["US", "US", "US"],
+    }).to_csv(csv_path, index=False)
+
+    store = tmp_path / "store"
+    assert convert_csv_shard(csv_path, store) == 3
+
+    expected = [141592653589793238, None, 141592653589793239]
+    loaded = load_tweets(store, columns=["id"])
+    assert str(loaded["id"].dtype) == "Int64"
+    assert [None if pd.isna(v) else int(v) for v in loaded["id"]] == expected
+
+    batches = pd.concat(iter_tweet_batches(store, columns=["id"]))
+    assert str(batches["id"].dtype) == "Int64"
+    assert [None if pd.isna(v) else int(v) for v in batches["id"]] == expected
@@ -0,0 +1,183 @@
+"""Day-partitioned Parquet store for the tweet CSV shards.
+
+Converts `2011-12-csv/*.csv` (or the langdetect variant) into
+`<store>/day=YYYY-MM-DD/part-0.parquet` with a typed, compact schema:
+`id` as int64 and `country`/`Origin`/`language` dictionary-encoded.
+Readers push day/country/language predicates and column projection down to
+the files, so they only touch the partitions and columns they need.
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DICT_COLUMNS = ["Origin", "country", "language"]
+
+TWEET_SCHEMA = pa.schema(
+    [
+        ("Text", pa.string()),
+        ("Origin", pa.dictionary(pa.int32(), pa.string())),
+        ("id", pa.int64()),
+        ("country", pa.dictionary(pa.int32(), pa.string())),
+        ("language", pa.dictionary(pa.int32(), pa.string())),
+    ]
+)
+
+PARTITIONING = ds.partitioning(pa.schema([("day", pa.string())]), flavor="hive")
+# Read int64 columns back as nullable Int64 rather than float64 when they hold nulls.
+INT64_TYPES = {pa.int64(): pd.Int64Dtype()}.get
+
+
+def parse_tweet_ids(values) -> pa.Array:
+    """
+    int64 tweet ids parsed straight from their strings; blank or non-numeric ids are null.
+
+    Never goes through float64, which cannot hold 18-digit ids exactly.
+    """
+    strings = pa.array(pd.Series(values).astype("string[pyarrow]").str.strip().array)
+    valid = pc.match_substring_regex(strings, r"^-?[0-9]{1,19}$")
+    return pc.cast(pc.if_else(valid, strings, pa.scalar(None, pa.string())), pa.int64())
+
+
+def _to_table(chunk: pd.DataFrame) -> pa.Table:
+    chunk = chunk.copy()
+    if "language" not in chunk.columns:
+        chunk["language"] = None
+    ids = parse_tweet_ids(chunk["id"])
+    chunk["id"] = None
+    for col in ["Text"] + DICT_COLUMNS:
+        chunk[col] = chunk[col].astype("object").where(chunk[col].notna(), None)
+    chunk["country"] = chunk["country"].map(lambda c: c.strip() if isinstance(c, str) else c)
+    table = pa.Table.from_pandas(
+        chunk[TWEET_SCHEMA.names], schema=TWEET_SCHEMA, preserve_index=False
+    )
+    return table.set_column(TWEET_SCHEMA.get_field_index("id"), TWEET_SCHEMA.field("id"), ids)
+
+
+def convert_csv_shard(csv_path: Path, store_dir: Path, chunksize: int = 200_000) -> int:
+    """Write one CSV shard to <store_dir>/day=<stem>/part-0.parquet; returns rows."""
+    out_dir = Path(store_dir) / f"day={Path(csv_path).stem}"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_dir / "part-0.parquet.tmp"
+
+    rows = 0
+    with pq.ParquetWriter(tmp_path, TWEET_SCHEMA, compression="zstd") as writer:
+        # id is read as text so 18-digit tweet IDs never pass through float64.
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype={"id": str}):
+            writer.write_table(_to_table(chunk))
+            rows += len(chunk)
+    tmp_path.replace(out_dir / "part-0.parquet")
+    return rows
+
+
+def convert_csv_directory(
+    input_dir: Path,
+    store_dir: Path,
+    pattern: str = "*.csv",
+    chunksize: int = 200_000,
+    overwrite: bool = False,
+) -> pd.DataFrame:
+    """Convert every CSV shard in input_dir; existing day partitions are skipped."""
+    files = sorted(Path(input_dir).glob(pattern))
+    if not files:
+        raise FileNotFoundError(f"No CSV files found in {input_dir}")
+
+    converted = []
+    for csv_path in files:
+        target = Path(store_dir) / f"day={csv_path.stem}" / "part-0.parquet"
+        if target.exists() and not overwrite:
+            continue
+        rows = convert_csv_shard(csv_path, store_dir, chunksize=chunksize)
+        converted.append((csv_path.stem, rows))
+        print(f"{csv_path.stem}: {rows:,} rows")
+    return pd.DataFrame(converted, columns=["day", "rows"])
+
+
+def open_store(store_dir: Path) -> ds.Dataset:
+    return ds.dataset(
+        str(store_dir),
+        format="parquet",
+        partitioning=PARTITIONING,
+    )
+
+
+def build_filter(
+    days: Iterable[str] | None = None,
+    countries: Iterable[str] | None = None,
+    languages: Iterable[str] | None = None,
+) -> ds.Expression | None:
+    """Combine optional day/country/language predicates into one expression."""
+    expr = None
+    for col, values in (("day", days), ("country", countries), ("language", languages)):
+        if values is None:
+            continue
+        values = [values] if isinstance(values, str) else list(values)
+        cond = ds.field(col).isin(values)
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def load_tweets(
+    store_dir: Path,
+    columns: list[str] | None = None,
+    days: Iterable[str] | None = None,
+    countries: Iterable[str] | None = None,
+    languages: Iterable[str] | None = None,
+) -> pd.DataFrame:
+    """Load only the requested columns and partitions as a DataFrame."""
+    table = open_store(store_dir).to_table(
+        columns=columns,
+        filter=build_filter(days, countries, languages),
+    )
+    return table.to_pandas(types_mapper=INT64_TYPES)
+
+
+def iter_tweet_batches(
+    store_dir: Path,
+    columns: list[str] | None = None,
+    days: Iterable[str] | None = None,
+    countries: Iterable[str] | None = None,
+    languages: Iterable[str] | None = None,
+    batch_size: int = 200_000,
+) -> Iterator[pd.DataFrame]:
+    """Stream the store as DataFrames of at most batch_size rows."""
+    dataset = open_store(store_dir)
+    scanner = dataset.scanner(
+        columns=columns,
+        filter=build_filter(days, countries, languages),
+        batch_size=batch_size,
+    )
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield batch.to_pandas(types_mapper=INT64_TYPES)
+
+
+def list_days(store_dir: Path) -> list[str]:
+    return sorted(p.name.split("=", 1)[1] for p in Path(store_dir).glob("day=*") if p.is_dir())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert tweet CSV shards to a day-partitioned Parquet store.")
+    parser.add_argument("--data-dir", type=Path, default=Path("2011-12-csv"))
+    parser.add_argument("--store-dir", type=Path, default=Path("2011-12-parquet"))
+    parser.add_argument("--pattern", default="*.csv")
+    parser.add_argument("--chunksize", type=int, default=200_000)
+    parser.add_argument("--overwrite", action="store_true", help="Rewrite existing day partitions")
+    args = parser.parse_args()
+
+    converted = convert_csv_directory(
+        args.data_dir, args.store_dir, pattern=args.pattern,
+        chunksize=args.chunksize, overwrite=args.overwrite,
+    )
+    print(f"Converted {len(converted)} shards ({converted['rows'].sum():,} rows) -> {args.store_dir}")
+
+
+if __name__ == "__main__":
+    main()